@@ -20,6 +20,14 @@ async function buildHeaders(request: Request) {
   return headers;
 }
 
+// fetch() has already decoded the body, so the upstream encoding/length no longer apply
+function responseHeaders(resp: Response) {
+  const headers = new Headers(resp.headers as any);
+  headers.delete('content-encoding');
+  headers.delete('content-length');
+  return headers;
+}
+
 export async function POST(request: Request) {
   const target = buildTarget(request);
   const headers = await buildHeaders(request);
@@ -29,8 +37,8 @@ export async function POST(request: Request) {
     body: await request.text(),
   });
   try {
-    const body = await resp.text();
-    return new NextResponse(body, { status: resp.status, headers: resp.headers as any });
+    const body = resp.status === 304 ? null : await resp.text();
+    return new NextResponse(body, { status: resp.status, headers: responseHeaders(resp) });
   } catch (err: any) {
     return new NextResponse(JSON.stringify({ error: 'Microservice unreachable', detail: String(err) }), { status: 502, headers: { 'content-type': 'application/json' } });
   }
@@ -41,8 +49,8 @@ export async function GET(request: Request) {
   const headers = await buildHeaders(request);
   const resp = await fetch(target, { method: 'GET', headers });
   try {
-    const body = await resp.text();
-    return new NextResponse(body, { status: resp.status, headers: resp.headers as any });
+    const body = resp.status === 304 ? null : await resp.text();
+    return new NextResponse(body, { status: resp.status, headers: responseHeaders(resp) });
   } catch (err: any) {
     return new NextResponse(JSON.stringify({ error: 'Microservice unreachable', detail: String(err) }), { status: 502, headers: { 'content-type': 'application/json' } });
   }
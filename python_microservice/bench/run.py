@@ -0,0 +1,356 @@
+"""Offline benchmark: the service against local provider stubs and a synthetic catalog.
+
+Generates a catalog of --villages villages, starts the provider stubs (bench/stubs.py) and the
+service (uvicorn, in a child process pointed at both), then runs each scenario as a closed loop
+of --concurrency clients for --duration seconds:
+
+    search          POST /search; --hit-ratio of queries match a graph node, the rest are new
+                    places that go through SerpAPI + Gemini
+    villages_search GET /api/villages/search with names, states and attraction terms
+    village_by_id   GET /api/villages/{id}
+    pipeline        collect -> geocode -> dedupe -> batched enrichment -> graph, as a child process
+
+Each scenario reports p50/p90/p99/max latency, throughput, errors and the service's resident
+memory. Results are written as JSON; --baseline compares against an earlier run and exits
+non-zero when a scenario regressed by more than --threshold.
+
+    python bench/run.py --villages 20000 --duration 20 --out bench/results/latest.json
+    python bench/run.py --villages 20000 --baseline bench/results/latest.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import requests  # type: ignore
+
+import stubs
+import synth
+
+SCENARIOS = ('search', 'villages_search', 'village_by_id', 'pipeline')
+# Metrics compared against a baseline, and whether bigger is worse
+COMPARED = {'p50_ms': True, 'p99_ms': True, 'throughput_rps': False, 'peak_rss_mb': True, 'wall_s': True}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_mb(pid):
+    """(VmRSS, VmHWM) of a process in MiB, from /proc (None where unavailable)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return (round(int(fields['VmRSS'].split()[0]) / 1024, 1), round(int(fields['VmHWM'].split()[0]) / 1024, 1))
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def summarize(latencies, errors, elapsed):
+    ms = np.array(latencies) * 1000.0
+    out = {'requests': len(latencies), 'errors': errors,
+           'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0}
+    if len(ms):
+        for p in (50, 90, 99):
+            out[f'p{p}_ms'] = round(float(np.percentile(ms, p)), 2)
+        out['mean_ms'] = round(float(ms.mean()), 2)
+        out['max_ms'] = round(float(ms.max()), 2)
+    return out
+
+
+class Service:
+    """The FastAPI app under uvicorn in a child process, with DATA_ROOT at the synthetic catalog."""
+
+    def __init__(self, root, env, workers=1):
+        self.root = root
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.env = env
+        self.workers = workers
+        self.proc = None
+
+    def start(self, timeout=600):
+        log = open(os.path.join(self.root, 'service.log'), 'w')
+        cmd = [sys.executable, '-m', 'uvicorn', 'main:app', '--app-dir', SERVICE_DIR, '--host', '127.0.0.1',
+               '--port', str(self.port), '--log-level', 'warning', '--workers', str(self.workers)]
+        start = time.perf_counter()
+        # cwd is the catalog so files the service reads relative to it (synthetic_data.json) are the bench's
+        self.proc = subprocess.Popen(cmd, cwd=self.root, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        while time.perf_counter() - start < timeout:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f'service exited with {self.proc.returncode}; see {log.name}')
+            try:
+                if requests.get(self.url + '/health', timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f'service not ready after {timeout}s; see {log.name}')
+
+    def memory(self):
+        return memory_mb(self.proc.pid)
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def closed_loop(make_request, concurrency, duration, warmup):
+    """Run make_request(session, rng) from concurrency threads; returns (latencies, errors, elapsed)."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        mine, failed = [], 0
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= stop_at:
+                break
+            try:
+                ok = make_request(session, rng)
+            except requests.RequestException:
+                ok = False
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                mine.append(t1 - t0)
+                failed += not ok
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0], duration
+
+
+def http_scenarios(service, villages, args):
+    ids = [v['village_id'] for v in villages]
+    terms = sorted({v['village_name'].split()[0] for v in villages[:2000]} |
+                   {v['state'] for v in villages} |
+                   {a for v in villages[:2000] for a in v.get('primary_attractions', [])})
+    counter = iter(range(10 ** 9))
+
+    def search(session, rng):
+        if rng.random() < args.hit_ratio:
+            query = rng.choice(ids).lower()
+        else:
+            # A place the catalog has never seen: SerpAPI + Gemini through the stubs
+            query = f'benchpur {next(counter)} village'
+        # 202: still enriching when the deadline budget ran out, which is an answer too
+        return session.post(service.url + '/search', json={'query': query}, timeout=60).status_code in (200, 202)
+
+    def villages_search(session, rng):
+        resp = session.get(service.url + '/api/villages/search', params={'q': rng.choice(terms), 'limit': 20},
+                           timeout=60)
+        return resp.status_code == 200
+
+    def village_by_id(session, rng):
+        return session.get(f'{service.url}/api/villages/{rng.choice(ids)}', timeout=60).status_code == 200
+
+    return {'search': search, 'villages_search': villages_search, 'village_by_id': village_by_id}
+
+
+def run_pipeline(root, env):
+    """The pipeline stages in a child process against the stubs; returns its summary."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--pipeline-child', root],
+                          env=env, cwd=root, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    with open(os.path.join(root, 'pipeline.log'), 'w') as f:
+        f.write(proc.stdout + proc.stderr)
+    summary = None
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith('{'):
+            summary = json.loads(line)
+            break
+    if proc.returncode != 0 or summary is None:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ['no output']
+        return {'error': tail[0], 'wall_s': round(wall, 2)}
+    summary['wall_s'] = round(wall, 2)
+    return summary
+
+
+def pipeline_child(root):
+    sys.path.insert(0, os.path.join(SERVICE_DIR, 'scripts'))
+    import networkx as nx  # type: ignore
+    import run_pipeline as pipeline
+    from graph_snapshot import write_snapshot
+
+    stages = {}
+    t = time.perf_counter()
+    villages = pipeline.collect_initial_data()
+    stages['collect_s'] = time.perf_counter() - t
+    t = time.perf_counter()
+    villages = pipeline.fill_missing_coordinates(villages)
+    stages['geocode_s'] = time.perf_counter() - t
+    t = time.perf_counter()
+    villages = pipeline.dedupe_records(villages)
+    stages['dedupe_s'] = time.perf_counter() - t
+    t = time.perf_counter()
+    villages = pipeline.run_rag_and_update(villages)
+    stages['enrich_s'] = time.perf_counter() - t
+    t = time.perf_counter()
+    G = pipeline.build_graph(villages)
+    out = os.path.join(root, 'pipeline')
+    os.makedirs(out, exist_ok=True)
+    nx.write_graphml(G, os.path.join(out, 'graph.graphml'))
+    write_snapshot(G, os.path.join(out, 'graph.vkg'))
+    stages['graph_s'] = time.perf_counter() - t
+    summary = {k: round(v, 2) for k, v in stages.items()}
+    summary.update({'villages': len(villages), 'enriched': sum(1 for v in villages if v.get('primary_attractions')),
+                    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)})
+    print(json.dumps(summary))
+
+
+def compare(results, baseline, threshold):
+    """Lines describing every compared metric that got worse by more than threshold (a fraction)."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric, bigger_is_worse in COMPARED.items():
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if bigger_is_worse else -change) > threshold:
+                regressions.append(f'{name}.{metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def print_table(results):
+    cols = ('requests', 'errors', 'throughput_rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'rss_mb', 'peak_rss_mb')
+    print(f"\n{'scenario':<16}" + ''.join(f'{c:>15}' for c in cols))
+    for name, r in results['scenarios'].items():
+        if 'error' in r:
+            print(f'{name:<16}  error: {r["error"]}')
+            continue
+        print(f'{name:<16}' + ''.join(f'{str(r.get(c, "-")):>15}' for c in cols))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the service offline against provider stubs.')
+    parser.add_argument('--villages', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=15.0, help='Measured seconds per HTTP scenario')
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--hit-ratio', type=float, default=0.8, help='Share of /search queries that hit the graph')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Mean stub latency')
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of stub responses that fail')
+    parser.add_argument('--failure-status', type=int, default=500)
+    parser.add_argument('--workdir', help='Catalog and log directory (default: a temporary one, removed after)')
+    parser.add_argument('--out', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Regression tolerance (0.2 = 20%%)')
+    parser.add_argument('--pipeline-child', metavar='ROOT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.pipeline_child:
+        return pipeline_child(args.pipeline_child)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    root = args.workdir or tempfile.mkdtemp(prefix='village-bench-')
+    os.makedirs(root, exist_ok=True)
+    results = {'meta': {'villages': args.villages, 'seed': args.seed, 'concurrency': args.concurrency,
+                        'workers': args.workers, 'duration_s': args.duration, 'hit_ratio': args.hit_ratio,
+                        'stub_latency_ms': args.latency_ms, 'stub_failure_rate': args.failure_rate,
+                        'python': platform.python_version(), 'started': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'scenarios': {}}
+    print(f'[Bench] Generating {args.villages} villages in {root}')
+    results['catalog'] = synth.write_catalog(root, args.villages, args.seed)
+    with open(os.path.join(root, 'data', 'merged_villages.json'), encoding='utf-8') as f:
+        villages = json.load(f)
+
+    running = stubs.start_all(args.latency_ms, args.jitter_ms, args.failure_rate, args.failure_status, args.seed)
+    env = dict(os.environ)
+    env.pop('MICROSERVICE_SHARED_SECRET', None)
+    env.update(stubs.service_env(running))
+    env.update({'DATA_ROOT': root, 'VECTOR_SEARCH': 'off', 'PYTHONPATH': SERVICE_DIR,
+                'CHANGELOG_PATH': os.path.join(root, 'data', 'changes.sqlite3')})
+    service = None
+    try:
+        http = [s for s in scenarios if s != 'pipeline']
+        if http:
+            service = Service(root, env, args.workers)
+            ready = service.start()
+            rss, hwm = service.memory()
+            results['startup'] = {'ready_s': round(ready, 2), 'rss_mb': rss, 'peak_rss_mb': hwm}
+            print(f'[Bench] Service ready in {ready:.1f}s ({rss} MiB)')
+            requests_for = http_scenarios(service, villages, args)
+            for name in http:
+                print(f'[Bench] {name}: {args.concurrency} clients for {args.duration:g}s')
+                latencies, errors, elapsed = closed_loop(requests_for[name], args.concurrency, args.duration,
+                                                         args.warmup)
+                result = summarize(latencies, errors, elapsed)
+                result['rss_mb'], result['peak_rss_mb'] = service.memory()
+                results['scenarios'][name] = result
+        if 'pipeline' in scenarios:
+            print('[Bench] pipeline: collect, geocode, enrich and build against the stubs')
+            results['scenarios']['pipeline'] = run_pipeline(root, env)
+        results['stubs'] = stubs.stats(running)
+    finally:
+        if service is not None:
+            service.stop()
+        for stub in running.values():
+            stub.stop()
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_table(results)
+    if 'pipeline' in results['scenarios']:
+        print(f"\npipeline: {json.dumps(results['scenarios']['pipeline'])}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'[Bench] Results written to {args.out}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for key in ('villages', 'concurrency', 'workers', 'hit_ratio', 'stub_latency_ms'):
+            if baseline.get('meta', {}).get(key) != results['meta'][key]:
+                print(f"[Bench] Warning: baseline {key}={baseline.get('meta', {}).get(key)}, this run {results['meta'][key]}")
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f'[Regression] {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'[Bench] No regressions beyond {args.threshold:.0%} against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Local stand-ins for SerpAPI, Gemini, MapQuest, Nominatim and Mapbox.
+
+Each stub is a small threaded HTTP server that answers the requests the service and the
+pipeline make, in the providers' response shapes, after a configurable delay and with a
+configurable failure rate. Answers are derived from a hash of the query, so the same place
+always geocodes to the same spot and gets the same enrichment.
+
+Run on its own to point a manually started service at the stubs:
+
+    python bench/stubs.py --latency-ms 80 --failure-rate 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Rough state centres, used to place geocoded villages
+STATE_CENTRES = {
+    'Rajasthan': (26.9, 73.8), 'Kerala': (10.3, 76.5), 'Himachal Pradesh': (31.9, 77.2),
+    'Uttarakhand': (30.1, 79.2), 'Gujarat': (22.7, 71.6), 'Maharashtra': (19.4, 75.5),
+    'Karnataka': (14.5, 75.7), 'Tamil Nadu': (11.0, 78.4), 'West Bengal': (23.4, 87.9),
+    'Meghalaya': (25.5, 91.3), 'Assam': (26.2, 92.9), 'Odisha': (20.5, 84.4),
+    'Punjab': (30.9, 75.4), 'Sikkim': (27.5, 88.5), 'Madhya Pradesh': (23.5, 78.3),
+}
+ATTRACTIONS = ['Fort Visits', 'Desert Safari', 'Haveli Tours', 'Backwater Cruise', 'Tea Gardens', 'Waterfall',
+               'Ancient Temple', 'Living Root Bridge', 'Monastery', 'Bird Sanctuary', 'Cave Paintings',
+               'Step Well', 'Sunset Point', 'Spice Plantation', 'Tribal Museum', 'Lake View']
+SPECIALTIES = ['Handicrafts', 'Jewelry Making', 'Pottery', 'Handloom Weaving', 'Organic Honey', 'Spices',
+               'Bamboo Crafts', 'Block Printing', 'Local Cuisine', 'Coir Products', 'Wood Carving']
+ACTIVITIES = ['Trekking', 'Camel Rides', 'Cooking Classes', 'Village Walks', 'Boating', 'Farm Stay',
+              'Folk Dance Evenings', 'Yoga Retreat', 'Cycling', 'Fishing', 'Craft Workshops']
+SYLLABLES = ['ran', 'kho', 'mal', 'dev', 'sun', 'pal', 'gir', 'chan', 'bhim', 'kar', 'sar', 'nag', 'tir',
+             'ama', 'kun', 'lok', 'vel', 'ura', 'hem', 'jai']
+SUFFIXES = ['pur', 'garh', 'wadi', 'gaon', 'kot', 'nagar', 'palli', 'halli', 'ur', 'sar', 'kund', 'ghat']
+
+
+def _rng(text):
+    return random.Random(zlib.crc32(str(text).lower().encode('utf-8')))
+
+
+def place_name(rng):
+    return (rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + rng.choice(SUFFIXES)).capitalize()
+
+
+def locate(text):
+    """(name, state, lat, lng) for a query: a state named in it, or one picked from its hash."""
+    rng = _rng(text)
+    state = next((s for s in STATE_CENTRES if s.lower() in text.lower()), None) or rng.choice(sorted(STATE_CENTRES))
+    lat, lng = STATE_CENTRES[state]
+    name = text.split(',')[0].strip() or place_name(rng)
+    return name, state, round(lat + rng.uniform(-1.5, 1.5), 5), round(lng + rng.uniform(-1.5, 1.5), 5)
+
+
+def enrichment_for(text):
+    rng = _rng(text)
+    return {
+        'primary_attractions': rng.sample(ATTRACTIONS, rng.randint(2, 4)),
+        'local_specialties': rng.sample(SPECIALTIES, rng.randint(1, 3)),
+        'activities': rng.sample(ACTIVITIES, rng.randint(2, 4)),
+    }
+
+
+def _mapquest_location(text):
+    name, state, lat, lng = locate(text)
+    return {'latLng': {'lat': lat, 'lng': lng}, 'adminArea3': state, 'adminArea5': name,
+            'adminArea4': f'{name} district', 'adminArea1': 'IN', 'street': f'{name}, {state}, India'}
+
+
+# Route handlers take (path, params, body) and return (status, JSON-able payload)
+
+def serpapi_search(path, params, body):
+    q = params.get('q', '')
+    rng = _rng(q)
+    results = [{'position': i + 1, 'title': f'{q} - guide {i + 1}',
+                'snippet': f"{q} is known for {', '.join(rng.sample(ATTRACTIONS, 2))} and "
+                           f"{rng.choice(SPECIALTIES).lower()}; visitors enjoy {rng.choice(ACTIVITIES).lower()}."}
+               for i in range(int(params.get('num', 10)))]
+    return 200, {'organic_results': results}
+
+
+def gemini_generate(path, params, body):
+    try:
+        prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return 400, {'error': {'message': 'malformed request'}}
+    places = re.findall(r'^## (\d+)\. (.+)$', prompt, re.M)
+    if places:
+        value = {n: enrichment_for(name) for n, name in places}
+    else:
+        match = re.search(r'about "(.+?)"', prompt)
+        value = enrichment_for(match.group(1) if match else prompt[:200])
+    text = '```json\n' + json.dumps(value) + '\n```'
+    return 200, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+
+
+def mapquest_address(path, params, body):
+    return 200, {'results': [{'locations': [_mapquest_location(params.get('location', ''))]}]}
+
+
+def mapquest_batch(path, params, body):
+    try:
+        places = json.loads(body).get('locations', [])
+    except ValueError:
+        return 400, {'info': {'messages': ['malformed request']}}
+    return 200, {'results': [{'locations': [_mapquest_location(p if isinstance(p, str) else json.dumps(p))]}
+                             for p in places]}
+
+
+def mapquest_place(path, params, body):
+    q = params.get('q', '')
+    rng = _rng(q)
+    out = []
+    for i in range(int(params.get('limit', 10))):
+        name = place_name(rng)
+        _, state, lat, lng = locate(f'{name}, {q}')
+        item = {'name': name, 'displayString': f'{name}, {state}, India'}
+        # Some results come back without coordinates, as the real search API's do
+        if i % 4:
+            item['place'] = {'geometry': {'coordinates': [lng, lat]}}
+        out.append(item)
+    return 200, {'results': out}
+
+
+def nominatim_search(path, params, body):
+    name, state, lat, lng = locate(params.get('q', ''))
+    return 200, [{'lat': str(lat), 'lon': str(lng), 'display_name': f'{name}, {state}, India',
+                  'address': {'village': name, 'state': state, 'country': 'India'}}]
+
+
+def nominatim_reverse(path, params, body):
+    lat, lng = float(params.get('lat', 0)), float(params.get('lon', 0))
+    state = min(STATE_CENTRES, key=lambda s: (STATE_CENTRES[s][0] - lat) ** 2 + (STATE_CENTRES[s][1] - lng) ** 2)
+    return 200, {'address': {'state': state, 'country': 'India'}}
+
+
+def mapbox_places(path, params, body):
+    q = unquote(path.rsplit('/', 1)[-1]).rsplit('.json', 1)[0]
+    rng = _rng(q)
+    features = []
+    for _ in range(int(params.get('limit', 10))):
+        name = place_name(rng)
+        _, state, lat, lng = locate(f'{name}, {q}')
+        features.append({'text': name, 'place_name': f'{name}, {state}, India', 'center': [lng, lat]})
+    return 200, {'features': features}
+
+
+ROUTES = {
+    'serpapi': [('GET', '/search.json', serpapi_search)],
+    'gemini': [('POST', '/', gemini_generate)],
+    'mapquest': [('GET', '/geocoding/v1/address', mapquest_address),
+                 ('POST', '/geocoding/v1/batch', mapquest_batch),
+                 ('GET', '/search/v4/place', mapquest_place)],
+    'nominatim': [('GET', '/search', nominatim_search), ('GET', '/reverse', nominatim_reverse)],
+    'mapbox': [('GET', '/geocoding/v5/mapbox.places/', mapbox_places)],
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, payload = self.server.stub.handle(method, url.path, params, body)
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ProviderStub:
+    """One provider stand-in: delays each answer by ~latency_ms and fails failure_rate of them."""
+
+    def __init__(self, name, latency_ms=50.0, jitter_ms=20.0, failure_rate=0.0, failure_status=500, seed=0):
+        self.name = name
+        self.routes = ROUTES[name]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'failures': 0}
+        self._server = None
+        self.url = None
+
+    def handle(self, method, path, params, body):
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.stats['failures'] += 1
+        time.sleep(delay)
+        if fail:
+            return self.failure_status, {'error': f'{self.name} stub: injected failure'}
+        for route_method, prefix, fn in self.routes:
+            if method == route_method and path.startswith(prefix):
+                return fn(path, params, body)
+        return 404, {'error': f'{self.name} stub: no route for {method} {path}'}
+
+    def start(self, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        threading.Thread(target=self._server.serve_forever, name=f'stub-{self.name}', daemon=True).start()
+        self.url = f'http://{host}:{self._server.server_address[1]}'
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def start_all(latency_ms=50.0, jitter_ms=20.0, failure_rate=0.0, failure_status=500, seed=0):
+    """Start one stub per provider; returns {name: ProviderStub}."""
+    return {name: ProviderStub(name, latency_ms, jitter_ms, failure_rate, failure_status, seed + i).start()
+            for i, name in enumerate(ROUTES)}
+
+
+def service_env(stubs, rps=1000):
+    """Environment that points the service and the pipeline at the stubs, with rate limits lifted."""
+    env = {
+        'SERPAPI_URL': stubs['serpapi'].url + '/search.json',
+        'GEMINI_URL': stubs['gemini'].url + '/v1beta/models/stub:generateContent',
+        'MAPQUEST_BASE_URL': stubs['mapquest'].url,
+        'NOMINATIM_BASE_URL': stubs['nominatim'].url,
+        'MAPBOX_BASE_URL': stubs['mapbox'].url,
+        'SERPAPI_KEY': 'bench', 'GEMINI_API_KEY': 'bench', 'MAPQUEST_API_KEY': 'bench', 'MAPBOX_TOKEN': 'bench',
+    }
+    for name in stubs:
+        env[f'{name.upper()}_RPS'] = str(rps)
+    return env
+
+
+def stats(stubs):
+    return {name: dict(stub.stats) for name, stub in stubs.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run local provider stand-ins until interrupted.')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-status', type=int, default=500)
+    args = parser.parse_args()
+    running = start_all(args.latency_ms, args.jitter_ms, args.failure_rate, args.failure_status)
+    for key, value in service_env(running).items():
+        print(f'export {key}={value}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for stub in running.values():
+            stub.stop()
@@ -0,0 +1,129 @@
+"""Synthetic village catalogs in the schema of the checked-in knowledge graph.
+
+Every attribute of a generated village is sampled from the values that attribute takes in
+``village_knowledge_graph.graphml`` (numbers are jittered, attraction/specialty lists are
+re-drawn from all items seen), so the indexes see realistic value distributions at any size.
+Villages link to ``attraction::`` / ``specialty::`` feature nodes exactly as the pipeline's do.
+
+    python bench/synth.py --villages 100000 --out /tmp/catalog
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import networkx as nx  # type: ignore
+
+from graph_snapshot import write_snapshot
+from search_index import is_village_node
+
+SOURCE_GRAPH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'village_knowledge_graph.graphml')
+LIST_ATTRS = {'primary_attractions': 'attraction', 'local_specialties': 'specialty'}
+# Attributes that identify one village and are generated rather than sampled
+IDENTITY_ATTRS = ('village_id', 'village_name', 'email', 'latitude', 'longitude')
+SYLLABLES = ['ran', 'kho', 'mal', 'dev', 'sun', 'pal', 'gir', 'chan', 'bhim', 'kar', 'sar', 'nag', 'tir',
+             'ama', 'kun', 'lok', 'vel', 'ura', 'hem', 'jai', 'bor', 'dha', 'mun', 'tal']
+SUFFIXES = ['pur', 'garh', 'wadi', 'gaon', 'kot', 'nagar', 'palli', 'halli', 'ur', 'sar', 'kund', 'ghat']
+
+
+def _split(value):
+    return [x.strip() for x in str(value).split(',') if x.strip()]
+
+
+class Schema:
+    """Value pools per attribute, taken from an existing graph's village nodes."""
+
+    def __init__(self, G):
+        villages = [data for node, data in G.nodes(data=True) if is_village_node(node)]
+        self.templates = villages
+        self.pools = {}
+        self.items = {attr: sorted({x for v in villages for x in _split(v.get(attr, ''))}) for attr in LIST_ATTRS}
+        for data in villages:
+            for attr, value in data.items():
+                if attr not in IDENTITY_ATTRS and attr not in LIST_ATTRS:
+                    self.pools.setdefault(attr, []).append(value)
+
+    def village(self, rng, i):
+        # Location fields come from one template so state/district/city stay consistent
+        template = rng.choice(self.templates)
+        record = {}
+        for attr, pool in self.pools.items():
+            value = rng.choice(pool)
+            if isinstance(value, bool):
+                pass
+            elif isinstance(value, int):
+                value = max(0, int(round(value * rng.uniform(0.8, 1.2))))
+            elif isinstance(value, float):
+                value = round(min(5.0, max(0.0, value + rng.uniform(-0.3, 0.3))), 1) if value <= 5 else value
+            record[attr] = value
+        for attr in ('state', 'district', 'city', 'address', 'country'):
+            if attr in template:
+                record[attr] = template[attr]
+        name = (rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + rng.choice(SUFFIXES)).capitalize() + ' Village'
+        record.update({
+            'village_id': f'VIL_{i:06d}',
+            'village_name': name,
+            'email': f"{name.lower().replace(' ', '_')}_{i}@villagestay.com",
+            'latitude': round(float(template.get('latitude', 22.0)) + rng.uniform(-0.8, 0.8), 5),
+            'longitude': round(float(template.get('longitude', 78.0)) + rng.uniform(-0.8, 0.8), 5),
+        })
+        for attr in LIST_ATTRS:
+            items = self.items[attr]
+            record[attr] = rng.sample(items, min(len(items), rng.randint(1, 4)))
+        return record
+
+
+def generate(n, seed=0, source=SOURCE_GRAPH):
+    """(villages, G): n village records (lists as lists) and the matching knowledge graph."""
+    schema = Schema(nx.read_graphml(source))
+    rng = random.Random(seed)
+    villages = [schema.village(rng, i) for i in range(1, n + 1)]
+    G = nx.Graph()
+    for v in villages:
+        node = v['village_id']
+        attrs = {k: (', '.join(x) if isinstance(x, list) else x) for k, x in v.items()}
+        G.add_node(node, **attrs)
+        for attr, kind in LIST_ATTRS.items():
+            for item in v[attr]:
+                feature = f'{kind}::{item}'
+                if feature not in G:
+                    G.add_node(feature)
+                G.add_edge(node, feature, type=kind)
+    return villages, G
+
+
+def write_catalog(root, n, seed=0, graphml=False):
+    """Write merged_villages.json and the graph snapshot under root (a DATA_ROOT); returns stats."""
+    start = time.perf_counter()
+    villages, G = generate(n, seed)
+    generated = time.perf_counter()
+    os.makedirs(os.path.join(root, 'data'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'models'), exist_ok=True)
+    with open(os.path.join(root, 'data', 'merged_villages.json'), 'w', encoding='utf-8') as f:
+        json.dump(villages, f, ensure_ascii=False)
+    for name in ('internships', 'kirana_stores', 'bookings', 'applications'):
+        path = os.path.join(root, 'data', f'{name}.json')
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('[]')
+    graph_path = os.path.join(root, 'models', 'final_village_knowledge_graph.graphml')
+    if graphml:
+        nx.write_graphml(G, graph_path)
+    # Written after the GraphML so the service loads the snapshot
+    write_snapshot(G, os.path.splitext(graph_path)[0] + '.vkg')
+    return {'villages': n, 'nodes': G.number_of_nodes(), 'edges': G.number_of_edges(),
+            'generate_s': round(generated - start, 3), 'write_s': round(time.perf_counter() - generated, 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic village catalog for benchmarking.')
+    parser.add_argument('--villages', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help='Directory to use as DATA_ROOT')
+    parser.add_argument('--graphml', action='store_true', help='Also write the GraphML copy (slow for large n)')
+    args = parser.parse_args()
+    print(json.dumps(write_catalog(args.out, args.villages, args.seed, args.graphml)))
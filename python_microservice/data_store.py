@@ -0,0 +1,542 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import networkx as nx
+
+from graph_snapshot import (MAGIC as SNAPSHOT_MAGIC, RECORDS_EXT, is_snapshot, load_records, load_snapshot,
+                            records_path_for, snapshot_path_for, write_records_snapshot, write_snapshot)
+from logs import get_logger
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Where datasets, the graph and local caches live (defaults to the service directory)
+DATA_ROOT = os.getenv('DATA_ROOT', BASE_DIR)
+DATA_DIR = os.path.join(DATA_ROOT, 'data')
+
+# How often (seconds) a dataset re-stats its file to look for changes on disk.
+CHECK_INTERVAL = float(os.getenv('STORE_CHECK_INTERVAL', '2.0'))
+# Serve the villages and the graph from memory-mapped snapshots shared by all workers (see serve.py)
+STORE_MMAP = os.getenv('STORE_MMAP', '0').lower() in ('1', 'true', 'yes')
+
+log = get_logger('Store')
+
+
+def _load_json(raw):
+    return json.loads(raw.decode('utf-8'))
+
+
+def _load_records(raw):
+    if raw.startswith(SNAPSHOT_MAGIC):
+        return load_records(raw)
+    return _load_json(raw)
+
+
+def _load_graph(raw):
+    if raw.startswith(SNAPSHOT_MAGIC):
+        return load_snapshot(raw)
+    return nx.read_graphml(io.BytesIO(raw))
+
+
+def _write_json(value, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, indent=2, ensure_ascii=False)
+
+
+def _write_graph(value, path):
+    write_snapshot(value, path)
+
+
+def _write_records(value, path):
+    if path.endswith(RECORDS_EXT):
+        write_records_snapshot(value, path)
+    else:
+        _write_json(list(value), path)
+
+
+def _prefer_snapshot(snapshot_for):
+    def resolve(candidates):
+        """Prefer the compiled snapshot next to each source file, unless the source is newer."""
+        for p in candidates:
+            snap = snapshot_for(p)
+            if os.path.exists(snap) and (not os.path.exists(p) or os.stat(snap).st_mtime_ns >= os.stat(p).st_mtime_ns):
+                return snap
+            if os.path.exists(p):
+                return p
+        return None
+    return resolve
+
+
+_resolve_graph = _prefer_snapshot(snapshot_path_for)
+_resolve_records = _prefer_snapshot(records_path_for)
+
+
+class TrackedFile:
+    """A file loaded once into memory and reloaded when its mtime/size and content hash change.
+
+    Datasets with a change log also replay logged upserts on top of the file (the snapshot),
+    publish upserts committed by this or another process as new versions of the value, and
+    can be compacted back into the file. A served value is never changed in place, so readers
+    can iterate it without a lock.
+    With a mapper, compiled snapshot files are memory-mapped by mapper(path) instead of read.
+    """
+
+    def __init__(self, name, candidates, loader, empty, indexes=None, writer=None, resolver=None, compact_path=None,
+                 mapper=None):
+        self.name = name
+        self.candidates = candidates
+        self.loader = loader
+        self.empty = empty
+        # index name -> (record field, unique?)
+        self.indexes = indexes or {}
+        self.writer = writer
+        self.resolver = resolver
+        # Maps the loaded path to the file compaction writes (defaults to the same file)
+        self.compact_path = compact_path
+        self.mapper = mapper
+        self.changelog = None
+        # Lock held by writers from reading the current value to committing; refreshes take it too
+        self.write_lock = None
+        self.applied_seq = 0
+        self._replayed = 0
+        self.path = None
+        self.value = empty()
+        self.index = {k: {} for k in self.indexes}
+        self.digest = None
+        self.version = 0
+        self.loaded_at = None
+        # Seconds the last full load (read, parse, replay) took
+        self.load_seconds = None
+        # When the served value last changed (file mtime, or the time a logged change was applied)
+        self.modified_at = None
+        self._stat = None
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        # fn(old, new, touched) called before a new version with logged changes is published;
+        # touched is what apply_changes() reports
+        self.listeners = []
+        # village key -> list position, valid while self.version is _positions_version
+        self._positions = None
+        self._positions_version = None
+
+    def resolve(self):
+        if self.resolver is not None:
+            return self.resolver(self.candidates)
+        for p in self.candidates:
+            if os.path.exists(p):
+                return p
+        return None
+
+    def get(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < CHECK_INTERVAL:
+            return self.value
+        with (self.write_lock or _null_lock()), self._lock:
+            if not force and now - self._checked < CHECK_INTERVAL:
+                return self.value
+            self._refresh()
+            self._tail()
+            self._checked = time.monotonic()
+        return self.value
+
+    def _refresh(self):
+        path = self.resolve()
+        if path is None:
+            if self.path is not None:
+                log.warning("%s: %s disappeared; serving empty dataset", self.name, self.path)
+                self._install(None, None, None, self._replay(self.empty()))
+            return
+        st = os.stat(path)
+        # The inode changes when a new snapshot is renamed into place, even with equal size and mtime
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if path == self.path and stat_key == self._stat:
+            return
+        start = time.perf_counter()
+        try:
+            if self.mapper is not None and is_snapshot(path):
+                # Snapshots are only ever replaced, never rewritten in place, so the stat identifies them
+                value, digest = self.mapper(path), 'mapped:%d:%d:%d' % stat_key
+            else:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+                if path == self.path and digest == self.digest:
+                    # Touched but unchanged content; just remember the new stat
+                    self._stat = stat_key
+                    return
+                value = self.loader(raw)
+        except Exception as e:
+            log.error("Failed to load %s from %s: %s: %s", self.name, path, type(e).__name__, e)
+            return
+        value = self._replay(value)
+        self._install(path, stat_key, digest, value, modified=time.time() if self._replayed else st.st_mtime)
+        self.load_seconds = time.perf_counter() - start
+        log.info("Loaded %s from %s (version %d)", self.name, path, self.version)
+
+    def _replay(self, value):
+        """Apply logged changes newer than the snapshot to a freshly loaded value."""
+        if self.changelog is None:
+            return value
+        from persistence import apply_changes
+        base = self.changelog.snapshot_seq(self.name)
+        changes = self.changelog.since(self.name, base)
+        apply_changes(self.name, value, [(k, p) for _, k, p in changes])
+        self.applied_seq = changes[-1][0] if changes else base
+        self._replayed = len(changes)
+        return value
+
+    def _tail(self):
+        """Publish the changes logged since we last looked, by any process, as a new version.
+
+        Readers iterate the served value without a lock, so the changes are applied to a copy
+        (copy_for_changes() shares whatever they don't touch) which then replaces it whole.
+        Listeners carry indexes over from the old version to the new one.
+        """
+        if self.changelog is None:
+            return
+        from persistence import apply_changes, copy_for_changes, village_keys
+        changes = self.changelog.since(self.name, self.applied_seq)
+        if not changes:
+            return
+        entries = [(k, p) for _, k, p in changes]
+        old = self.value
+        value = copy_for_changes(self.name, old, entries)
+        positions = None
+        if self.name == 'villages':
+            if self._positions_version != self.version:
+                self._positions = {k: i for i, k in enumerate(village_keys(old)) if k is not None}
+            positions = dict(self._positions)
+        touched = []
+        apply_changes(self.name, value, entries, positions=positions, touched=touched)
+        index = self.index
+        if self.indexes:
+            if any(pos is None for _, pos in touched):
+                index = self._build_index(value)
+            else:
+                index = {name: dict(idx) for name, idx in self.index.items()}
+                for _, pos in touched:
+                    self._index_record(index, value[pos])
+        for fn in self.listeners:
+            try:
+                fn(old, value, touched)
+            except Exception as e:
+                log.error("%s change listener failed: %s: %s", self.name, type(e).__name__, e)
+        # Swap references together so readers never see a half-built index
+        self.value, self.index = value, index
+        self.version += 1
+        self._positions, self._positions_version = positions, self.version
+        self.modified_at = time.time()
+        self.applied_seq = changes[-1][0]
+
+    def _build_index(self, value):
+        index = {}
+        for name, (field, unique) in self.indexes.items():
+            idx = index[name] = {}
+            if hasattr(value, 'column'):
+                # Mapped records are indexed by position, so the index doesn't pull them into memory
+                for i, key in enumerate(value.column(field)):
+                    if key is not None:
+                        if unique:
+                            idx[key] = i
+                        else:
+                            idx.setdefault(key, []).append(i)
+                continue
+            for r in value:
+                if isinstance(r, dict) and r.get(field) is not None:
+                    if unique:
+                        idx[r[field]] = r
+                    else:
+                        idx.setdefault(r[field], []).append(r)
+        return index
+
+    def _install(self, path, stat_key, digest, value, modified=None):
+        index = self._build_index(value)
+        # Swap references together so readers never see a half-built index
+        self.value, self.index = value, index
+        self.path, self._stat, self.digest = path, stat_key, digest
+        self.version += 1
+        self.loaded_at = time.time()
+        self.modified_at = modified or self.loaded_at
+
+    def commit(self, entries, removed=()):
+        """Log [(key, payload)] upserts and removed keys, then publish them with any others pending."""
+        from persistence import REMOVED
+        with self._lock:
+            entries = list(entries) + [(k, REMOVED) for k in removed]
+            self.changelog.append([(self.name, k, p) for k, p in entries])
+            self._tail()
+
+    def _index_record(self, index, record):
+        if not isinstance(record, dict):
+            return
+        for name, (field, unique) in self.indexes.items():
+            if record.get(field) is None:
+                continue
+            if unique:
+                index[name][record[field]] = record
+            else:
+                # A new list: the old one belongs to the previous version's index
+                bucket = [r for r in index[name].get(record[field], []) if r is not record]
+                index[name][record[field]] = bucket + [record]
+
+    def compact(self):
+        """Write the current value as the new snapshot file and drop the log entries it contains.
+
+        The write lock is held only while catching up with the log, not while serializing.
+        """
+        from persistence import write_atomic
+        if self.writer is None:
+            return
+        lock = self.changelog.compaction_lock() if self.changelog else _null_lock()
+        with lock:
+            with (self.write_lock or _null_lock()), self._lock:
+                self._refresh()
+                self._tail()
+                # Published values are never changed, so no copy is needed
+                snapshot, seq = self.value, self.applied_seq
+                path = self.path or self.candidates[-1]
+                if self.compact_path is not None:
+                    path = self.compact_path(path)
+            write_atomic(path, lambda tmp: self.writer(snapshot, tmp))
+            with self._lock:
+                if self.mapper is not None:
+                    # Map the new snapshot on the next get(), dropping this worker's overlay
+                    self._stat = None
+                    self._checked = 0.0
+                else:
+                    self._record_file(path)
+            if self.changelog is not None:
+                self.changelog.mark_compacted(self.name, seq)
+        log.info("Compacted %s into %s (through change %d)", self.name, path, seq)
+
+    def _record_file(self, path):
+        """Remember path's stat and hash as already loaded, so our own write is not re-parsed."""
+        with open(path, 'rb') as f:
+            raw = f.read()
+        st = os.stat(path)
+        self.path, self._stat, self.digest = path, (st.st_mtime_ns, st.st_size, st.st_ino), hashlib.sha1(raw).hexdigest()
+        self._checked = time.monotonic()
+
+    def keyed(self, key):
+        """The record whose village_key() is key, or None (village records only)."""
+        from persistence import village_keys
+        self.get()
+        with self._lock:
+            if self._positions_version != self.version:
+                self._positions = {k: i for i, k in enumerate(village_keys(self.value)) if k is not None}
+                self._positions_version = self.version
+            pos = self._positions.get(key)
+            return None if pos is None else self.value[pos]
+
+    def lookup(self, index_name, key, default=None):
+        self.get()
+        hit = self.index[index_name].get(key, default)
+        if isinstance(hit, int) and hit is not default:
+            return self.value[hit]
+        if isinstance(hit, list):
+            return [self.value[h] if isinstance(h, int) else h for h in hit]
+        return hit
+
+
+class _null_lock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class DataStore:
+    """Shared in-memory view of the service datasets and knowledge graph."""
+
+    def __init__(self, base_dir=DATA_ROOT, changelog=None, mapped=STORE_MMAP):
+        data_dir = os.path.join(base_dir, 'data')
+        mapper = None
+        if mapped:
+            from shared_snapshot import open_mapped
+            mapper = open_mapped
+        self.mapped = mapped
+        self.files = {
+            'villages': TrackedFile(
+                'villages',
+                [os.path.join(data_dir, 'merged_villages.json'), os.path.join(base_dir, 'merged_villages.json')],
+                _load_records, list, {'village_id': ('village_id', True)}, writer=_write_records,
+                resolver=_resolve_records, compact_path=records_path_for if mapped else None, mapper=mapper,
+            ),
+            'internships': TrackedFile(
+                'internships', [os.path.join(data_dir, 'internships.json')], _load_json, list,
+                {'id': ('id', True)},
+            ),
+            'kirana_stores': TrackedFile(
+                'kirana_stores', [os.path.join(data_dir, 'kirana_stores.json')], _load_json, list,
+            ),
+            'bookings': TrackedFile(
+                'bookings', [os.path.join(data_dir, 'bookings.json')], _load_json, list,
+                {'ownerId': ('ownerId', False)},
+            ),
+            'applications': TrackedFile(
+                'applications', [os.path.join(data_dir, 'applications.json')], _load_json, list,
+                {'userId': ('userId', False)},
+            ),
+            'graph': TrackedFile(
+                'graph',
+                [
+                    os.path.join(base_dir, 'models', 'final_village_knowledge_graph.graphml'),
+                    os.path.join(data_dir, 'village_knowledge_graph.graphml'),
+                    os.path.join(base_dir, 'village_knowledge_graph.graphml'),
+                ],
+                _load_graph, nx.Graph, writer=_write_graph, resolver=_resolve_graph,
+                compact_path=snapshot_path_for, mapper=mapper,
+            ),
+        }
+        if changelog is None:
+            from persistence import ChangeLog
+            changelog = ChangeLog()
+        self.changelog = changelog
+        # Held by writers from reading the villages/graph to committing their change
+        self.write_lock = threading.RLock()
+        for name in ('villages', 'graph'):
+            self.files[name].changelog = changelog
+            self.files[name].write_lock = self.write_lock
+        self._compacting = threading.Lock()
+        self.load_seconds = None
+
+    def load_all(self):
+        start = time.perf_counter()
+        for f in self.files.values():
+            f.get(force=True)
+        self.load_seconds = time.perf_counter() - start
+        log.info("Datasets loaded in %.2fs", self.load_seconds)
+
+    def stats(self):
+        """Size, version and last load time of each dataset as currently held (no reload)."""
+        out = {}
+        for name, f in self.files.items():
+            value = f.value
+            if isinstance(value, nx.Graph):
+                size = {'records': value.number_of_nodes(), 'edges': value.number_of_edges()}
+            else:
+                size = {'records': len(value)}
+            if hasattr(value, 'overlay_size'):
+                # Entries this worker holds in memory on top of the shared mapping
+                size['overlay'] = value.overlay_size()
+            out[name] = {**size, 'version': f.version, 'load_seconds': f.load_seconds, 'loaded_at': f.loaded_at}
+        return out
+
+    def version(self, name):
+        return self.files[name].version
+
+    def modified(self, name):
+        """Unix time the dataset last changed, for Last-Modified headers."""
+        return self.files[name].modified_at
+
+    def path(self, name):
+        self.files[name].get()
+        return self.files[name].path
+
+    def write_path(self, name):
+        """Where a dataset should be saved: the file it was loaded from, else its last candidate."""
+        return self.path(name) or self.files[name].candidates[-1]
+
+    def commit(self, villages=(), nodes=None, removed_villages=(), removed_nodes=()):
+        """Durably log changed village records and graph nodes and publish them; cost scales with the change.
+
+        villages are new record dicts, replacing the record with the same village_key() or
+        appended; nodes maps node -> {'attrs': ..., 'edges': [[nbr, attrs], ...]}, the node's
+        whole new state (see graph_node_change()). removed_villages (village_key()s) and
+        removed_nodes are logged as removals. Readers iterate store.villages() / store.graph()
+        without a lock, so callers never change them: they hold write_lock from reading the
+        current values to committing new dicts built from them. The snapshots are rewritten
+        later by compact(), in the background.
+        """
+        from persistence import village_key
+        with self.write_lock:
+            if villages or removed_villages:
+                self.files['villages'].commit([(village_key(v), v) for v in villages], removed=removed_villages)
+            if nodes or removed_nodes:
+                self.files['graph'].commit(list((nodes or {}).items()), removed=removed_nodes)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        from persistence import COMPACT_EVERY, COMPACT_INTERVAL
+        due = []
+        for name in ('villages', 'graph'):
+            count, oldest = self.changelog.pending(name)
+            if count >= COMPACT_EVERY or (count and time.time() - oldest >= COMPACT_INTERVAL):
+                due.append(name)
+        if due and self._compacting.acquire(blocking=False):
+            def run():
+                try:
+                    for name in due:
+                        self.files[name].compact()
+                except Exception as e:
+                    log.error("Compaction failed: %s: %s", type(e).__name__, e)
+                finally:
+                    self._compacting.release()
+            threading.Thread(target=run, daemon=True).start()
+
+    def compact_all(self):
+        with self._compacting:
+            for name in ('villages', 'graph'):
+                if self.changelog.pending(name)[0]:
+                    self.files[name].compact()
+
+    def villages(self):
+        return self.files['villages'].get()
+
+    def village(self, village_id):
+        return self.files['villages'].lookup('village_id', village_id)
+
+    def village_by_key(self, key):
+        """The merged_villages record with village_key() key: its village_id, else lowercased name|state."""
+        return self.files['villages'].keyed(key)
+
+    def internships(self):
+        return self.files['internships'].get()
+
+    def internship(self, internship_id):
+        return self.files['internships'].lookup('id', internship_id)
+
+    def kirana_stores(self):
+        return self.files['kirana_stores'].get()
+
+    def bookings(self, owner_id=None):
+        if owner_id:
+            return self.files['bookings'].lookup('ownerId', owner_id, [])
+        return self.files['bookings'].get()
+
+    def applications(self, user_id=None):
+        if user_id:
+            return self.files['applications'].lookup('userId', user_id, [])
+        return self.files['applications'].get()
+
+    def graph(self):
+        return self.files['graph'].get()
+
+    def on_change(self, name, fn):
+        """Call fn(old, new, touched) before each new version of dataset name carrying logged changes is published."""
+        self.files[name].listeners.append(fn)
+
+    def graph_loaded(self):
+        self.files['graph'].get()
+        return self.files['graph'].path is not None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = DataStore()
+                # Carry the search indexes over to each new version of the villages and graph
+                from index_sync import sync_graph_nodes, sync_village_records
+                store.on_change('villages', sync_village_records)
+                store.on_change('graph', sync_graph_nodes)
+                _store = store
+    return _store
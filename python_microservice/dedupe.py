@@ -0,0 +1,359 @@
+"""Duplicate village detection and merging.
+
+Comparing every pair of villages is quadratic, so candidates are blocked first: villages are
+only compared with others in the same geohash cell, or in the same state whose folded names
+share a prefix. Blocks larger than DEDUPE_MAX_BLOCK are compared within a sliding window over
+their names instead of pairwise. Each candidate pair is scored on name similarity, distance
+and shared attractions/specialties; pairs above DEDUPE_MIN_SCORE are joined into clusters,
+and every cluster is merged into its most complete member.
+"""
+import os
+
+import numpy as np
+
+from fuzzy import edit_distance, fold, strip_generic, trigrams
+from logs import get_logger
+from search_index import is_village_node
+from spatial_index import EARTH_RADIUS_KM, node_coords
+
+DEDUPE_MIN_SCORE = float(os.getenv('DEDUPE_MIN_SCORE', '0.8'))
+# Pairs whose names are less similar than this are never duplicates, whatever else matches
+DEDUPE_MIN_NAME = float(os.getenv('DEDUPE_MIN_NAME', '0.7'))
+# Distance at which the coordinate term reaches 0
+DEDUPE_MAX_KM = float(os.getenv('DEDUPE_MAX_KM', '5'))
+# 5 characters is a cell of roughly 5 x 5 km
+DEDUPE_GEOHASH_PRECISION = int(os.getenv('DEDUPE_GEOHASH_PRECISION', '5'))
+DEDUPE_MAX_BLOCK = int(os.getenv('DEDUPE_MAX_BLOCK', '50'))
+DEDUPE_WINDOW = int(os.getenv('DEDUPE_WINDOW', '10'))
+NAME_PREFIX = 4
+WEIGHTS = {'name': 0.5, 'coords': 0.3, 'items': 0.2}
+# Comma-separated fields whose values are unioned when villages merge
+LIST_FIELDS = ('primary_attractions', 'local_specialties', 'activities', 'aliases')
+ITEM_PREFIXES = ('attraction::', 'specialty::')
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+log = get_logger('Dedupe')
+
+
+def geohash(lat, lng, precision=DEDUPE_GEOHASH_PRECISION):
+    """Standard base32 geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(out)
+
+
+def split_items(value):
+    """A list field as a list, whether stored as a list or a comma-separated string."""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(x).strip() for x in value if str(x).strip()]
+    return [x.strip() for x in str(value).split(',') if x.strip()]
+
+
+class Entry:
+    """What the matcher needs to know about one village."""
+    __slots__ = ('id', 'name', 'key', 'spellings', 'state', 'coords', 'items')
+
+    def __init__(self, id, name, state, coords, items):
+        self.id = id
+        self.name = name
+        full = fold(name)
+        self.key = fold(strip_generic(name)) or full
+        # The full name too, so a misspelt generic word ("Vilage") doesn't hide a match
+        self.spellings = [(k, trigrams(k)) for k in dict.fromkeys((self.key, full)) if k]
+        self.state = (state or '').strip().lower()
+        self.coords = coords
+        self.items = {i.strip().lower() for i in items if i}
+
+
+def name_similarity(a, b, floor=0.0):
+    """fuzzy.similarity() of the closest pair of spellings, or 0 if none reaches floor.
+
+    Trigram sets are precomputed per entry, and the edit distance is bounded by what the
+    score can still afford, as in fuzzy.FuzzyNameIndex.search().
+    """
+    best = 0.0
+    for ka, ga in a.spellings:
+        for kb, gb in b.spellings:
+            if ka == kb:
+                return 1.0
+            dice = 2 * len(ga & gb) / (len(ga) + len(gb))
+            longest = max(len(ka), len(kb))
+            limit = int(longest * (1 - 2 * max(floor, best) + dice))
+            if limit < 0:
+                continue
+            distance = edit_distance(ka, kb, limit)
+            if distance <= limit:
+                best = max(best, 0.5 * dice + 0.5 * (1 - distance / longest))
+    return best if best >= floor else 0.0
+
+
+def graph_rows(G):
+    """(node, name, state, coords, items, completeness) per village node.
+
+    This is everything duplicate detection reads from G, so callers can score it with
+    rank_duplicates() without going back to the graph.
+    """
+    rows = []
+    for node, data in G.nodes(data=True):
+        if not is_village_node(node):
+            continue
+        items = [nbr.split('::', 1)[1] for nbr in G[node] if str(nbr).startswith(ITEM_PREFIXES)]
+        items += split_items(data.get('primary_attractions')) + split_items(data.get('local_specialties'))
+        rows.append((node, data.get('village_name') or str(node), data.get('state'), node_coords(data), items,
+                     _completeness(data, G.degree(node))))
+    return rows
+
+
+def graph_entries(G):
+    return [Entry(*row[:5]) for row in graph_rows(G)]
+
+
+def record_entries(records):
+    """Entries for pipeline records (name/state/lat/lng); ids are list positions."""
+    entries = []
+    for i, v in enumerate(records):
+        coords = node_coords({'latitude': v.get('lat'), 'longitude': v.get('lng')})
+        items = split_items(v.get('primary_attractions')) + split_items(v.get('local_specialties'))
+        entries.append(Entry(i, v.get('name') or '', v.get('state'), coords, items))
+    return entries
+
+
+def blocks(entries):
+    """Candidate groups: same geohash cell, or same state and folded-name prefix."""
+    out = {}
+    for i, e in enumerate(entries):
+        if e.coords:
+            out.setdefault(('geo', geohash(*e.coords)), []).append(i)
+        if e.key:
+            out.setdefault(('name', e.state, e.key.replace(' ', '')[:NAME_PREFIX]), []).append(i)
+    return out.values()
+
+
+def candidate_pairs(entries):
+    pairs = set()
+    for members in blocks(entries):
+        if len(members) < 2:
+            continue
+        if len(members) <= DEDUPE_MAX_BLOCK:
+            pairs.update((a, b) for n, a in enumerate(members) for b in members[n + 1:])
+            continue
+        # Sorted neighbourhood: similar names sort close together
+        ordered = sorted(members, key=lambda i: entries[i].key)
+        for n, a in enumerate(ordered):
+            pairs.update((min(a, b), max(a, b)) for b in ordered[n + 1:n + DEDUPE_WINDOW])
+    return pairs
+
+
+def score_pairs(entries, pairs, min_score=0.0):
+    """0..1 likelihood per (i, j) pair that the two entries are the same village.
+
+    Pairs in different states, or whose names are less similar than DEDUPE_MIN_NAME, score 0.
+    Coordinates and attractions only count when both sides have them; the weights of the
+    terms present are renormalized. Those terms are computed for all pairs at once, so the
+    (slow) name comparison only runs for pairs that can still reach min_score.
+    """
+    scores = np.zeros(len(pairs))
+    if not len(pairs):
+        return scores
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    a, b = pairs[:, 0], pairs[:, 1]
+    states = {}
+    state = np.array([states.setdefault(e.state, len(states)) if e.state else -1 for e in entries])
+    coords = np.array([e.coords or (np.nan, np.nan) for e in entries], dtype=np.float64).reshape(-1, 2)
+    lat1, lng1, lat2, lng2 = (np.radians(x) for x in (coords[a, 0], coords[a, 1], coords[b, 0], coords[b, 1]))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    with np.errstate(invalid='ignore'):
+        km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+    has_coords = ~np.isnan(km)
+    total = np.where(has_coords, WEIGHTS['coords'] * np.clip(1 - km / DEDUPE_MAX_KM, 0.0, 1.0), 0.0)
+    weight = WEIGHTS['name'] + np.where(has_coords, WEIGHTS['coords'], 0.0)
+    has_items = np.array([bool(e.items) for e in entries])
+    both_items = has_items[a] & has_items[b]
+    same_state = (state[a] == state[b]) | (state[a] < 0) | (state[b] < 0)
+    # Even a perfect name and full attraction overlap can't lift these pairs to min_score
+    possible = same_state & (min_score * (weight + np.where(both_items, WEIGHTS['items'], 0.0))
+                             - total - np.where(both_items, WEIGHTS['items'], 0.0) <= WEIGHTS['name'])
+    for k in np.flatnonzero(possible).tolist():
+        ea, eb = entries[a[k]], entries[b[k]]
+        t, w = float(total[k]), float(weight[k])
+        if both_items[k]:
+            t += WEIGHTS['items'] * len(ea.items & eb.items) / len(ea.items | eb.items)
+            w += WEIGHTS['items']
+        floor = max(DEDUPE_MIN_NAME, (min_score * w - t) / WEIGHTS['name'])
+        if floor > 1:
+            continue
+        name = name_similarity(ea, eb, floor)
+        if name:
+            scores[k] = (t + WEIGHTS['name'] * name) / w
+    return scores
+
+
+def pair_score(a, b):
+    """score_pairs() for a single pair of entries."""
+    return float(score_pairs([a, b], [(0, 1)])[0])
+
+
+def find_clusters(entries, min_score=DEDUPE_MIN_SCORE):
+    """[[(entry index, best score to the cluster)]] for every group of two or more duplicates."""
+    parent = list(range(len(entries)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = list(candidate_pairs(entries))
+    scores = score_pairs(entries, pairs, min_score)
+    best = {}
+    for k in np.flatnonzero(scores >= max(min_score, 1e-9)).tolist():
+        a, b = pairs[k]
+        score = float(scores[k])
+        parent[root(a)] = root(b)
+        best[a] = max(best.get(a, 0.0), score)
+        best[b] = max(best.get(b, 0.0), score)
+    groups = {}
+    for i in best:
+        groups.setdefault(root(i), []).append((i, round(best[i], 4)))
+    return [sorted(g) for g in groups.values()]
+
+
+def _completeness(data, degree=0):
+    return sum(1 for v in data.values() if v not in (None, '', [], 'None')) + degree
+
+
+def merge_attrs(keep, other):
+    """Fold other's attributes into keep: list fields are unioned, blanks filled in."""
+    for k, v in other.items():
+        if k in LIST_FIELDS:
+            merged = list(dict.fromkeys(split_items(keep.get(k)) + split_items(v)))
+            keep[k] = merged if isinstance(keep.get(k, v), list) else ', '.join(merged)
+        elif keep.get(k) in (None, '', []) and v not in (None, '', []):
+            keep[k] = v
+
+
+def _add_alias(data, name, name_field):
+    if name and fold(name) != fold(data.get(name_field) or ''):
+        merge_attrs(data, {'aliases': [name] if isinstance(data.get('aliases'), list) else name})
+
+
+def find_duplicates(G, min_score=DEDUPE_MIN_SCORE):
+    """[{'keep': node, 'duplicates': [{'id', 'score'}]}] for the village nodes of G.
+
+    The kept node is the most complete one (most filled attributes plus edges), then the lowest id.
+    """
+    return rank_duplicates(graph_rows(G), min_score)
+
+
+def rank_duplicates(rows, min_score=DEDUPE_MIN_SCORE):
+    """find_duplicates() over graph_rows() output, without touching the graph."""
+    entries = [Entry(*row[:5]) for row in rows]
+    out = []
+    for cluster in find_clusters(entries, min_score):
+        nodes = [(rows[i][0], score, rows[i][5]) for i, score in cluster]
+        keep = min(nodes, key=lambda n: (-n[2], str(n[0])))[0]
+        out.append({'keep': keep, 'duplicates': [{'id': n, 'score': s} for n, s, _ in nodes if n != keep]})
+    out.sort(key=lambda c: str(c['keep']))
+    return out
+
+
+def merge_nodes(G, keep, dup):
+    """Merge village node dup into keep, moving its attraction/specialty (and other) edges."""
+    data, extra = G.nodes[keep], dict(G.nodes[dup])
+    _add_alias(data, extra.get('village_name'), 'village_name')
+    merge_attrs(data, {k: v for k, v in extra.items() if k != 'merged_ids'})
+    data['merged_ids'] = ', '.join(dict.fromkeys(
+        split_items(data.get('merged_ids')) + [str(dup)] + split_items(extra.get('merged_ids'))))
+    for nbr, attrs in list(G[dup].items()):
+        if nbr != keep and not G.has_edge(keep, nbr):
+            G.add_edge(keep, nbr, **attrs)
+    G.remove_node(dup)
+
+
+def merge_duplicates(G, clusters=None, min_score=DEDUPE_MIN_SCORE):
+    """Merge every duplicate cluster in G in place; returns {merged node: kept node}."""
+    clusters = find_duplicates(G, min_score) if clusters is None else clusters
+    merged = {}
+    for cluster in clusters:
+        for dup in cluster['duplicates']:
+            if dup['id'] in G and cluster['keep'] in G:
+                merge_nodes(G, cluster['keep'], dup['id'])
+                merged[dup['id']] = cluster['keep']
+    return merged
+
+
+def dedupe_records(records, min_score=DEDUPE_MIN_SCORE):
+    """Collapse duplicate pipeline records (name/state/lat/lng); returns the surviving records.
+
+    Names of merged records are kept in the survivor's ``aliases`` list.
+    """
+    entries = record_entries(records)
+    drop = set()
+    for cluster in find_clusters(entries, min_score):
+        ids = [i for i, _ in cluster]
+        keep = max(ids, key=lambda i: (_completeness(records[i]), -i))
+        for i in ids:
+            if i != keep:
+                _add_alias(records[keep], records[i].get('name'), 'name')
+                merge_attrs(records[keep], records[i])
+                drop.add(i)
+    return [v for i, v in enumerate(records) if i not in drop]
+
+
+def merge_store_duplicates(store, min_score=DEDUPE_MIN_SCORE):
+    """Merge duplicate villages in the live store; returns (clusters, {merged node: kept node}).
+
+    Requests read the served graph and records without a lock, so nothing served is changed:
+    nodes are merged with merge_duplicates() on a copy of the graph, and the matching
+    merged_villages.json records are folded into new dicts for the kept villages (or take
+    over their ids). Those changes are committed like any other edit, which publishes them
+    as a new version of both datasets and updates the search indexes.
+    """
+    from persistence import REMOVED, copy_for_changes, graph_node_change, village_key
+
+    # Scoring is the slow part and only needs the rows; merge_duplicates skips nodes gone since
+    clusters = rank_duplicates(graph_rows(store.graph()), min_score)
+    with store.write_lock:
+        G = store.graph()
+        members = [n for c in clusters for n in [c['keep']] + [d['id'] for d in c['duplicates']] if n in G]
+        # A merge changes the cluster members and their neighbours, so only those are copied
+        G = copy_for_changes('graph', G, [(n, REMOVED) for n in members])
+        merged = merge_duplicates(G, clusters)
+        if not merged:
+            return clusters, merged
+        by_id = {v['village_id']: v for v in store.villages() if isinstance(v, dict) and v.get('village_id')}
+        changed, removed = {}, []
+        for dup, keep in merged.items():
+            record = by_id.get(dup)
+            if record is None:
+                continue
+            removed.append(village_key(record))
+            if keep not in changed and keep not in by_id:
+                changed[keep] = by_id[keep] = {**record, 'village_id': keep}
+                continue
+            if keep not in changed:
+                changed[keep] = dict(by_id[keep])
+            _add_alias(changed[keep], record.get('village_name'), 'village_name')
+            merge_attrs(changed[keep], record)
+        touched = list(merged) + list(dict.fromkeys(merged.values()))
+        store.commit(villages=list(changed.values()), removed_villages=removed,
+                     nodes={n: graph_node_change(G, n) for n in touched if n in G},
+                     removed_nodes=[n for n in touched if n not in G])
+    log.info("Merged %d duplicate villages into %d", len(merged), len(set(merged.values())))
+    return clusters, merged
@@ -0,0 +1,135 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from data_store import DATA_DIR
+
+CACHE_PATH = os.getenv('ENRICHMENT_CACHE_PATH', os.path.join(DATA_DIR, 'enrichment_cache.sqlite3'))
+# Successful results live for a week by default; failures are retried after ten minutes
+TTL = float(os.getenv('ENRICHMENT_CACHE_TTL', str(7 * 24 * 3600)))
+NEGATIVE_TTL = float(os.getenv('ENRICHMENT_CACHE_NEGATIVE_TTL', '600'))
+MAX_ENTRIES = int(os.getenv('ENRICHMENT_CACHE_MAX_ENTRIES', '10000'))
+
+NAMESPACES = ('enrichment', 'serpapi')
+
+_MISSING = object()
+
+
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', (query or '').strip().lower())
+
+
+class SQLiteTTLCache:
+    """SQLite-backed TTL cache with LRU eviction and negative entries, one table per namespace."""
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES,
+                 namespaces=NAMESPACES):
+        self.path = path
+        self.namespaces = tuple(namespaces)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {ns: {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0}
+                      for ns in self.namespaces}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            for ns in self.namespaces:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {ns} ("
+                    "key TEXT PRIMARY KEY, value TEXT, ok INTEGER, expires REAL, accessed REAL)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {ns}_accessed ON {ns}(accessed)")
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; keep one per worker thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, ns, stat):
+        with self._stats_lock:
+            self.stats[ns][stat] += 1
+
+    def get(self, ns, key, default=_MISSING):
+        """Return the cached value, or default (a sentinel unless given) on miss/expiry."""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(f"SELECT value, ok, expires FROM {ns} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(ns, 'misses')
+            return default
+        value, ok, expires = row
+        if expires < now:
+            self._count(ns, 'expired')
+            self._count(ns, 'misses')
+            with conn:
+                conn.execute(f"DELETE FROM {ns} WHERE key = ?", (key,))
+            return default
+        with conn:
+            conn.execute(f"UPDATE {ns} SET accessed = ? WHERE key = ?", (now, key))
+        self._count(ns, 'hits' if ok else 'negative_hits')
+        return json.loads(value)
+
+    def put(self, ns, key, value, ok=True):
+        now = time.time()
+        expires = now + (self.ttl if ok else self.negative_ttl)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {ns} (key, value, ok, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), 1 if ok else 0, expires, now),
+            )
+            count = conn.execute(f"SELECT COUNT(*) FROM {ns}").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                conn.execute(
+                    f"DELETE FROM {ns} WHERE key IN (SELECT key FROM {ns} ORDER BY accessed LIMIT ?)", (excess,)
+                )
+                with self._stats_lock:
+                    self.stats[ns]['evictions'] += excess
+        self._count(ns, 'stores')
+
+    def clear(self, ns=None):
+        conn = self._conn()
+        with conn:
+            for name in ([ns] if ns else self.namespaces):
+                conn.execute(f"DELETE FROM {name}")
+
+    def snapshot(self):
+        """Counters plus current size per namespace, for the stats endpoint."""
+        conn = self._conn()
+        out = {}
+        with self._stats_lock:
+            stats = {ns: dict(s) for ns, s in self.stats.items()}
+        for ns, s in stats.items():
+            lookups = s['hits'] + s['negative_hits'] + s['misses']
+            s['entries'] = conn.execute(f"SELECT COUNT(*) FROM {ns}").fetchone()[0]
+            s['hit_rate'] = round((s['hits'] + s['negative_hits']) / lookups, 4) if lookups else 0.0
+            out[ns] = s
+        return out
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLiteTTLCache()
+    return _cache
+
+
+def is_missing(value):
+    return value is _MISSING
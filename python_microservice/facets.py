@@ -0,0 +1,311 @@
+"""Columnar filter/sort/facet engine over the village nodes of the knowledge graph.
+
+Attributes are loaded into NumPy columns once per graph:
+
+- numeric: float64 with NaN for missing (ratings, scores, capacities, ...); ``a-b`` ranges such
+  as ``price_range_per_night`` also get ``<attr>_min`` / ``<attr>_max`` columns,
+- categorical: int32 codes into a label list, -1 for missing (state, best_season, yes/no flags),
+- multi-valued: a boolean village x value matrix for the comma-separated lists.
+
+Filters become boolean masks, and facet counts are bincounts / column sums over the mask.
+"""
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from search_index import ATTRIBUTE_FIELDS, IndexCache, is_village_node
+
+# Text attributes with more distinct values than this (or mostly unique ones) are not faceted
+FACET_MAX_VALUES = int(os.getenv('FACET_MAX_VALUES', '500'))
+MULTI_FIELDS = ATTRIBUTE_FIELDS
+# 'a-b' with an optional short unit/currency prefix on either side (e.g. '₹1300-3500')
+_RANGE_RE = re.compile(r'^[^\d+\-]{0,3}(\d+(?:\.\d+)?)\s*-\s*[^\d+\-]{0,3}(\d+(?:\.\d+)?)\s*$')
+_FILTER_RE = re.compile(r'^\s*([\w.]+)\s*(>=|<=|!=|=|>|<)\s*(.*?)\s*$')
+_NUMERIC_OPS = {'>=': np.greater_equal, '<=': np.less_equal, '>': np.greater, '<': np.less}
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').strip())
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _range(value):
+    m = _RANGE_RE.match(str(value).replace(',', '').strip())
+    if not m or float(m.group(1)) > float(m.group(2)):
+        return math.nan, math.nan
+    return float(m.group(1)), float(m.group(2))
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or '').split(',') if v.strip()]
+
+
+def _present(value):
+    return value is not None and value != ''
+
+
+def infer_schema(records):
+    """{attr: kind} for kind in 'numeric', 'range', 'categorical', 'multi' from sample values."""
+    values = {}
+    for data in records:
+        for k, v in data.items():
+            if _present(v):
+                values.setdefault(k, []).append(v)
+    schema = {}
+    for attr, vals in values.items():
+        if attr in MULTI_FIELDS:
+            schema[attr] = 'multi'
+            continue
+        numeric = sum(not math.isnan(_to_float(v)) for v in vals)
+        if numeric >= 0.9 * len(vals):
+            schema[attr] = 'numeric'
+            continue
+        if sum(not math.isnan(_range(v)[0]) for v in vals) >= 0.9 * len(vals):
+            schema[attr] = 'range'
+            continue
+        labels = {str(v).strip().lower() for v in vals}
+        if len(labels) <= FACET_MAX_VALUES and len(labels) <= 0.8 * len(vals):
+            schema[attr] = 'categorical'
+    return schema
+
+
+class FacetIndex:
+    """Rows are village nodes; columns follow the inferred schema."""
+
+    def __init__(self, nodes, records, schema=None):
+        self.schema = schema if schema is not None else infer_schema(records)
+        self.nodes = list(nodes)
+        self.row_of = {n: i for i, n in enumerate(self.nodes)}
+        self.numeric = {}
+        self.categorical = {}  # attr -> (codes, labels, {lowered label: code})
+        self.multi = {}        # attr -> (matrix, labels, {lowered label: column})
+        self._lock = threading.RLock()
+        for attr, kind in self.schema.items():
+            col = [d.get(attr) for d in records]
+            if kind == 'numeric':
+                self.numeric[attr] = np.array([_to_float(v) if _present(v) else math.nan for v in col])
+            elif kind == 'range':
+                pairs = [_range(v) if _present(v) else (math.nan, math.nan) for v in col]
+                self.numeric[f'{attr}_min'] = np.array([p[0] for p in pairs])
+                self.numeric[f'{attr}_max'] = np.array([p[1] for p in pairs])
+            elif kind == 'categorical':
+                labels, lookup = [], {}
+                codes = np.array([self._code(v, labels, lookup) for v in col], dtype='int32')
+                self.categorical[attr] = (codes, labels, lookup)
+            else:
+                labels, lookup = [], {}
+                rows = [[self._code(x, labels, lookup) for x in _split(v)] for v in col]
+                matrix = np.zeros((len(rows), len(labels)), dtype=bool)
+                for i, cols in enumerate(rows):
+                    matrix[i, cols] = True
+                self.multi[attr] = (matrix, labels, lookup)
+        self._base_counts = self.facet_counts(np.ones(len(self.nodes), dtype=bool))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @staticmethod
+    def _code(value, labels, lookup):
+        if not _present(value):
+            return -1
+        label = str(value).strip()
+        key = label.lower()
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(labels)
+            labels.append(label)
+        return code
+
+    def update(self, node, data):
+        """Insert or refresh one village row in place."""
+        with self._lock:
+            i = self.row_of.get(node)
+            if i is None:
+                i = self.row_of[node] = len(self.nodes)
+                self.nodes.append(node)
+                for attr, col in self.numeric.items():
+                    self.numeric[attr] = np.append(col, math.nan)
+                for attr, (codes, labels, lookup) in self.categorical.items():
+                    self.categorical[attr] = (np.append(codes, np.int32(-1)), labels, lookup)
+                for attr, (matrix, labels, lookup) in self.multi.items():
+                    self.multi[attr] = (np.vstack([matrix, np.zeros((1, matrix.shape[1]), dtype=bool)]),
+                                        labels, lookup)
+            for attr, kind in self.schema.items():
+                v = data.get(attr)
+                if kind == 'numeric':
+                    self.numeric[attr][i] = _to_float(v) if _present(v) else math.nan
+                elif kind == 'range':
+                    lo, hi = _range(v) if _present(v) else (math.nan, math.nan)
+                    self.numeric[f'{attr}_min'][i], self.numeric[f'{attr}_max'][i] = lo, hi
+                elif kind == 'categorical':
+                    codes, labels, lookup = self.categorical[attr]
+                    codes[i] = self._code(v, labels, lookup)
+                else:
+                    matrix, labels, lookup = self.multi[attr]
+                    cols = [self._code(x, labels, lookup) for x in _split(v)]
+                    if len(labels) > matrix.shape[1]:
+                        matrix = np.hstack([matrix, np.zeros((matrix.shape[0], len(labels) - matrix.shape[1]),
+                                                             dtype=bool)])
+                        self.multi[attr] = (matrix, labels, lookup)
+                    matrix[i, :] = False
+                    matrix[i, cols] = True
+            self._base_counts = None
+
+    def remove(self, node):
+        """Blank a row (rows are not compacted; a removed village matches no filter)."""
+        with self._lock:
+            i = self.row_of.pop(node, None)
+            if i is None:
+                return
+            for col in self.numeric.values():
+                col[i] = math.nan
+            for codes, _, _ in self.categorical.values():
+                codes[i] = -1
+            for matrix, _, _ in self.multi.values():
+                matrix[i, :] = False
+            self._base_counts = None
+
+    def _live(self):
+        mask = np.zeros(len(self.nodes), dtype=bool)
+        mask[list(self.row_of.values())] = True
+        return mask
+
+    def condition(self, attr, op, value):
+        """Boolean mask for one 'attr op value' filter; '|' separates alternatives for = and !=."""
+        if attr in self.numeric:
+            col = self.numeric[attr]
+            if op in _NUMERIC_OPS:
+                with np.errstate(invalid='ignore'):
+                    return _NUMERIC_OPS[op](col, float(value))
+            wanted = np.array([float(x) for x in value.split('|')])
+            hit = np.isin(col, wanted)
+            return hit if op == '=' else ~hit & ~np.isnan(col)
+        if op not in ('=', '!='):
+            raise ValueError(f"'{attr}' is not numeric; use = or !=")
+        wanted = [x.strip().lower() for x in value.split('|') if x.strip()]
+        if attr in self.categorical:
+            codes, _, lookup = self.categorical[attr]
+            hit = np.isin(codes, [lookup[w] for w in wanted if w in lookup])
+            return hit if op == '=' else ~hit & (codes >= 0)
+        if attr in self.multi:
+            matrix, _, lookup = self.multi[attr]
+            cols = [lookup[w] for w in wanted if w in lookup]
+            hit = matrix[:, cols].any(axis=1) if cols else np.zeros(len(self.nodes), dtype=bool)
+            return hit if op == '=' else ~hit
+        raise ValueError(f"Unknown filter field '{attr}'")
+
+    def facet_counts(self, mask, fields=None):
+        counts = {}
+        for attr, (codes, labels, _) in self.categorical.items():
+            if fields is None or attr in fields:
+                selected = codes[mask]
+                bins = np.bincount(selected[selected >= 0], minlength=len(labels))
+                counts[attr] = {labels[c]: int(n) for c, n in enumerate(bins) if n}
+        for attr, (matrix, labels, _) in self.multi.items():
+            if fields is None or attr in fields:
+                sums = matrix[mask].sum(axis=0)
+                counts[attr] = {labels[c]: int(n) for c, n in enumerate(sums) if n}
+        return counts
+
+    def ranges(self, mask, fields=None):
+        out = {}
+        for attr, col in self.numeric.items():
+            if fields is None or attr in fields:
+                vals = col[mask]
+                vals = vals[~np.isnan(vals)]
+                if len(vals):
+                    out[attr] = {'min': float(vals.min()), 'max': float(vals.max()), 'count': int(len(vals))}
+        return out
+
+    def sort_key(self, attr):
+        if attr in self.numeric:
+            return self.numeric[attr]
+        if attr in self.categorical:
+            codes, labels, _ = self.categorical[attr]
+            order = np.argsort([l.lower() for l in labels]) if labels else np.array([], dtype=int)
+            rank = np.empty(len(labels) + 1)
+            rank[order] = np.arange(len(labels))
+            rank[-1] = math.nan  # code -1 (missing)
+            return rank[codes]
+        raise ValueError(f"Cannot sort by '{attr}'")
+
+    def query(self, filters=(), sort=None, offset=0, limit=20, facet_fields=None):
+        """Apply [(attr, op, value)] filters; returns (total, [node], facets, ranges).
+
+        Facet counts are disjunctive: each field's counts ignore that field's own filter, so a
+        discovery page can show how many results every alternative would give.
+        """
+        with self._lock:
+            live = self._live()
+            conds = [(attr, self.condition(attr, op, value)) for attr, op, value in filters]
+            mask = live.copy()
+            for _, cond in conds:
+                mask &= cond
+            if not conds:
+                if self._base_counts is None:
+                    self._base_counts = self.facet_counts(live)
+                facets = {k: v for k, v in self._base_counts.items() if facet_fields is None or k in facet_fields}
+            else:
+                facets = {}
+                for attr in list(self.categorical) + list(self.multi):
+                    if facet_fields is not None and attr not in facet_fields:
+                        continue
+                    others = live.copy()
+                    for other, cond in conds:
+                        if other != attr:
+                            others &= cond
+                    facets.update(self.facet_counts(others, fields={attr}))
+            ranges = self.ranges(mask, facet_fields)
+            rows = np.flatnonzero(mask)
+            if sort:
+                desc = sort.startswith('-')
+                key = self.sort_key(sort.lstrip('+-'))[rows]
+                # NaN (missing) sorts last either way
+                rows = rows[np.argsort(-key if desc else key, kind='stable')]
+            page = rows[offset:offset + limit]
+            return len(rows), [self.nodes[i] for i in page], facets, ranges
+
+
+def parse_filter(text):
+    """'eco_rating>=4' / 'state=Kerala|Goa' -> (attr, op, value)."""
+    m = _FILTER_RE.match(text)
+    if not m or not m.group(3):
+        raise ValueError(f"Invalid filter '{text}'; expected field<op>value with op one of >= <= > < = !=")
+    return m.group(1), m.group(2), m.group(3)
+
+
+def build_facet_index(G):
+    # One scan, so a mapped graph decodes its rows in batches rather than one by one
+    villages = [(n, d) for n, d in G.nodes(data=True) if is_village_node(n)]
+    return FacetIndex([n for n, _ in villages], [d for _, d in villages])
+
+
+_facet_cache = IndexCache(build_facet_index)
+
+
+def facet_index(G):
+    """Columnar facet index over the village nodes of G."""
+    return _facet_cache.get(G)
+
+
+def update_node(G, node):
+    """Refresh one village row after rag_search re-enriches it or fetch_and_add_village adds it."""
+    index = _facet_cache.built(G)
+    if index is None:
+        # Not built yet; the build will include the node
+        return
+    if node in G and is_village_node(node):
+        index.update(node, G.nodes[node])
+    else:
+        index.remove(node)
@@ -0,0 +1,222 @@
+"""Typo-tolerant village name lookup.
+
+Every village is indexed under its name, its name without generic words ("Kutch Villages" ->
+"kutch"), its node id when that is a real name, and any comma-separated ``aliases`` attribute.
+Names are folded first (accents, case, doubled letters, aspirates such as kh/bh, w/v) so
+common transliteration variants compare equal. Candidates share padded character trigrams
+with the query; each is scored by trigram overlap and edit distance, and the best score per
+village is returned.
+"""
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from search_index import IndexCache, is_village_node
+from shared_snapshot import node_fields
+
+FUZZY_MIN_SCORE = float(os.getenv('FUZZY_MIN_SCORE', '0.75'))
+# Trigram candidates verified with edit distance per query
+FUZZY_CANDIDATES = int(os.getenv('FUZZY_CANDIDATES', '200'))
+# Queries shorter than this (after folding) only match exactly
+FUZZY_MIN_LENGTH = 4
+GENERIC_WORDS = {'village', 'villages', 'gaon', 'gram', 'the', 'of', 'india'}
+_NODE_ID_RE = re.compile(r'^[A-Z]+_\d+$')
+_FOLDS = [(re.compile(p), r) for p, r in (
+    (r'[^a-z0-9]+', ' '),
+    (r'tch', 'ch'),
+    (r'ph', 'f'),
+    (r'([bcdgjkpt])h+', r'\1'),
+    (r'w', 'v'),
+    (r'q', 'k'),
+    (r'ee', 'i'),
+    (r'oo', 'u'),
+    (r'(.)\1+', r'\1'),
+    (r' +', ' '),
+)]
+
+
+def fold(text):
+    """Normalized spelling used for matching: 'Mawlynnong' and 'mawlynong' fold alike."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    for pattern, repl in _FOLDS:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+
+def strip_generic(text):
+    return ' '.join(w for w in str(text).split() if w.lower() not in GENERIC_WORDS)
+
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance, giving up (returning limit + 1) once it must exceed limit."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if limit is not None and min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def similarity(a, b):
+    """0..1 blend of trigram Dice overlap and normalized edit distance between folded keys."""
+    if a == b:
+        return 1.0
+    ga, gb = trigrams(a), trigrams(b)
+    dice = 2 * len(ga & gb) / (len(ga) + len(gb))
+    longest = max(len(a), len(b))
+    return 0.5 * dice + 0.5 * (1 - edit_distance(a, b) / longest)
+
+
+def village_names(node, data):
+    """The spellings a village is indexed under."""
+    name = data.get('village_name') or ''
+    names = [name, strip_generic(name)]
+    if not _NODE_ID_RE.match(str(node)):
+        names.append(str(node))
+    aliases = data.get('aliases') or ''
+    names.extend(aliases if isinstance(aliases, (list, tuple)) else str(aliases).split(','))
+    return [n.strip() for n in dict.fromkeys(names) if n and str(n).strip()]
+
+
+class FuzzyNameIndex:
+    def __init__(self, G):
+        self.keys = []        # key id -> folded spelling (None once removed)
+        self.key_node = []    # key id -> node
+        self.key_name = []    # key id -> spelling as written
+        self.key_grams = []   # key id -> number of distinct trigrams
+        self.node_keys = {}   # node -> [key ids]
+        self.exact = {}       # folded spelling -> set(key ids)
+        self.postings = {}    # trigram -> set(key ids)
+        self._arrays = {}
+        self._lock = threading.RLock()
+        for node, data in node_fields(G, ('village_name', 'aliases')):
+            if is_village_node(node):
+                self._add(node, village_names(node, data))
+
+    def __len__(self):
+        return len(self.node_keys)
+
+    def _add(self, node, names):
+        ids = self.node_keys.setdefault(node, [])
+        for name in names:
+            key = fold(name)
+            if not key:
+                continue
+            kid = len(self.keys)
+            self.keys.append(key)
+            self.key_node.append(node)
+            self.key_name.append(name)
+            grams = trigrams(key)
+            self.key_grams.append(len(grams))
+            ids.append(kid)
+            self.exact.setdefault(key, set()).add(kid)
+            for g in grams:
+                self.postings.setdefault(g, set()).add(kid)
+                self._arrays.pop(g, None)
+
+    def remove(self, node):
+        with self._lock:
+            for kid in self.node_keys.pop(node, ()):
+                key = self.keys[kid]
+                self.exact[key].discard(kid)
+                if not self.exact[key]:
+                    del self.exact[key]
+                for g in trigrams(key):
+                    self.postings[g].discard(kid)
+                    self._arrays.pop(g, None)
+                self.keys[kid] = None
+
+    def update(self, node, names):
+        with self._lock:
+            self.remove(node)
+            self._add(node, names)
+
+    def _posting(self, g):
+        arr = self._arrays.get(g)
+        if arr is None:
+            arr = self._arrays[g] = np.fromiter(self.postings.get(g, ()), dtype=np.int64)
+        return arr
+
+    def search(self, query, k=5, min_score=FUZZY_MIN_SCORE):
+        """[(node, score, matched spelling)] for the k best villages scoring at least min_score."""
+        folded = [q for q in dict.fromkeys((fold(query), fold(strip_generic(query)))) if q]
+        best = {}
+        with self._lock:
+            for q in folded:
+                for kid in self.exact.get(q, ()):
+                    best[self.key_node[kid]] = (1.0, self.key_name[kid])
+                if len(q) < FUZZY_MIN_LENGTH:
+                    continue
+                grams = trigrams(q)
+                arrays = [self._posting(g) for g in grams if g in self.postings]
+                if not arrays:
+                    continue
+                counts = np.bincount(np.concatenate(arrays), minlength=len(self.keys))
+                candidates = np.flatnonzero(counts)
+                if len(candidates) > FUZZY_CANDIDATES:
+                    top = np.argpartition(-counts[candidates], FUZZY_CANDIDATES - 1)[:FUZZY_CANDIDATES]
+                    candidates = candidates[top]
+                for kid in candidates.tolist():
+                    key = self.keys[kid]
+                    if key is None:
+                        continue
+                    node = self.key_node[kid]
+                    floor = max(min_score, best.get(node, (0.0,))[0])
+                    # Shared trigram counts give the Dice term exactly; skip keys that cannot reach
+                    # the floor even with edit distance 0, and bound the distance for the rest
+                    dice = 2 * int(counts[kid]) / (len(grams) + self.key_grams[kid])
+                    longest = max(len(q), len(key))
+                    limit = int(longest * (1 - 2 * floor + dice))
+                    if limit < 0:
+                        continue
+                    distance = edit_distance(q, key, limit)
+                    if distance > limit:
+                        continue
+                    score = 0.5 * dice + 0.5 * (1 - distance / longest)
+                    if score >= floor and (node not in best or score > best[node][0]):
+                        best[node] = (score, self.key_name[kid])
+        ranked = sorted(((n, s, name) for n, (s, name) in best.items()), key=lambda x: (-x[1], str(x[0])))
+        return ranked[:k]
+
+
+_fuzzy_cache = IndexCache(FuzzyNameIndex)
+
+
+def fuzzy_index(G):
+    """Trigram name index over the village nodes of G."""
+    return _fuzzy_cache.get(G)
+
+
+def fuzzy_search(G, query, k=5, min_score=FUZZY_MIN_SCORE):
+    """[(node, score)] for villages whose name or alias is a close spelling of query."""
+    # The index may already list nodes of a newer version of G
+    return [(node, score) for node, score, _ in fuzzy_index(G).search(query, k=k, min_score=min_score) if node in G]
+
+
+def update_node(G, node):
+    """Re-index one village's spellings after it was added or changed."""
+    index = _fuzzy_cache.built(G)
+    if index is None:
+        # Not built yet; the build will include the node
+        return
+    if node in G and is_village_node(node):
+        index.update(node, village_names(node, G.nodes[node]))
+    else:
+        index.remove(node)
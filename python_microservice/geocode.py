@@ -0,0 +1,197 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from data_store import DATA_DIR
+from enrichment_cache import SQLiteTTLCache, is_missing, normalize_query
+from http_client import ProviderUnavailable, client
+from logs import get_logger, log_payload
+
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', os.path.join(DATA_DIR, 'geocode_cache.sqlite3'))
+GEOCODE_CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = float(os.getenv('GEOCODE_NEGATIVE_TTL', str(24 * 3600)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '200000'))
+# Reverse lookups are cached per lat/lng cell; 2 decimals is roughly a 1 km cell
+REVERSE_PRECISION = int(os.getenv('GEOCODE_REVERSE_PRECISION', '2'))
+# MapQuest's batch endpoint accepts up to 100 locations per request
+MAPQUEST_BATCH_SIZE = 100
+BULK_WORKERS = int(os.getenv('GEOCODE_BULK_WORKERS', '4'))
+
+log = get_logger('Geocode')
+
+# Base URLs can be pointed at local stand-ins (see bench/)
+MAPQUEST_BASE_URL = os.getenv('MAPQUEST_BASE_URL', 'http://www.mapquestapi.com')
+NOMINATIM_BASE_URL = os.getenv('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org')
+MAPQUEST_ADDRESS_URL = f'{MAPQUEST_BASE_URL}/geocoding/v1/address'
+MAPQUEST_BATCH_URL = f'{MAPQUEST_BASE_URL}/geocoding/v1/batch'
+NOMINATIM_SEARCH_URL = f'{NOMINATIM_BASE_URL}/search'
+NOMINATIM_REVERSE_URL = f'{NOMINATIM_BASE_URL}/reverse'
+NOMINATIM_HEADERS = {'User-Agent': 'village-rag/1.0'}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLiteTTLCache(path=GEOCODE_CACHE_PATH, ttl=GEOCODE_CACHE_TTL,
+                                        negative_ttl=GEOCODE_NEGATIVE_TTL, max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+                                        namespaces=('forward', 'reverse'))
+    return _cache
+
+
+def _mapquest_key():
+    return os.getenv('MAPQUEST_API_KEY')
+
+
+def _state_from_address(addr):
+    # Prefer 'state' but fall back to county/region/state_district
+    return addr.get('state') or addr.get('county') or addr.get('region') or addr.get('state_district') or ''
+
+
+def _nominatim_location(n):
+    """Convert a Nominatim search result to the MapQuest location shape the callers use."""
+    addr = n.get('address', {}) if isinstance(n, dict) else {}
+    return {
+        'latLng': {'lat': float(n.get('lat')), 'lng': float(n.get('lon'))},
+        'adminArea3': _state_from_address(addr),
+        'street': n.get('display_name', ''),
+        'adminArea5': addr.get('city') or addr.get('town') or addr.get('village') or addr.get('municipality') or '',
+        'adminArea4': addr.get('county', ''),
+        'adminArea1': addr.get('country', ''),
+    }
+
+
+def _forward_uncached(place):
+    """Returns (location or None, ok); ok is False when the provider failed rather than found nothing."""
+    key = _mapquest_key()
+    try:
+        if key:
+            resp = client('mapquest').get(MAPQUEST_ADDRESS_URL, params={'key': key, 'location': f'{place}, India'})
+            if resp.status_code != 200:
+                log.warning("HTTP %s from MapQuest API", resp.status_code)
+                log_payload(log, "MapQuest error response", status=resp.status_code, body=resp.text)
+                return None, False
+            locations = resp.json().get('results', [{}])[0].get('locations', [])
+            return (locations[0] if locations else None), True
+        # Nominatim (OpenStreetMap) as a free fallback when there is no MapQuest key
+        resp = client('nominatim').get(NOMINATIM_SEARCH_URL, headers=NOMINATIM_HEADERS,
+                                       params={'q': f'{place}, India', 'format': 'json', 'limit': 1,
+                                               'addressdetails': 1})
+        if resp.status_code != 200:
+            log.warning("HTTP %s from Nominatim", resp.status_code)
+            return None, False
+        data = resp.json()
+        return (_nominatim_location(data[0]) if data else None), True
+    except ProviderUnavailable as e:
+        log.warning("%s", e)
+        return None, False
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        log.warning("Unexpected response for '%s': %s: %s", place, type(e).__name__, e)
+        return None, False
+
+
+def forward_geocode(place):
+    """Location dict (MapQuest shape) for a place name in India, or None. Cached by normalized name."""
+    cache = get_geocode_cache()
+    key = normalize_query(place)
+    cached = cache.get('forward', key)
+    if not is_missing(cached):
+        return cached
+    location, ok = _forward_uncached(place)
+    cache.put('forward', key, location, ok=ok and location is not None)
+    return location
+
+
+def _cell(lat, lng):
+    return f"{round(float(lat), REVERSE_PRECISION)},{round(float(lng), REVERSE_PRECISION)}"
+
+
+def reverse_geocode(lat, lng):
+    """Nominatim address dict for a coordinate, or None. Cached per rounded lat/lng cell."""
+    cache = get_geocode_cache()
+    key = _cell(lat, lng)
+    cached = cache.get('reverse', key)
+    if not is_missing(cached):
+        return cached
+    addr, ok = None, False
+    try:
+        resp = client('nominatim').get(NOMINATIM_REVERSE_URL, headers=NOMINATIM_HEADERS,
+                                       params={'lat': lat, 'lon': lng, 'format': 'json'})
+        if resp.status_code == 200:
+            addr = resp.json().get('address', {})
+            ok = True
+    except ProviderUnavailable as e:
+        log.warning("%s", e)
+    except ValueError:
+        pass
+    cache.put('reverse', key, addr, ok=ok)
+    return addr
+
+
+def reverse_state(lat, lng):
+    addr = reverse_geocode(lat, lng)
+    return _state_from_address(addr) if addr else ''
+
+
+def _mapquest_batch(places, key):
+    """Geocode up to MAPQUEST_BATCH_SIZE places in one request; returns {place: (location, ok)}."""
+    body = {'locations': [f'{p}, India' for p in places], 'options': {'maxResults': 1, 'thumbMaps': False}}
+    try:
+        resp = client('mapquest').post(MAPQUEST_BATCH_URL, params={'key': key}, json=body)
+    except ProviderUnavailable as e:
+        log.warning("%s", e)
+        return {p: (None, False) for p in places}
+    if resp.status_code != 200:
+        log.warning("HTTP %s from MapQuest batch API", resp.status_code)
+        log_payload(log, "MapQuest batch error response", status=resp.status_code, body=resp.text)
+        return {p: (None, False) for p in places}
+    results = resp.json().get('results', [])
+    out = {}
+    for place, result in zip(places, results):
+        locations = result.get('locations', [])
+        out[place] = (locations[0] if locations else None, True)
+    for place in places[len(results):]:
+        out[place] = (None, False)
+    return out
+
+
+def bulk_geocode(places, workers=BULK_WORKERS):
+    """Geocode many place names; returns {place: location or None}.
+
+    Names are de-duplicated after normalization and answered from the cache first. Misses go to
+    MapQuest's batch endpoint when a key is set, otherwise to Nominatim one at a time (its
+    rate limiter enforces the 1 request/second policy).
+    """
+    cache = get_geocode_cache()
+    by_key = {}
+    for place in places:
+        if place:
+            by_key.setdefault(normalize_query(place), place)
+    found = {}
+    misses = []
+    for key, place in by_key.items():
+        cached = cache.get('forward', key)
+        if is_missing(cached):
+            misses.append(place)
+        else:
+            found[key] = cached
+    if misses:
+        log.info("%d of %d places cached; geocoding %d", len(by_key) - len(misses), len(by_key), len(misses))
+        api_key = _mapquest_key()
+        if api_key:
+            chunks = [misses[i:i + MAPQUEST_BATCH_SIZE] for i in range(0, len(misses), MAPQUEST_BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                batches = list(pool.map(lambda c: _mapquest_batch(c, api_key), chunks))
+            fetched = {p: r for batch in batches for p, r in batch.items()}
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                fetched = dict(zip(misses, pool.map(_forward_uncached, misses)))
+        for place, (location, ok) in fetched.items():
+            key = normalize_query(place)
+            cache.put('forward', key, location, ok=ok and location is not None)
+            found[key] = location
+    return {place: found.get(normalize_query(place)) for place in places if place}
@@ -0,0 +1,371 @@
+"""Compiled binary snapshot of the village knowledge graph.
+
+Layout: 8-byte magic, uint64 header length, JSON header, then 8-byte aligned arrays:
+
+- a string table (``str_offsets`` int64, ``str_data`` utf-8 bytes) interning every node id and
+  string attribute value,
+- CSR adjacency (``indptr`` int64, ``indices`` int32; undirected edges stored in both directions),
+- one typed column per node/edge attribute (string ids, float64, int64 or int8 booleans, with
+  -1 / NaN / a presence mask for missing values; lists and dicts are stored as JSON strings).
+
+A records snapshot (``.vkr``, header ``kind: records``) holds a list of dicts, such as
+merged_villages.json, as the same kind of columns with the ``row:`` prefix and no adjacency.
+
+The arrays are read zero-copy from a bytes buffer or an mmap, and single rows can be decoded
+without touching the rest of the file. GraphML stays the interchange format; convert with
+``python graph_snapshot.py in.graphml [out.vkg]`` (or a ``.json`` list into a ``.vkr``).
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+import networkx as nx
+import numpy as np
+
+from logs import get_logger
+
+MAGIC = b'VKGSNAP1'
+# 2 added JSON columns and records snapshots; version 1 files are still readable
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+SNAPSHOT_EXT = '.vkg'
+RECORDS_EXT = '.vkr'
+_ALIGN = 8
+
+
+def snapshot_path_for(graphml_path):
+    return os.path.splitext(graphml_path)[0] + SNAPSHOT_EXT
+
+
+def records_path_for(json_path):
+    return os.path.splitext(json_path)[0] + RECORDS_EXT
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def arrays(self):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        if encoded:
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return offsets, np.frombuffer(b''.join(encoded), dtype='uint8')
+
+
+def _column_kind(values):
+    """Column type for values; mixed columns are stored as JSON so every value keeps its type."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return 'str'
+    if any(isinstance(v, (list, dict)) for v in present):
+        return 'json'
+    if all(isinstance(v, bool) for v in present):
+        return 'bool'
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return 'int'
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return 'float'
+    if not all(isinstance(v, str) for v in present):
+        return 'json'
+    return 'str'
+
+
+def _encode_column(values, strings):
+    """Returns (kind, {suffix: array}) for one attribute column."""
+    kind = _column_kind(values)
+    if kind == 'json':
+        return kind, {'': np.array([-1 if v is None else strings.intern(json.dumps(v, ensure_ascii=False, default=str))
+                                    for v in values], dtype='int32')}
+    if kind == 'str':
+        return kind, {'': np.array([-1 if v is None else strings.intern(str(v)) for v in values], dtype='int32')}
+    if kind == 'float':
+        return kind, {'': np.array([math.nan if v is None else float(v) for v in values], dtype='float64')}
+    if kind == 'int':
+        return kind, {
+            '': np.array([0 if v is None else v for v in values], dtype='int64'),
+            '.present': np.array([v is not None for v in values], dtype='uint8'),
+        }
+    return kind, {'': np.array([-1 if v is None else int(v) for v in values], dtype='int8')}
+
+
+def write_snapshot(G, path):
+    """Compile G into a snapshot file at path (written to a temp file and renamed into place)."""
+    strings = _StringTable()
+    nodes = list(G.nodes)
+    node_pos = {n: i for i, n in enumerate(nodes)}
+    node_ids = np.array([strings.intern(str(n)) for n in nodes], dtype='int32')
+
+    indptr = np.zeros(len(nodes) + 1, dtype='int64')
+    indices, edge_rows = [], []
+    for i, n in enumerate(nodes):
+        for nbr, attrs in G.adj[n].items():
+            indices.append(node_pos[nbr])
+            edge_rows.append(attrs)
+        indptr[i + 1] = len(indices)
+    arrays = {
+        'node_ids': node_ids,
+        'indptr': indptr,
+        'indices': np.array(indices, dtype='int32'),
+    }
+    columns = {'node': {}, 'edge': {}}
+    node_rows = [G.nodes[n] for n in nodes]
+    node_attrs = sorted({k for d in node_rows for k in d})
+    for key in node_attrs:
+        kind, cols = _encode_column([d.get(key) for d in node_rows], strings)
+        columns['node'][key] = kind
+        for suffix, arr in cols.items():
+            arrays[f'node:{key}{suffix}'] = arr
+    edge_attrs = sorted({k for attrs in edge_rows for k in attrs})
+    for key in edge_attrs:
+        kind, cols = _encode_column([attrs.get(key) for attrs in edge_rows], strings)
+        columns['edge'][key] = kind
+        for suffix, arr in cols.items():
+            arrays[f'edge:{key}{suffix}'] = arr
+    arrays['str_offsets'], arrays['str_data'] = strings.arrays()
+    _write_file(path, {
+        'directed': G.is_directed(),
+        'graph': dict(G.graph),
+        'n_nodes': len(nodes),
+        'n_edges': G.number_of_edges(),
+        'columns': columns,
+    }, arrays)
+
+
+def write_records_snapshot(records, path):
+    """Compile a list of dicts (e.g. merged_villages.json) into a records snapshot at path."""
+    strings = _StringTable()
+    rows = [r for r in records if isinstance(r, dict)]
+    arrays, columns = {}, {'row': {}}
+    # Columns in first-seen order, so decoded records keep their field order
+    for key in dict.fromkeys(k for r in rows for k in r):
+        kind, cols = _encode_column([r.get(key) for r in rows], strings)
+        columns['row'][key] = kind
+        # JSON null is kept apart from a missing key so records round-trip exactly
+        nulls = [key in r and r[key] is None for r in rows]
+        if any(nulls):
+            cols['.null'] = np.array(nulls, dtype='uint8')
+        for suffix, arr in cols.items():
+            arrays[f'row:{key}{suffix}'] = arr
+    arrays['str_offsets'], arrays['str_data'] = strings.arrays()
+    _write_file(path, {'kind': 'records', 'n_rows': len(rows), 'columns': columns}, arrays)
+
+
+def _write_file(path, header, arrays):
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        layout[name] = {'offset': offset, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+        offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({'format': FORMAT_VERSION, **header, 'arrays': layout}, ensure_ascii=False).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % _ALIGN)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            data = np.ascontiguousarray(arr).tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % _ALIGN))
+    os.replace(tmp, path)
+
+
+class GraphSnapshot:
+    """Read-only view over a graph or records snapshot buffer; arrays are zero-copy numpy views."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a village graph snapshot')
+        (header_len,) = struct.unpack_from('<Q', buf, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(buf[start:start + header_len]).decode('utf-8'))
+        if self.header.get('format') not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported snapshot format {self.header.get('format')}")
+        base = start + header_len
+        self.arrays = {}
+        for name, spec in self.header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            self.arrays[name] = np.frombuffer(buf, dtype=dtype, count=count, offset=base + spec['offset'])
+        # Strings are sliced straight out of buf, which is cheaper than going through numpy
+        self._str_base = base + self.header['arrays']['str_data']['offset'] if 'str_data' in self.arrays else 0
+        self.kind = self.header.get('kind', 'graph')
+        self.n_nodes = self.header.get('n_nodes', 0)
+        self.n_rows = self.header.get('n_rows', 0)
+        self._strings = None
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a snapshot file; pages are shared between processes mapping the same file."""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm)
+
+    def strings(self):
+        """Decode the string table once (the interned values are what attribute columns point at)."""
+        if self._strings is None:
+            offsets = self.arrays['str_offsets']
+            data = self.arrays['str_data'].tobytes()
+            self._strings = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def string(self, i):
+        """One interned string, decoded straight from the buffer."""
+        offsets = self.arrays['str_offsets']
+        return self.buf[self._str_base + int(offsets[i]):self._str_base + int(offsets[i + 1])].decode('utf-8')
+
+    def _lookup(self, ids):
+        """Strings for an array of ids (None for -1), decoding only those needed unless the table already is."""
+        if self._strings is not None:
+            strings = self._strings
+            return [None if i < 0 else strings[i] for i in ids.tolist()]
+        offsets = self.arrays['str_offsets']
+        safe = np.maximum(ids, 0)
+        buf, base = self.buf, self._str_base
+        return [None if i < 0 else buf[base + a:base + b].decode('utf-8')
+                for i, a, b in zip(ids.tolist(), offsets[safe].tolist(), offsets[safe + 1].tolist())]
+
+    def _decode(self, prefix, key, kind, start=0, end=None):
+        col = self.arrays[f'{prefix}:{key}'][start:end]
+        if kind == 'json':
+            return [None if s is None else json.loads(s) for s in self._lookup(col)]
+        if kind == 'str':
+            return self._lookup(col)
+        if kind == 'float':
+            return [None if math.isnan(v) else v for v in col.tolist()]
+        if kind == 'int':
+            present = self.arrays[f'{prefix}:{key}.present'][start:end].tolist()
+            return [v if p else None for v, p in zip(col.tolist(), present)]
+        return [None if v < 0 else bool(v) for v in col.tolist()]
+
+    def column(self, prefix, key):
+        """A whole attribute column as Python values (None where missing)."""
+        kind = self.header['columns'][prefix].get(key)
+        return [None] * (self.n_rows if prefix == 'row' else self.n_nodes) if kind is None \
+            else self._decode(prefix, key, kind)
+
+    def rows(self, prefix, start, end, keys=None):
+        """row() for positions start..end-1 (only the given keys, if any), decoded a column at a time."""
+        columns = self.header['columns'][prefix]
+        out = [{} for _ in range(start, end)]
+        for key in columns if keys is None else keys:
+            kind = columns.get(key)
+            if kind is None:
+                continue
+            nulls = self.arrays.get(f'{prefix}:{key}.null')
+            nulls = nulls[start:end].tolist() if nulls is not None else None
+            for i, v in enumerate(self._decode(prefix, key, kind, start, end)):
+                if v is not None:
+                    out[i][key] = v
+                elif nulls is not None and nulls[i]:
+                    out[i][key] = None
+        return out
+
+    def row(self, prefix, i):
+        """Attributes of one node / edge / record position as a new dict, omitting missing values."""
+        out = {}
+        for key, kind in self.header['columns'][prefix].items():
+            v = self.arrays[f'{prefix}:{key}'][i]
+            if kind in ('str', 'json'):
+                if v >= 0:
+                    out[key] = self.string(int(v)) if kind == 'str' else json.loads(self.string(int(v)))
+            elif kind == 'float':
+                if not math.isnan(v):
+                    out[key] = float(v)
+            elif kind == 'int':
+                if self.arrays[f'{prefix}:{key}.present'][i]:
+                    out[key] = int(v)
+            elif v >= 0:
+                out[key] = bool(v)
+            if key not in out and self._is_null(prefix, key, i):
+                out[key] = None
+        return out
+
+    def _is_null(self, prefix, key, i):
+        nulls = self.arrays.get(f'{prefix}:{key}.null')
+        return nulls is not None and bool(nulls[i])
+
+    def node_ids(self):
+        return self._lookup(self.arrays['node_ids'])
+
+    def to_records(self):
+        self.strings()
+        cols = [(k, self._decode('row', k, kind)) for k, kind in self.header['columns']['row'].items()]
+        return [{k: col[i] for k, col in cols if col[i] is not None or self._is_null('row', k, i)}
+                for i in range(self.n_rows)]
+
+    def to_networkx(self):
+        G = nx.DiGraph() if self.header['directed'] else nx.Graph()
+        G.graph.update(self.header.get('graph', {}))
+        # A full load touches most strings, so decode the table in one pass
+        self.strings()
+        nodes = self.node_ids()
+        node_cols = [(k, self._decode('node', k, kind)) for k, kind in self.header['columns']['node'].items()]
+        for i, n in enumerate(nodes):
+            G.add_node(n, **{k: col[i] for k, col in node_cols if col[i] is not None})
+        indptr = self.arrays['indptr'].tolist()
+        indices = self.arrays['indices'].tolist()
+        edge_cols = [(k, self._decode('edge', k, kind)) for k, kind in self.header['columns']['edge'].items()]
+        directed = self.header['directed']
+        for i, u in enumerate(nodes):
+            for e in range(indptr[i], indptr[i + 1]):
+                j = indices[e]
+                if not directed and j < i:
+                    continue  # already added from the other endpoint
+                G.add_edge(u, nodes[j], **{k: col[e] for k, col in edge_cols if col[e] is not None})
+        return G
+
+
+def load_snapshot(raw):
+    """Build a networkx graph from snapshot bytes."""
+    return GraphSnapshot(raw).to_networkx()
+
+
+def load_records(raw):
+    """Build the list of dicts from records snapshot bytes."""
+    return GraphSnapshot(raw).to_records()
+
+
+def convert(graphml_path, snapshot_path=None):
+    snapshot_path = snapshot_path or snapshot_path_for(graphml_path)
+    G = nx.read_graphml(graphml_path)
+    write_snapshot(G, snapshot_path)
+    return snapshot_path, G
+
+
+def convert_records(json_path, snapshot_path=None):
+    snapshot_path = snapshot_path or records_path_for(json_path)
+    with open(json_path, encoding='utf-8') as f:
+        records = json.load(f)
+    write_records_snapshot(records, snapshot_path)
+    return snapshot_path, records
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('Usage: python graph_snapshot.py <graph.graphml | records.json> [out]')
+    log = get_logger('Snapshot')
+    if sys.argv[1].endswith('.json'):
+        out, records = convert_records(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        log.info("Wrote %s: %d records", out, len(records))
+    else:
+        out, G = convert(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        log.info("Wrote %s: %d nodes, %d edges", out, G.number_of_nodes(), G.number_of_edges())
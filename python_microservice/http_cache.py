@@ -0,0 +1,173 @@
+"""Validators, conditional GETs and pre-compressed bodies for the read-only endpoints.
+
+Bodies are built once per (resource, dataset version) and kept with their ETag and
+gzip/brotli encodings, so a poll that hits the cache costs a dict lookup, and an unchanged
+resource is answered with 304.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import Response  # type: ignore
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional: gzip only
+    brotli = None
+
+HTTP_CACHE_ENTRIES = int(os.getenv('HTTP_CACHE_ENTRIES', '128'))
+# Bytes of bodies and their encodings kept in all; a body bigger than this is served uncached
+HTTP_CACHE_BYTES = int(os.getenv('HTTP_CACHE_BYTES', str(128 * 1024 * 1024)))
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv('HTTP_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('HTTP_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('HTTP_BROTLI_QUALITY', '5'))
+
+
+class CachedBody:
+    def __init__(self, body, media_type, modified, headers=None):
+        self.body = body
+        self.media_type = media_type
+        self.modified = int(modified)
+        self.headers = headers or {}
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """The body in encoding ('br', 'gzip' or 'identity'), compressed once and kept."""
+        if encoding == 'identity':
+            return self.body
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == 'br':
+                    data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                self._encoded[encoding] = data
+            return data
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(d) for d in list(self._encoded.values()))
+
+
+def choose_encoding(accept_encoding, size):
+    if size < COMPRESS_MIN_BYTES or not accept_encoding:
+        return 'identity'
+    offered = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    if brotli is not None and offered.get('br', 0) > 0:
+        return 'br'
+    if offered.get('gzip', 0) > 0:
+        return 'gzip'
+    return 'identity'
+
+
+def not_modified(request, entry):
+    """RFC 7232: If-None-Match wins over If-Modified-Since."""
+    inm = request.headers.get('if-none-match')
+    if inm is not None:
+        tags = {t.strip().removeprefix('W/') for t in inm.split(',')}
+        return '*' in tags or entry.etag in tags
+    ims = request.headers.get('if-modified-since')
+    if ims:
+        try:
+            return entry.modified <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class ResponseCache:
+    """LRU of CachedBody keyed by (resource key, dataset version), bounded in entries and bytes.
+
+    Resource keys are tuples naming their dataset first; storing a body for a new version
+    of a dataset drops the bodies cached for its older versions.
+    """
+
+    def __init__(self, maxsize=HTTP_CACHE_ENTRIES, maxbytes=HTTP_CACHE_BYTES):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def entry(self, key, version, build, media_type, modified):
+        cache_key = (key, version)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        body, headers = build()
+        entry = CachedBody(body, media_type, modified, headers)
+        if len(body) > self.maxbytes:
+            return entry
+        with self._lock:
+            for k, v in list(self._entries):
+                if k[0] == key[0] and v < version:
+                    del self._entries[(k, v)]
+            self._entries[cache_key] = entry
+            self._trim()
+        return entry
+
+    def _trim(self):
+        """Evict least recently used entries until both bounds hold (with self._lock held)."""
+        total = sum(e.size for e in self._entries.values())
+        while self._entries and (len(self._entries) > self.maxsize or total > self.maxbytes):
+            total -= self._entries.popitem(last=False)[1].size
+
+    def respond(self, request, key, version, build, media_type='application/json', modified=None):
+        """Response for a cacheable resource; build() returns (body bytes, extra headers)."""
+        entry = self.entry(key, version, build, media_type, modified or 0)
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            **entry.headers,
+        }
+        if entry.modified:
+            headers['Last-Modified'] = formatdate(entry.modified, usegmt=True)
+        if not_modified(request, entry):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        encoding = choose_encoding(request.headers.get('accept-encoding'), len(entry.body))
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        known = encoding == 'identity' or encoding in entry._encoded
+        content = entry.encoded(encoding)
+        if not known:
+            # The new encoding counts towards the byte budget too
+            with self._lock:
+                self._trim()
+        return Response(content=content, media_type=entry.media_type, headers=headers)
+
+    def snapshot(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': sum(e.size for e in self._entries.values()),
+                    'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache():
+    return _cache
@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logs import get_logger
+from metrics import PROVIDER_ERRORS, PROVIDER_SECONDS, PROVIDER_THROTTLE
+from rate_limit import get_limiter
+
+# Read timeouts (seconds) per provider; override with e.g. GEMINI_TIMEOUT=60
+DEFAULT_TIMEOUTS = {
+    'serpapi': 15.0,
+    'gemini': 30.0,
+    'mapbox': 10.0,
+    'mapquest': 10.0,
+    'nominatim': 10.0,
+}
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '8'))
+POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+log = get_logger('HTTP')
+
+
+class ProviderUnavailable(Exception):
+    """The provider's circuit is open or every attempt failed; callers should use their fallback."""
+
+    def __init__(self, provider, reason):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset` seconds lets one trial call through."""
+
+    def __init__(self, threshold=CIRCUIT_THRESHOLD, reset=CIRCUIT_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class ProviderClient:
+    """Keep-alive session, timeouts, retries and circuit breaker for one external provider."""
+
+    def __init__(self, name):
+        self.name = name
+        self.timeout = (CONNECT_TIMEOUT,
+                        float(os.getenv(f'{name.upper()}_TIMEOUT', DEFAULT_TIMEOUTS.get(name, 10.0))))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker()
+        self.limiter = get_limiter(name)
+
+    def _backoff(self, attempt, resp=None):
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        # Full jitter: spread retries out so concurrent callers don't stampede the provider
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    def request(self, method, url, **kwargs):
+        """Send a request and return the final Response (which may still be a 4xx).
+
+        Raises ProviderUnavailable when the circuit is open or retries are exhausted.
+        """
+        if not self.breaker.allow():
+            PROVIDER_ERRORS.inc(provider=self.name, reason='circuit_open')
+            raise ProviderUnavailable(self.name, 'circuit open')
+        kwargs.setdefault('timeout', self.timeout)
+        last_error = None
+        ok = False
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                waited = time.perf_counter()
+                self.limiter.acquire()
+                started = time.perf_counter()
+                PROVIDER_THROTTLE.inc(started - waited, provider=self.name)
+                resp = None
+                try:
+                    resp = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    last_error = f'{type(e).__name__}: {e}'
+                    outcome = 'timeout' if isinstance(e, requests.Timeout) else 'connection_error'
+                    PROVIDER_SECONDS.observe(time.perf_counter() - started, provider=self.name, outcome=outcome)
+                    PROVIDER_ERRORS.inc(provider=self.name, reason=outcome)
+                else:
+                    outcome = f'{resp.status_code // 100}xx'
+                    PROVIDER_SECONDS.observe(time.perf_counter() - started, provider=self.name, outcome=outcome)
+                    if resp.status_code >= 400:
+                        PROVIDER_ERRORS.inc(provider=self.name, reason=str(resp.status_code))
+                    if resp.status_code not in RETRY_STATUSES:
+                        ok = True
+                        return resp
+                    last_error = f'HTTP {resp.status_code}'
+                if attempt < MAX_RETRIES:
+                    delay = self._backoff(attempt, resp)
+                    log.warning("%s %s; retry %d/%d in %.1fs", self.name, last_error, attempt + 1, MAX_RETRIES, delay)
+                    time.sleep(delay)
+            raise ProviderUnavailable(self.name, last_error)
+        finally:
+            # Settled however the attempts end (an unexpected error counts as a failure),
+            # so a half-open trial is never left taken
+            if ok:
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(provider):
+    c = _clients.get(provider)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(provider)
+            if c is None:
+                c = ProviderClient(provider)
+                _clients[provider] = c
+    return c
+
+
+def breaker_states():
+    return {name: {'state': c.breaker.state, 'failures': c.breaker.failures} for name, c in _clients.items()}
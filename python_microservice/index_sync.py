@@ -0,0 +1,35 @@
+"""Carry this worker's search indexes over to each new version of the villages and the graph.
+
+The store never changes a served value: it applies logged changes (this worker's or another
+process's) to a copy and publishes that (TrackedFile._tail). Before it does, these listeners
+hand every index built for the old version to the new one and update it per changed record
+or node, instead of letting each index rebuild from scratch.
+"""
+import facets
+import fuzzy
+import recommend
+import spatial_index as spatial
+import vector_index
+from search_index import advance_indexes, invalidate_villages_index, update_graph_node, update_village_record
+
+
+def sync_village_records(old, villages, touched):
+    """touched: [(village key, list position or None if removed)]."""
+    if any(pos is None for _, pos in touched):
+        # villages_index uses list positions, which removal shifts
+        invalidate_villages_index()
+        return
+    advance_indexes(old, villages)
+    for _, pos in touched:
+        update_village_record(villages, pos)
+
+
+def sync_graph_nodes(old, G, nodes):
+    advance_indexes(old, G)
+    for node in nodes:
+        update_graph_node(G, node)
+        spatial.update_node(G, node)
+        facets.update_node(G, node)
+        fuzzy.update_node(G, node)
+        recommend.update_node(G, node)
+    vector_index.advance(old, G, nodes)
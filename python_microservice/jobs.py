@@ -0,0 +1,297 @@
+import contextlib
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from data_store import BASE_DIR, DATA_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-run guard only covers this process
+    fcntl = None
+
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(DATA_DIR, 'jobs'))
+PIPELINE_COMMAND = [sys.executable, '-u', os.path.join('scripts', 'run_pipeline.py')]
+# Seconds to wait after SIGTERM before killing a cancelled job
+CANCEL_GRACE = float(os.getenv('JOB_CANCEL_GRACE', '10'))
+
+ACTIVE_STATES = ('queued', 'running')
+JOB_ID = re.compile(r'[\w-]+')
+
+
+class JobConflict(Exception):
+    """Raised when a job is submitted while another one is still active."""
+
+    def __init__(self, job):
+        super().__init__(f"Job {job['id']} is already {job['status']}")
+        self.job = job
+
+
+class JobManager:
+    """Runs one pipeline subprocess at a time across every worker sharing JOBS_DIR.
+
+    Job metadata and logs live under JOBS_DIR and are read from there, so any worker can
+    report, stream or cancel any job. The worker that started a job holds an flock on
+    JOBS_DIR/active.lock until the job ends; a job still recorded as active while nobody
+    holds that lock lost its worker (restart or crash) and is marked failed.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, command=PIPELINE_COMMAND, cwd=BASE_DIR):
+        self.jobs_dir = jobs_dir
+        self.command = command
+        self.cwd = cwd
+        # Pipeline processes started by this worker
+        self._procs = {}
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def log_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.log')
+
+    @contextlib.contextmanager
+    def _guard(self):
+        """Serialises job state changes and orphan checks across threads and worker processes."""
+        with self._lock, open(os.path.join(self.jobs_dir, 'jobs.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _claim(self):
+        """Open and lock active.lock for a new job; None while another job holds it."""
+        f = open(os.path.join(self.jobs_dir, 'active.lock'), 'a')
+        if fcntl is None:
+            if self._procs:
+                f.close()
+                return None
+            return f
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    @staticmethod
+    def _release(claim):
+        if fcntl is not None:
+            fcntl.flock(claim, fcntl.LOCK_UN)
+        claim.close()
+
+    def _read(self, job_id):
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._meta_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_all(self):
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = self._read(name[:-len('.json')])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _settle(self, job):
+        """Mark job failed if it is recorded as active but no worker is running it any more."""
+        if job['status'] not in ACTIVE_STATES or job['id'] in self._procs:
+            return job
+        claim = self._claim()
+        if claim is None:
+            return job
+        self._release(claim)
+        return self._interrupted(job)
+
+    def _interrupted(self, job):
+        # The process belonged to a worker that has exited and can't be tracked any more
+        job['status'] = 'failed'
+        job['error'] = 'Interrupted by service restart'
+        job['finished'] = job.get('finished') or time.time()
+        self._save(job)
+        return job
+
+    def _save(self, job):
+        tmp = f"{self._meta_path(job['id'])}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp, self._meta_path(job['id']))
+
+    def active(self):
+        with self._guard():
+            return self._active()
+
+    def _active(self):
+        for job in self._read_all():
+            if self._settle(job)['status'] in ACTIVE_STATES:
+                return job
+        return None
+
+    def submit(self):
+        with self._guard():
+            claim = self._claim()
+            if claim is None:
+                raise JobConflict(self._active() or {'id': None, 'status': 'running'})
+            for orphan in self._read_all():
+                # Nobody held the lock, so anything still marked active lost its worker
+                if orphan['status'] in ACTIVE_STATES:
+                    self._interrupted(orphan)
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            job = {
+                'id': job_id,
+                'command': self.command,
+                'status': 'queued',
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'returncode': None,
+                'error': None,
+            }
+            self._save(job)
+            log = open(self.log_path(job_id), 'wb')
+            try:
+                proc = subprocess.Popen(self.command, cwd=self.cwd, stdout=log, stderr=subprocess.STDOUT,
+                                        env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+            except OSError as e:
+                log.close()
+                job.update(status='failed', error=str(e), finished=time.time())
+                self._save(job)
+                self._release(claim)
+                return dict(job)
+            job.update(status='running', started=time.time(), pid=proc.pid)
+            self._procs[job_id] = proc
+            self._save(job)
+        threading.Thread(target=self._watch, args=(job_id, proc, log, claim), daemon=True).start()
+        return dict(job)
+
+    def _watch(self, job_id, proc, log, claim):
+        returncode = proc.wait()
+        log.close()
+        with self._guard():
+            try:
+                self._procs.pop(job_id, None)
+                # Re-read: another worker may have cancelled the job meanwhile
+                job = self._read(job_id)
+                if job is None:
+                    return
+                if job['status'] != 'cancelled':
+                    job['status'] = 'succeeded' if returncode == 0 else 'failed'
+                job['returncode'] = returncode
+                job['finished'] = time.time()
+                self._save(job)
+            finally:
+                self._release(claim)
+
+    def cancel(self, job_id):
+        with self._guard():
+            job = self._read(job_id)
+            if job is None:
+                return None
+            job = self._settle(job)
+            proc = self._procs.get(job_id)
+            pid = job.get('pid')
+            if job['status'] not in ACTIVE_STATES or (proc is None and not pid):
+                return dict(job)
+            job['status'] = 'cancelled'
+            self._save(job)
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=CANCEL_GRACE)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        else:
+            # Started by another worker: signal the process and wait for that worker to record the end
+            self._signal(pid, signal.SIGTERM)
+            deadline = time.monotonic() + CANCEL_GRACE
+            while not self._finished(job_id) and time.monotonic() < deadline:
+                time.sleep(0.2)
+            if not self._finished(job_id):
+                self._signal(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        return self.get(job_id)
+
+    def _finished(self, job_id):
+        job = self._read(job_id)
+        return job is None or bool(job.get('finished'))
+
+    @staticmethod
+    def _signal(pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass
+
+    def get(self, job_id):
+        with self._guard():
+            job = self._read(job_id)
+            if job is None:
+                return None
+            job = self._settle(job)
+        job['progress'] = self._last_progress(job_id)
+        return job
+
+    def list(self, limit=20):
+        with self._guard():
+            jobs = [self._settle(j) for j in self._read_all()]
+        jobs.sort(key=lambda j: j['created'], reverse=True)
+        return jobs[:limit]
+
+    def _last_progress(self, job_id, tail_bytes=8192):
+        """Latest `[Progress]` line the pipeline printed, read from the end of the log."""
+        path = self.log_path(job_id)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - tail_bytes))
+                tail = f.read().decode('utf-8', errors='replace')
+        except OSError:
+            return None
+        for line in reversed(tail.splitlines()):
+            if line.startswith('[Progress]'):
+                return line
+        return None
+
+    def read_log(self, job_id, offset=0, max_bytes=65536):
+        """Log bytes from offset; callers poll again with the returned offset.
+
+        A job that has not started yet (or whose log was cleaned up) reads as an empty log.
+        """
+        try:
+            with open(self.log_path(job_id), 'rb') as f:
+                f.seek(offset)
+                data = f.read(max_bytes)
+        except FileNotFoundError:
+            return b'', offset
+        return data, offset + len(data)
+
+    def is_active(self, job_id):
+        job = self.get(job_id)
+        return bool(job and job['status'] in ACTIVE_STATES)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
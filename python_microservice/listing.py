@@ -0,0 +1,126 @@
+"""Paging, sorting and field projection over the village records for list endpoints."""
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right
+
+# Records per chunk when streaming NDJSON
+STREAM_CHUNK = 500
+
+
+def parse_fields(fields):
+    """'a, b,c' -> ['a', 'b', 'c']; None/empty means every field."""
+    if not fields:
+        return None
+    out = [f.strip() for f in fields.split(',') if f.strip()]
+    return out or None
+
+
+def project(record, fields):
+    if fields is None:
+        return record
+    return {f: record[f] for f in fields if f in record}
+
+
+def parse_sort(sort):
+    """'field' sorts ascending, '-field' descending. Returns (field, desc) or (None, False)."""
+    if not sort:
+        return None, False
+    sort = sort.strip()
+    if sort.startswith('-'):
+        return sort[1:], True
+    return sort.lstrip('+'), False
+
+
+def _sort_value(value, desc):
+    # Numbers before strings; missing values last in either direction
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return (0, float(value))
+    if isinstance(value, str) and value:
+        return (1, value.lower())
+    return (-1, '') if desc else (2, '')
+
+
+class SortedViews:
+    """Sorted (key, position) lists per (field, direction), rebuilt when the dataset version changes."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def get(self, records, version, field, desc):
+        cache_key = (field, desc)
+        cached = self._views.get(cache_key)
+        if cached is not None and cached[0] == version and cached[1] is records:
+            return cached[2]
+        if hasattr(records, 'column'):
+            # Mapped records read just this field rather than decoding every record
+            values = records.column(field)
+        else:
+            values = [r.get(field) if isinstance(r, dict) else None for r in records]
+        keys = sorted((_sort_value(v, desc), i) for i, v in enumerate(values))
+        with self._lock:
+            self._views[cache_key] = (version, records, keys)
+        return keys
+
+
+_views = SortedViews()
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def page(records, version, limit=None, offset=0, cursor=None, sort=None):
+    """Select one page of record positions.
+
+    Returns (positions, next_cursor). Without a sort the catalog order is used. Cursors are
+    keyset cursors (last sort key and position), so pages stay consistent while records are added.
+    """
+    field, desc = parse_sort(sort)
+    state = decode_cursor(cursor) if cursor else None
+    if state is not None and state.get('s') != sort:
+        raise ValueError('Cursor was issued for a different sort order')
+
+    if field is None:
+        start = state['i'] + 1 if state is not None else offset
+        end = len(records) if limit is None else min(len(records), start + limit)
+        positions = list(range(start, end))
+        more = end < len(records)
+        last = {'s': sort, 'i': positions[-1]} if positions and more else None
+        return positions, (encode_cursor(last) if last else None)
+
+    keys = _views.get(records, version, field, desc)
+    if state is not None:
+        mark = (tuple(state['k']), state['i'])
+        # Descending pages walk the ascending key list backwards from the mark
+        start = len(keys) - bisect_left(keys, mark) if desc else bisect_right(keys, mark)
+    else:
+        start = offset
+    end = len(keys) if limit is None else min(len(keys), start + limit)
+    ordered = (keys[len(keys) - 1 - n] for n in range(start, end)) if desc else (keys[n] for n in range(start, end))
+    chosen = list(ordered)
+    next_cursor = None
+    if chosen and end < len(keys):
+        k, i = chosen[-1]
+        next_cursor = encode_cursor({'s': sort, 'k': list(k), 'i': i})
+    return [i for _, i in chosen], next_cursor
+
+
+def ndjson_chunks(records, positions, fields):
+    """Yield NDJSON bytes in chunks of STREAM_CHUNK records."""
+    for n in range(0, len(positions), STREAM_CHUNK):
+        lines = [json.dumps(project(records[i], fields), ensure_ascii=False)
+                 for i in positions[n:n + STREAM_CHUNK]]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
@@ -0,0 +1,81 @@
+"""Levelled, optionally JSON-structured logging, with sampling for payload dumps.
+
+``LOG_LEVEL`` (default ``INFO``) sets the threshold and ``LOG_FORMAT=json`` switches to one
+JSON object per line. Prompt and response bodies are logged at DEBUG through log_payload(),
+and only for a ``LOG_PAYLOAD_SAMPLE`` share of calls, so they cost nothing on the hot path
+unless asked for.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Share of payload dumps actually written once DEBUG is on (1 = all)
+PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE', '0.1'))
+PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {'ts': round(record.created, 3), 'level': record.levelname.lower(),
+               'logger': record.name.rpartition('.')[2], 'msg': record.getMessage()}
+        out.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    """The service's usual '[Tag] message' lines, with structured fields appended as key=value."""
+
+    def format(self, record):
+        line = f"[{record.name.rpartition('.')[2]}] {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ''.join(f' {k}={v}' if '\n' not in str(v) else f'\n{k}:\n{v}' for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JsonFormatter() if LOG_FORMAT == 'json' else _TextFormatter())
+        root = logging.getLogger('village')
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(tag):
+    """Logger whose text lines are prefixed with [tag], like the service's print output."""
+    _configure()
+    return logging.getLogger(f'village.{tag}')
+
+
+def sampled(rate=None):
+    rate = PAYLOAD_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _truncate(value):
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= PAYLOAD_MAX_CHARS else text[:PAYLOAD_MAX_CHARS] + '...'
+
+
+def log_payload(logger, msg, **payloads):
+    """DEBUG-level dump of request/response bodies for a sample of calls; free when DEBUG is off."""
+    if logger.isEnabledFor(logging.DEBUG) and sampled():
+        logger.debug(msg, extra={'fields': {k: _truncate(v) for k, v in payloads.items()}})
@@ -1,19 +1,66 @@
 from fastapi import FastAPI, Query, HTTPException  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore
+from fastapi.concurrency import run_in_threadpool  # type: ignore
+from fastapi.responses import JSONResponse, Response, StreamingResponse  # type: ignore
 from pydantic import BaseModel  # type: ignore
-from typing import List
+from typing import List, Optional
 import uvicorn  # type: ignore
 
 
-from rag_search_with_realtime_update import enrich_from_serpapi_and_gemini
-import subprocess
+from rag_search_with_realtime_update import cached_enrichment, enrich_batch, enrich_from_serpapi_and_gemini, schedule_refresh
+from data_store import get_store
+from dedupe import DEDUPE_MIN_SCORE, graph_rows, merge_store_duplicates, rank_duplicates
+from enrichment_cache import get_cache, normalize_query
+from facets import facet_index, parse_filter
+from fuzzy import FUZZY_MIN_SCORE, fuzzy_index, fuzzy_search
+from geocode import get_geocode_cache
+from http_cache import get_response_cache
+from http_client import breaker_states
+from jobs import JobConflict, get_manager
+from listing import ndjson_chunks, page, parse_fields, project
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REQUEST_SECONDS, register_collector, render as render_metrics
+from recommend import similarity_index
+from refresh_pool import PoolFull, get_refresh_pool
+from search_index import graph_index, villages_index
+from singleflight import FlightTimeout, stats as flight_stats
+from spatial_index import spatial_index
+from subgraph import (DEFAULT_FIELDS, ego_nodes, get_subgraph_cache, linked_villages, node_link,
+                      resolve_feature, resolve_village, state_nodes)
+from vector_index import flush as flush_vectors, semantic_index, semantic_search, semantic_search_many
 import networkx as nx
+import asyncio
+import math
+import threading
+import time
 import json
 import os
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
 app = FastAPI()
+store = get_store()
+
+
+@app.on_event("startup")
+def load_datasets():
+    # Parse every dataset and the knowledge graph once; later requests are served from memory
+    store.load_all()
+    # Loading the embedding model and encoding takes a while; this only starts it in the background
+    semantic_index(store.graph())
+    threading.Thread(target=lambda: similarity_index(store.graph()), daemon=True).start()
+    threading.Thread(target=lambda: fuzzy_index(store.graph()), daemon=True).start()
+    # Name lookups for /search and /api/villages/search, so the first request doesn't build them
+    threading.Thread(target=lambda: graph_index(store.graph()), daemon=True).start()
+    threading.Thread(target=lambda: villages_index(store.villages()), daemon=True).start()
+
+
+@app.on_event("shutdown")
+def flush_datasets():
+    # Finish running background refreshes, then fold logged village/graph changes into the snapshots
+    # and write the vector index's unsaved changes
+    get_refresh_pool().shutdown()
+    store.compact_all()
+    flush_vectors()
 
 from fastapi import Request, Depends  # type: ignore
 
@@ -56,148 +103,641 @@ if not os.environ.get('MICROSERVICE_ALLOWED_ORIGINS'):
         resp.headers.setdefault('Access-Control-Allow-Origin', '*')
         return resp
 
+
+@app.middleware("http")
+async def _record_latency(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        resp = await call_next(request)
+        status = resp.status_code
+        return resp
+    finally:
+        # Label by route template (/api/villages/{village_id}), not the raw path, to bound cardinality
+        route = request.scope.get('route')
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                route=getattr(route, 'path', 'unmatched'), status=status)
+
 class SearchRequest(BaseModel):
     query: str
+    deadline_ms: Optional[int] = None  # shorter latency budget than SEARCH_DEADLINE_SECONDS
 
 class EnrichmentResponse(BaseModel):
     primary_attractions: List[str]
     local_specialties: List[str]
     activities: List[str]
+    stale: bool = False  # served from an old graph record; a refresh is queued
+    pending: bool = False  # enrichment still running past the deadline; retry later
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    deadline_ms: Optional[int] = None
+
+class BatchSearchResult(EnrichmentResponse):
+    query: str
+    source: str  # 'graph', 'spelling', 'semantic', 'enrichment' or 'pending'
+
+# Most queries accepted by one /search/batch call
+SEARCH_BATCH_MAX = int(os.getenv('SEARCH_BATCH_MAX', '50'))
+# Longest /search and /search/batch wait for external enrichment before answering
+SEARCH_DEADLINE_SECONDS = float(os.getenv('SEARCH_DEADLINE_SECONDS', '2.0'))
+RETRY_AFTER = str(max(1, math.ceil(SEARCH_DEADLINE_SECONDS)))
+EMPTY_ENRICHMENT = {"primary_attractions": [], "local_specialties": [], "activities": []}
 
 @app.get("/health")
 def health_check():
     """Health check endpoint for monitoring"""
-    return {"status": "healthy", "service": "village-rag-microservice"}
+    # Circuit breaker state per external provider that has been called so far
+    return {"status": "healthy", "service": "village-rag-microservice", "providers": breaker_states()}
 
-@app.post("/run-pipeline")
+@app.post("/run-pipeline", status_code=202)
 def run_pipeline(request: Request, _ok: bool = Depends(verify_proxy)):
-    # It's better to run this as a background task in a real app
-    process = subprocess.Popen(["python", "scripts/run_pipeline.py"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    if process.returncode == 0:
-        return {"status": "Pipeline completed successfully", "output": stdout.decode()}
-    else:
-        return {"status": "Pipeline failed", "error": stderr.decode()}
+    """Start scripts/run_pipeline.py in the background and return its job id straight away."""
+    try:
+        job = get_manager().submit()
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job["id"]})
+    return {"status": job["status"], "job_id": job["id"]}
 
-@app.post("/search", response_model=EnrichmentResponse)
-def search_village(request: Request, data: SearchRequest, _ok: bool = Depends(verify_proxy)):
+@app.get("/api/jobs")
+def list_jobs(limit: int = Query(20, ge=1, le=200), _ok: bool = Depends(verify_proxy)):
+    return get_manager().list(limit=limit)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str, _ok: bool = Depends(verify_proxy)):
+    job = get_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, _ok: bool = Depends(verify_proxy)):
+    job = get_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/logs")
+def get_job_logs(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Byte offset to read from (use next_offset from the previous call)"),
+    follow: bool = Query(False, description="Stream the log until the job finishes"),
+    _ok: bool = Depends(verify_proxy),
+):
+    manager = get_manager()
+    if manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not follow:
+        data, next_offset = manager.read_log(job_id, offset)
+        return {"data": data.decode("utf-8", errors="replace"), "next_offset": next_offset,
+                "complete": not manager.is_active(job_id)}
+
+    def tail():
+        pos = offset
+        while True:
+            active = manager.is_active(job_id)
+            data, pos = manager.read_log(job_id, pos)
+            if data:
+                yield data
+            elif not active:
+                return
+            else:
+                time.sleep(0.5)
+
+    return StreamingResponse(tail(), media_type="text/plain")
+
+def node_enrichment(attrs):
+    return {
+        "primary_attractions": attrs.get('primary_attractions', '').split(', '),
+        "local_specialties": attrs.get('local_specialties', '').split(', '),
+        "activities": attrs.get('activities', '').split(', '),
+    }
+
+def search_deadline(deadline_ms):
+    budget = SEARCH_DEADLINE_SECONDS if deadline_ms is None else min(max(deadline_ms, 0) / 1000, SEARCH_DEADLINE_SECONDS)
+    return time.monotonic() + budget
+
+
+def past(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def name_match(G, query):
+    """The village node whose name or id matches every word of query, or None."""
+    if query in G:
+        return query
+    # The index may already list nodes of a newer version of G
+    for node, _ in graph_index(G).search(query, fields=('name',)):
+        if node in G:
+            return node
+    return None
+
+
+def spelling_match(G, query):
+    """The village node whose name is a close spelling of query, or None."""
+    hits = fuzzy_search(G, query, k=1)
+    return hits[0][0] if hits else None
+
+
+def local_match(G, query, deadline=None):
+    """(node, attrs) answering query from the graph alone, or None.
+
+    Each lookup (name index, spelling, semantic) runs only while deadline has not passed;
+    the semantic step never waits for the vector index to build (semantic_search returns
+    nothing until it is ready).
+    """
+    for match in (name_match, spelling_match):
+        if past(deadline):
+            return None
+        node = match(G, query)
+        if node is not None:
+            return node, G.nodes[node]
+    if past(deadline):
+        return None
+    # Semantic match over the local catalog before paying for an external enrichment
+    hits = semantic_search(G, query, k=1)
+    if hits:
+        return hits[0][0], G.nodes[hits[0][0]]
+    return None
+
+
+async def within_deadline(future, deadline):
+    """The future's result if it arrives before deadline, else None (the work carries on)."""
     try:
-        G = nx.read_graphml("models/final_village_knowledge_graph.graphml")
-    except FileNotFoundError:
-        return {"error": "Knowledge graph not found. Please run the pipeline first."}
+        # shield: giving up on the wait must not cancel the shared background job
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                      timeout=max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        return None
+
 
-    query = data.query.lower()
-    # Simple search for now, can be improved with vector search
-    for node in G.nodes(data=True):
-        if query in node[0].lower():
-            return {
-                "primary_attractions": node[1].get('primary_attractions', '').split(', '),
-                "local_specialties": node[1].get('local_specialties', '').split(', '),
-                "activities": node[1].get('activities', '').split(', '),
-            }
-    # If not found in graph, use RAG enrichment
-    enrichment = enrich_from_serpapi_and_gemini(data.query)
+@app.post("/search", response_model=EnrichmentResponse)
+async def search_village(request: Request, data: SearchRequest, _ok: bool = Depends(verify_proxy)):
+    """Enrichment for a village, answered from the graph or cache at once when possible.
+
+    Stale graph answers come back with stale=true while a refresh runs in the background.
+    A query that needs SerpAPI/Gemini waits at most the deadline budget; after that the
+    response is 202 with pending=true and the result lands in the enrichment cache.
+    """
+    deadline = search_deadline(data.deadline_ms)
+    if not await run_in_threadpool(store.graph_loaded):
+        return {"error": "Knowledge graph not found. Please run the pipeline first."}
+    # A due reload or change-log tail can take a while; keep it off the event loop
+    G = await run_in_threadpool(store.graph)
+    hit = await run_in_threadpool(local_match, G, data.query, deadline)
+    if hit is not None:
+        node, attrs = hit
+        return {**node_enrichment(attrs), "stale": schedule_refresh(node, attrs)}
+    cached = await run_in_threadpool(cached_enrichment, data.query)
+    if cached is not None:
+        return cached
+    # If not found in graph, use RAG enrichment (identical concurrent misses share one job)
+    try:
+        future = get_refresh_pool().submit(f"enrich:{normalize_query(data.query)}",
+                                           lambda: enrich_from_serpapi_and_gemini(data.query), force=True)
+    except PoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": RETRY_AFTER})
+    try:
+        enrichment = await within_deadline(future, deadline)
+    except FlightTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if enrichment is None:
+        return JSONResponse(status_code=202, content={**EMPTY_ENRICHMENT, "stale": False, "pending": True},
+                            headers={"Retry-After": RETRY_AFTER})
     return enrichment
 
+
+def local_batch(queries, deadline=None):
+    """{query: (source, enrichment, stale)} for the queries the graph or the cache can answer.
+
+    Graph lookups stop once deadline has passed; the rest fall through to the cache.
+    """
+    results = {}
+    if store.graph_loaded():
+        G = store.graph()
+        pending = list(queries)
+        for source, match in (("graph", name_match), ("spelling", spelling_match)):
+            unmatched = []
+            for q in pending:
+                node = None if past(deadline) else match(G, q)
+                if node is None:
+                    unmatched.append(q)
+                else:
+                    results[q] = (source, node, G.nodes[node])
+            pending = unmatched
+        remaining = [] if past(deadline) else pending
+        for q, hits in zip(remaining, semantic_search_many(G, remaining, k=1)):
+            if hits:
+                results[q] = ("semantic", hits[0][0], G.nodes[hits[0][0]])
+        results = {q: (source, node_enrichment(attrs), schedule_refresh(node, attrs))
+                   for q, (source, node, attrs) in results.items()}
+    for q in queries:
+        if q not in results:
+            cached = cached_enrichment(q)
+            if cached is not None:
+                results[q] = ("enrichment", cached, False)
+    return results
+
+
+@app.post("/search/batch", response_model=List[BatchSearchResult])
+async def search_villages_batch(data: BatchSearchRequest, _ok: bool = Depends(verify_proxy)):
+    """/search for many queries: graph hits are answered together, and the misses share batched Gemini calls.
+
+    Misses not enriched within the deadline budget come back with source 'pending' and empty lists.
+    """
+    queries = [q for q in data.queries if q and q.strip()]
+    if len(queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SEARCH_BATCH_MAX} queries per batch")
+    deadline = search_deadline(data.deadline_ms)
+    results = await run_in_threadpool(local_batch, queries, deadline)
+    misses = list(dict.fromkeys(q for q in queries if q not in results))
+    if misses:
+        key = "batch:" + "\n".join(sorted(normalize_query(q) for q in misses))
+        try:
+            future = get_refresh_pool().submit(key, lambda: enrich_batch(misses), force=True)
+        except PoolFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": RETRY_AFTER})
+        try:
+            enriched = await within_deadline(future, deadline) or {}
+        except FlightTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        for q in misses:
+            results[q] = ("enrichment", enriched[q], False) if q in enriched else ("pending", EMPTY_ENRICHMENT, False)
+    return [{"query": q, "source": results[q][0], **results[q][1], "stale": results[q][2],
+             "pending": results[q][0] == "pending"} for q in queries]
+
+@app.get("/api/cache/stats")
+def enrichment_cache_stats():
+    """Hit/miss counters for the enrichment and SerpAPI caches, coalesced calls and background refreshes."""
+    return {**get_cache().snapshot(), "singleflight": flight_stats(), "refresh": get_refresh_pool().snapshot()}
+
+
+@register_collector
+def _service_metrics():
+    """Scrape-time gauges and counters read from the store, caches, single-flight groups and breakers."""
+    datasets = store.stats()
+    yield ('dataset_records', 'gauge', 'Records currently held per dataset (graph: nodes).',
+           [({'dataset': n}, d['records']) for n, d in datasets.items()])
+    yield ('graph_edges', 'gauge', 'Edges in the knowledge graph.', [({}, datasets['graph']['edges'])])
+    yield ('dataset_version', 'gauge', 'Reloads plus logged changes applied per dataset.',
+           [({'dataset': n}, d['version']) for n, d in datasets.items()])
+    yield ('dataset_load_seconds', 'gauge', 'Duration of the last full load (read, parse, replay) per dataset.',
+           [({'dataset': n}, d['load_seconds']) for n, d in datasets.items()])
+    yield ('dataset_overlay_entries', 'gauge', 'Entries held in worker memory over a memory-mapped snapshot.',
+           [({'dataset': n}, d['overlay']) for n, d in datasets.items() if 'overlay' in d])
+    yield ('store_load_seconds', 'gauge', 'Duration of the startup load of all datasets.', [({}, store.load_seconds)])
+    events, ratios, entries = [], [], []
+    for cache, snap in (('enrichment', get_cache().snapshot()), ('geocode', get_geocode_cache().snapshot())):
+        for ns, s in snap.items():
+            labels = {'cache': cache, 'namespace': ns}
+            events += [({**labels, 'event': k}, v) for k, v in s.items() if k not in ('entries', 'hit_rate')]
+            ratios.append((labels, s['hit_rate']))
+            entries.append((labels, s['entries']))
+    http = get_response_cache().snapshot()
+    labels = {'cache': 'http', 'namespace': 'responses'}
+    events += [({**labels, 'event': k}, http[k]) for k in ('hits', 'misses', 'not_modified')]
+    lookups = http['hits'] + http['misses']
+    ratios.append((labels, round(http['hits'] / lookups, 4) if lookups else 0.0))
+    entries.append((labels, http['entries']))
+    yield ('cache_events_total', 'counter', 'Cache lookups and writes by outcome.', events)
+    yield ('cache_hit_ratio', 'gauge', 'Share of cache lookups answered from the cache.', ratios)
+    yield ('cache_entries', 'gauge', 'Entries currently held per cache.', entries)
+    refresh = get_refresh_pool().snapshot()
+    yield ('refresh_jobs_total', 'counter', 'Background enrichment submissions and results by outcome.',
+           [({'outcome': k}, v) for k, v in refresh.items() if k != 'queued'])
+    yield ('refresh_jobs_queued', 'gauge', 'Background enrichment jobs queued or running.', [({}, refresh['queued'])])
+    flights = flight_stats()
+    yield ('singleflight_calls_total', 'counter', 'Coalesced-call outcomes per single-flight group.',
+           [({'group': g, 'outcome': k}, v) for g, s in flights.items() for k, v in s.items()
+            if k not in ('in_flight', 'waiting')])
+    yield ('singleflight_in_flight', 'gauge', 'Calls currently running per single-flight group.',
+           [({'group': g}, s['in_flight']) for g, s in flights.items()])
+    breakers = breaker_states()
+    yield ('provider_circuit_open', 'gauge', '1 while a provider circuit breaker is open.',
+           [({'provider': p}, int(b['state'] == 'open')) for p, b in breakers.items()])
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of request latencies, provider calls, caches and datasets."""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 # --- Villages ---
+def cache_query(request):
+    return tuple(sorted(request.query_params.multi_items()))
+
+
+def cached_dataset(request, name, records):
+    """A whole dataset as JSON with ETag/Last-Modified validators and compression."""
+    build = lambda: (json.dumps(records, ensure_ascii=False).encode('utf-8'), {})
+    return get_response_cache().respond(request, (name, cache_query(request)), store.version(name), build,
+                                        modified=store.modified(name))
+
+
 @app.get("/api/villages")
-def get_villages():
-    path = os.path.join(DATA_DIR, "merged_villages.json")
-    if not os.path.exists(path):
-        # Fall back to microservice root merged_villages.json if pipeline wrote there
-        alt = os.path.join(os.path.dirname(__file__), 'merged_villages.json')
-        if os.path.exists(alt):
-            path = alt
-        else:
-            return []
-    with open(path, encoding="utf-8") as f:
-        data = json.load(f)
-    return data
+def get_villages(
+    request: Request,
+    limit: int = Query(None, ge=1, le=1000, description="Page size (default: the whole catalog)"),
+    offset: int = Query(0, ge=0, description="Records to skip (ignored when cursor is given)"),
+    cursor: str = Query(None, description="X-Next-Cursor from the previous page"),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. village_name,state,latitude"),
+    sort: str = Query(None, description="Field to sort by; prefix with '-' for descending"),
+    format: str = Query('json', pattern='^(json|ndjson)$'),
+):
+    """Villages from data/merged_villages.json, paged and projected.
+
+    The body is always a JSON array (or NDJSON lines); paging state is returned in the
+    X-Total-Count, X-Next-Cursor and Link headers.
+    """
+    villages = store.villages()
+    version = store.version('villages')
+
+    def build():
+        try:
+            positions, next_cursor = page(villages, version, limit=limit, offset=offset, cursor=cursor, sort=sort)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        headers = {"X-Total-Count": str(len(villages))}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{request.url.path}?{request.url.include_query_params(cursor=next_cursor).query}>; rel="next"'
+        return positions, headers
+
+    selected = parse_fields(fields)
+    if format == 'ndjson':
+        positions, headers = build()
+        return StreamingResponse(ndjson_chunks(villages, positions, selected),
+                                 media_type="application/x-ndjson", headers=headers)
+
+    def build_json():
+        positions, headers = build()
+        # Records are plain JSON already; skip FastAPI's per-field encoder
+        body = json.dumps([project(villages[i], selected) for i in positions], ensure_ascii=False)
+        return body.encode('utf-8'), headers
+    return get_response_cache().respond(request, ('villages', cache_query(request)), version, build_json,
+                                        modified=store.modified('villages'))
 
 
 @app.get('/api/villages/search')
-def search_villages(q: str = Query(..., description="Query string to search villages")):
-    """Search villages by name, state, attractions or activities and return matching entries."""
-    villages = get_villages()
-    ql = q.lower()
-    results = []
-    for v in villages:
-        if ql in (v.get('village_name') or '').lower() or ql in (v.get('state') or '').lower():
-            results.append(v)
-            continue
-        # check attractions/activities (they may be lists)
-        for field in ['primary_attractions', 'activities', 'local_specialties']:
-            val = v.get(field, '')
-            if isinstance(val, list):
-                joined = ' '.join(val).lower()
-            else:
-                joined = str(val).lower()
-            if ql in joined:
-                results.append(v)
-                break
-    return results
+def search_villages(
+    q: str = Query(..., description="Query string to search villages"),
+    mode: str = Query('and', pattern='^(and|or)$', description="Require all terms ('and') or any term ('or')"),
+    limit: int = Query(None, ge=1, description="Maximum number of results"),
+):
+    """Search villages by name, state, attractions, activities or specialties, best matches first."""
+    villages = store.villages()
+    ranked = villages_index(villages).search(q, mode=mode, limit=limit)
+    # The index may already list records appended in a newer version of the list
+    return [villages[i] for i, _ in ranked if i < len(villages)]
+
+
+@app.get('/api/villages/suggest')
+def suggest_villages(
+    q: str = Query(..., min_length=1, description="Village name, possibly misspelled"),
+    k: int = Query(5, ge=1, le=50),
+    min_score: float = Query(FUZZY_MIN_SCORE, ge=0.0, le=1.0),
+    fields: str = Query(None, description="Comma-separated village fields to include"),
+):
+    """Villages whose name or alias is a close spelling of q, best first, with match scores."""
+    G = store.graph()
+    selected = parse_fields(fields) or DEFAULT_FIELDS
+    return [{"id": node, **project(G.nodes[node], selected), "score": round(score, 4), "matched": matched}
+            for node, score, matched in fuzzy_index(G).search(q, k=k, min_score=min_score) if node in G]
+
+
+@app.get('/api/villages/duplicates')
+def village_duplicates(
+    min_score: float = Query(DEDUPE_MIN_SCORE, ge=0.0, le=1.0),
+    limit: int = Query(100, ge=1, le=10000),
+):
+    """Groups of village nodes that look like the same place, with the node each would merge into."""
+    rows = graph_rows(store.graph())
+    clusters = rank_duplicates(rows, min_score)
+    names = {row[0]: row[1] for row in rows}
+    out = [{"keep": {"id": c["keep"], "village_name": names[c["keep"]]},
+            "duplicates": [{**d, "village_name": names[d["id"]]} for d in c["duplicates"]]}
+           for c in clusters[:limit]]
+    return {"total": len(clusters), "clusters": out}
+
+
+@app.post('/api/villages/duplicates/merge')
+def merge_village_duplicates(
+    min_score: float = Query(DEDUPE_MIN_SCORE, ge=0.0, le=1.0),
+    _ok: bool = Depends(verify_proxy),
+):
+    """Merge every duplicate group into one village node, moving attraction/specialty edges along."""
+    clusters, merged = merge_store_duplicates(store, min_score)
+    return {"clusters": len(clusters), "merged": merged}
+
+
+@app.get('/api/villages/discover')
+def discover_villages(
+    filter: List[str] = Query([], description="Repeatable: eco_rating>=4, state=Kerala|Goa, cooking_classes=yes"),
+    sort: str = Query(None, description="Column to sort by; prefix with '-' for descending"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=0, le=500),
+    facets: str = Query(None, description="Comma-separated facet/range fields (default: all)"),
+    fields: str = Query(None, description="Comma-separated village fields to return"),
+):
+    """Filter, sort and page villages, with facet counts for every categorical field in one call."""
+    G = store.graph()
+    try:
+        total, nodes, counts, ranges = facet_index(G).query(
+            [parse_filter(f) for f in filter], sort=sort, offset=offset, limit=limit,
+            facet_fields=set(parse_fields(facets)) if facets else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = parse_fields(fields)
+    return {
+        "total": total,
+        "items": [{"id": n, **project(G.nodes[n], selected)} for n in nodes if n in G],
+        "facets": counts,
+        "ranges": ranges,
+    }
+
+
+def village_hits(G, hits):
+    # Indexes are handed over to each new graph version, so they may list nodes G doesn't have yet
+    return [{"id": node, **G.nodes[node], "distance_km": round(km, 3)} for node, km in hits if node in G]
+
+
+@app.get('/api/villages/nearby')
+def villages_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(25.0, gt=0, le=5000),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Villages within radius_km of a point, nearest first."""
+    G = store.graph()
+    return village_hits(G, spatial_index(G).radius(lat, lng, radius_km, limit=limit))
+
+
+@app.get('/api/villages/nearest')
+def villages_nearest(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=500),
+):
+    """The k villages closest to a point."""
+    G = store.graph()
+    return village_hits(G, spatial_index(G).nearest(lat, lng, k=k))
+
+
+@app.get('/api/villages/bbox')
+def villages_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Villages inside a map viewport."""
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+    G = store.graph()
+    return [{"id": node, **G.nodes[node]}
+            for node in spatial_index(G).bbox(min_lat, min_lng, max_lat, max_lng, limit=limit) if node in G]
 
 
 @app.get('/api/graph')
-def get_graph():
-    """Return the GraphML file content for visualization (if present)."""
-    # Prefer the graph in data dir, then repo root microservice path
-    candidates = [os.path.join(DATA_DIR, 'village_knowledge_graph.graphml'), os.path.join(os.path.dirname(__file__), 'village_knowledge_graph.graphml')]
-    for p in candidates:
-        if os.path.exists(p):
-            with open(p, 'r', encoding='utf-8') as f:
-                return f.read()
-    raise HTTPException(status_code=404, detail='Graph not found')
+def get_graph(request: Request):
+    """The whole graph as GraphML (an export; visualisations should use the /api/graph/... queries)."""
+    if not store.graph_loaded():
+        raise HTTPException(status_code=404, detail='Graph not found')
+
+    def build():
+        # Published graphs are never changed, so no copy is needed
+        return '\n'.join(nx.generate_graphml(store.graph())).encode('utf-8'), {}
+    return get_response_cache().respond(request, ('graph',), store.version('graph'), build,
+                                        media_type='application/xml', modified=store.modified('graph'))
+
+
+def subgraph_response(query, build):
+    """Serve a node-link subgraph, built once per graph version and query."""
+    G = store.graph()
+    body = get_subgraph_cache().get(G, store.version('graph'), query, lambda: build(G))
+    return Response(content=body, media_type="application/json")
+
+
+@app.get('/api/graph/villages/{village}/ego')
+def graph_ego(
+    village: str,
+    radius: int = Query(1, ge=1, le=3, description="Hops from the village"),
+    max_nodes: int = Query(500, ge=1, le=5000),
+    fields: str = Query(None, description="Comma-separated village fields to include"),
+):
+    """The village, its attractions/specialties and (radius >= 2) the villages sharing them."""
+    G = store.graph()
+    node = resolve_village(G, village)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Village not found in graph")
+    selected = parse_fields(fields)
+
+    def build(G):
+        nodes, truncated = ego_nodes(G, node, radius=radius, max_nodes=max_nodes)
+        return node_link(G, nodes, selected, truncated)
+    return subgraph_response(('ego', node, radius, max_nodes, fields), build)
+
+
+@app.get('/api/graph/states/{state}')
+def graph_state(
+    state: str,
+    features: bool = Query(True, description="Include the attractions/specialties the villages link to"),
+    max_nodes: int = Query(2000, ge=1, le=20000),
+    fields: str = Query(None, description="Comma-separated village fields to include"),
+):
+    """Subgraph of the villages in a state."""
+    selected = parse_fields(fields)
+
+    def build(G):
+        nodes, truncated = state_nodes(G, state, with_features=features, max_nodes=max_nodes)
+        return node_link(G, nodes, selected, truncated)
+    return subgraph_response(('state', state.strip().lower(), features, max_nodes, fields), build)
+
+
+@app.get('/api/graph/{kind}/{name}')
+def graph_feature(
+    kind: str,
+    name: str,
+    max_nodes: int = Query(500, ge=1, le=5000),
+    fields: str = Query(None, description="Comma-separated village fields to include"),
+):
+    """Villages linked to an attraction:: or specialty:: node (kind is 'attractions' or 'specialties')."""
+    kinds = {'attractions': 'attraction', 'specialties': 'specialty'}
+    if kind not in kinds:
+        raise HTTPException(status_code=404, detail="Unknown graph node kind")
+    G = store.graph()
+    feature = resolve_feature(G, kinds[kind], name)
+    if feature is None:
+        raise HTTPException(status_code=404, detail=f"{kinds[kind].capitalize()} not found in graph")
+    selected = parse_fields(fields)
+
+    def build(G):
+        nodes, truncated = linked_villages(G, feature, max_nodes=max_nodes)
+        return node_link(G, nodes, selected, truncated)
+    return subgraph_response(('feature', feature, max_nodes, fields), build)
+
+@app.get("/api/villages/{village}/similar")
+def similar_villages(
+    village: str,
+    k: int = Query(10, ge=1, le=50),
+    geo_weight: float = Query(0.0, ge=0.0, le=1.0, description="Blend in geographic proximity (0 = features only)"),
+    scale_km: float = Query(100.0, gt=0, description="Distance at which proximity decays to 1/e"),
+    fields: str = Query(None, description="Comma-separated village fields to include"),
+):
+    """Villages sharing the most (rare) attractions, specialties and activities with this one."""
+    G = store.graph()
+    node = resolve_village(G, village)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Village not found in graph")
+    index = similarity_index(G)
+    selected = parse_fields(fields) or DEFAULT_FIELDS
+    out = []
+    for other, score, feature_score, km in index.similar(G, node, k=k, geo_weight=geo_weight, scale_km=scale_km):
+        if other not in G:
+            continue
+        item = {"id": other, **project(G.nodes[other], selected), "score": round(score, 4),
+                "feature_score": round(feature_score, 4), "shared": index.shared(node, other)}
+        if km is not None:
+            item["distance_km"] = round(km, 3)
+        out.append(item)
+    return out
 
 @app.get("/api/villages/{village_id}")
 def get_village_by_id(village_id: str):
-    with open(os.path.join(DATA_DIR, "merged_villages.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    for v in data:
-        if v.get("village_id") == village_id:
-            return v
+    v = store.village(village_id)
+    if v is not None:
+        return v
     raise HTTPException(status_code=404, detail="Village not found")
 
 # --- Internships ---
 @app.get("/api/internships")
-def get_internships():
-    with open(os.path.join(DATA_DIR, "internships.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    return data
+def get_internships(request: Request):
+    return cached_dataset(request, 'internships', store.internships())
 
 @app.get("/api/internships/{internship_id}")
 def get_internship_by_id(internship_id: str):
-    with open(os.path.join(DATA_DIR, "internships.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    for i in data:
-        if i.get("id") == internship_id:
-            return i
+    i = store.internship(internship_id)
+    if i is not None:
+        return i
     raise HTTPException(status_code=404, detail="Internship not found")
 
 # --- Kirana Stores ---
 @app.get("/api/kirana-stores")
-def get_kirana_stores():
-    with open(os.path.join(DATA_DIR, "kirana_stores.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    return data
+def get_kirana_stores(request: Request):
+    return cached_dataset(request, 'kirana_stores', store.kirana_stores())
 
 # --- Bookings ---
 @app.get("/api/bookings")
 def get_bookings(ownerId: str = None):
-    with open(os.path.join(DATA_DIR, "bookings.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    if ownerId:
-        data = [b for b in data if b.get("ownerId") == ownerId]
-    return data
+    return store.bookings(owner_id=ownerId)
 
 # --- Applications ---
 @app.get("/api/applications")
 def get_applications(userId: str = None):
-    with open(os.path.join(DATA_DIR, "applications.json"), encoding="utf-8") as f:
-        data = json.load(f)
-    if userId:
-        data = [a for a in data if a.get("userId") == userId]
-    return data
+    return store.applications(user_id=userId)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""Counters, gauges and histograms rendered in the Prometheus text exposition format.
+
+Hot paths record into in-process metrics with one small lock each. Values other modules
+already keep (cache counters, dataset sizes, breaker states) are read by collectors when
+/metrics is scraped, rather than being counted twice.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers in-memory lookups through slow third-party calls
+DEFAULT_BUCKETS = tuple(float(b) for b in os.getenv(
+    'METRICS_BUCKETS', '0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30').split(','))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._lines(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def _lines(self, pairs, value):
+        return [f'{self.name}{_labels(pairs)} {_number(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        # Copy the bucket lists under the lock; observe() mutates them in place
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_labels(pairs + [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {count}')
+        return lines
+
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _metrics.append(metric)
+
+
+def register_collector(fn):
+    """fn() -> iterable of (name, kind, help, [(labels dict, value)]), called on every scrape."""
+    with _registry_lock:
+        _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Every metric and collector output as Prometheus text (format 0.0.4)."""
+    with _registry_lock:
+        metrics, collectors = list(_metrics), list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            # A broken collector must not take the whole scrape down
+            lines.append(f'# collector {getattr(collect, "__name__", collect)} failed: {type(e).__name__}')
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency by route template.',
+                            ('method', 'route', 'status'))
+PROVIDER_SECONDS = Histogram('provider_request_duration_seconds',
+                             'Duration of each external provider HTTP attempt.', ('provider', 'outcome'))
+PROVIDER_ERRORS = Counter('provider_errors_total', 'Failed external provider attempts and rejected calls.',
+                          ('provider', 'reason'))
+PROVIDER_THROTTLE = Counter('provider_throttle_seconds_total', 'Time spent waiting on provider rate limits.',
+                            ('provider',))
+ENRICHMENT_SECONDS = Histogram('enrichment_duration_seconds', 'Uncached SerpAPI + Gemini enrichment time.',
+                               ('mode',))
@@ -0,0 +1,236 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: compaction is only guarded within the process
+    fcntl = None
+
+from data_store import DATA_DIR
+
+CHANGELOG_PATH = os.getenv('CHANGELOG_PATH', os.path.join(DATA_DIR, 'changes.sqlite3'))
+# Fold the change log into the JSON/GraphML snapshots after this many changes or seconds
+COMPACT_EVERY = int(os.getenv('CHANGELOG_COMPACT_EVERY', '500'))
+COMPACT_INTERVAL = float(os.getenv('CHANGELOG_COMPACT_INTERVAL', '300'))
+
+
+def village_key(v):
+    """Stable key for a merged_villages.json record: village_id, else lowercased name|state."""
+    if v.get('village_id'):
+        return str(v['village_id'])
+    return f"{(v.get('village_name') or '').lower()}|{(v.get('state') or '').lower()}"
+
+
+# Payload logged for a deleted village record or graph node
+REMOVED = {'removed': True}
+
+
+def graph_node_change(G, node):
+    """Change payload for a graph node: its attributes plus its edges."""
+    return {
+        'attrs': dict(G.nodes[node]),
+        'edges': [[nbr, dict(attrs)] for nbr, attrs in G[node].items()],
+    }
+
+
+def village_keys(villages):
+    """village_key() of every record in order (None for non-records), reading mapped records by column."""
+    if hasattr(villages, 'column'):
+        rows = zip(villages.column('village_id'), villages.column('village_name'), villages.column('state'))
+        return [str(i) if i else f"{(n or '').lower()}|{(s or '').lower()}" for i, n, s in rows]
+    return [village_key(v) if isinstance(v, dict) else None for v in villages]
+
+
+def copy_for_changes(dataset, value, changes):
+    """A copy of value that apply_changes() can change in place without changing value itself.
+
+    Only what the changes touch is copied: the record list, or the graph's node and adjacency
+    tables plus the attribute, neighbour and edge dicts of the changed nodes and their
+    neighbours. Everything else is shared with value, which must not be changed afterwards.
+    """
+    if dataset == 'villages':
+        # Changed records are replaced with new dicts, so copying the list is enough
+        return value.copy()
+    if getattr(value, 'snapshot', None) is not None or value.is_directed() or value.is_multigraph():
+        # A mapped graph copies only its overlay
+        return value.copy()
+    G = value.__class__()
+    G.graph.update(value.graph)
+    G._node = dict(value._node)
+    G._adj = dict(value._adj)
+    keys = set()
+    own = set()
+    for key, payload in changes:
+        if key in value:
+            keys.add(key)
+            own.add(key)
+            own.update(value._adj[key])
+        if payload != REMOVED:
+            own.update(nbr for nbr, _ in payload.get('edges', []) if nbr in value)
+    for n in own:
+        G._node[n] = dict(value._node[n])
+        G._adj[n] = dict(value._adj[n])
+    for key in keys:
+        for nbr, attrs in value._adj[key].items():
+            # Both directions of an undirected edge share one attribute dict
+            G._adj[key][nbr] = G._adj[nbr][key] = dict(attrs)
+    return G
+
+
+def apply_changes(dataset, value, changes, positions=None, touched=None):
+    """Replay logged (key, payload) changes onto a loaded dataset in place. Upserts and removals are idempotent.
+
+    positions (village key -> list position) saves scanning the records and is kept up to date.
+    touched, if given, collects what changed: (village key, position or None if removed) for
+    villages, node keys for the graph.
+    """
+    if not changes:
+        return value
+    if touched is None:
+        touched = []
+    if dataset == 'villages':
+        if positions is None:
+            positions = {k: i for i, k in enumerate(village_keys(value)) if k is not None}
+        for key, payload in changes:
+            i = positions.get(key)
+            if payload == REMOVED:
+                if i is not None:
+                    del value[i]
+                    del positions[key]
+                    for k, j in positions.items():
+                        if j > i:
+                            positions[k] = j - 1
+                    touched.append((key, None))
+            elif i is None:
+                value.append(dict(payload))
+                positions[key] = len(value) - 1
+                touched.append((key, positions[key]))
+            else:
+                # A new dict: the old record may still be read through the previous version
+                value[i] = dict(payload)
+                touched.append((key, i))
+    elif dataset == 'graph':
+        for key, payload in changes:
+            if payload == REMOVED:
+                if key in value:
+                    value.remove_node(key)
+                    touched.append(key)
+                continue
+            edges = payload.get('edges', [])
+            if key in value:
+                # The payload is the node's whole state: drop attributes and edges it no longer has
+                data = value.nodes[key]
+                data.clear()
+                data.update(payload.get('attrs', {}))
+                keep = {nbr for nbr, _ in edges}
+                for nbr in [n for n in value[key] if n not in keep]:
+                    value.remove_edge(key, nbr)
+            else:
+                value.add_node(key, **payload.get('attrs', {}))
+            for nbr, attrs in edges:
+                value.add_edge(key, nbr, **attrs)
+            touched.append(key)
+    return value
+
+
+class ChangeLog:
+    """Append-only, SQLite-backed log of dataset upserts shared by every process using the data dir."""
+
+    def __init__(self, path=CHANGELOG_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, dataset TEXT, key TEXT, payload TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS changes_dataset ON changes(dataset, seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshots (dataset TEXT PRIMARY KEY, seq INTEGER, ts REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, entries):
+        """Commit [(dataset, key, payload)] in one transaction; returns the new sequence numbers."""
+        now = time.time()
+        conn = self._conn()
+        seqs = []
+        with conn:
+            for dataset, key, payload in entries:
+                cur = conn.execute(
+                    "INSERT INTO changes (ts, dataset, key, payload) VALUES (?, ?, ?, ?)",
+                    (now, dataset, str(key), json.dumps(payload, ensure_ascii=False)),
+                )
+                seqs.append(cur.lastrowid)
+        return seqs
+
+    def since(self, dataset, seq):
+        """[(seq, key, payload)] logged for dataset after seq, oldest first."""
+        rows = self._conn().execute(
+            "SELECT seq, key, payload FROM changes WHERE dataset = ? AND seq > ? ORDER BY seq", (dataset, seq)
+        ).fetchall()
+        return [(s, k, json.loads(p)) for s, k, p in rows]
+
+    def last_seq(self, dataset):
+        row = self._conn().execute("SELECT MAX(seq) FROM changes WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] or 0
+
+    def snapshot_seq(self, dataset):
+        row = self._conn().execute("SELECT seq FROM snapshots WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] if row else 0
+
+    def pending(self, dataset):
+        row = self._conn().execute(
+            "SELECT COUNT(*), MIN(ts) FROM changes WHERE dataset = ? AND seq > ?",
+            (dataset, self.snapshot_seq(dataset)),
+        ).fetchone()
+        return row[0], row[1]
+
+    def mark_compacted(self, dataset, seq):
+        """Record that the snapshot file now contains every change up to seq, and drop those entries."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO snapshots (dataset, seq, ts) VALUES (?, ?, ?) "
+                "ON CONFLICT(dataset) DO UPDATE SET seq = MAX(seq, excluded.seq), ts = excluded.ts",
+                (dataset, seq, time.time()),
+            )
+            conn.execute("DELETE FROM changes WHERE dataset = ? AND seq <= ?", (dataset, seq))
+
+    @contextlib.contextmanager
+    def compaction_lock(self):
+        """Exclusive across processes sharing the log, so two compactions never interleave."""
+        with open(self.path + '.compact.lock', 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_atomic(path, write):
+    """Call write(tmp_path) and then atomically replace path with the result."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Keep the extension last, for writers that pick the format from it
+    stem, ext = os.path.splitext(os.path.basename(path))
+    tmp = os.path.join(directory, f".{stem}.{os.getpid()}.{threading.get_ident()}.tmp{ext}")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
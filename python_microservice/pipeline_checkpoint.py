@@ -0,0 +1,165 @@
+"""Durable progress for scripts/run_pipeline.py.
+
+Every collected village is stored as soon as it is known, and again as soon as it is enriched,
+so a crashed run resumes where it stopped instead of starting over. Records remember when they
+were last enriched (``last_updated``), which lets an incremental run refresh only the stale
+ones and those with missing fields.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from data_store import DATA_DIR
+
+CHECKPOINT_PATH = os.getenv('PIPELINE_CHECKPOINT_PATH', os.path.join(DATA_DIR, 'pipeline_checkpoint.sqlite3'))
+# Incremental runs re-enrich records last updated more than this many days ago
+STALE_DAYS = float(os.getenv('PIPELINE_STALE_DAYS', '30'))
+ENRICHMENT_KEYS = ('primary_attractions', 'local_specialties', 'activities')
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def record_key(v):
+    """Case-insensitive name|state, the identity the collect step de-duplicates on."""
+    return f"{(v.get('name') or v.get('village_name') or '').strip().lower()}|{(v.get('state') or '').strip().lower()}"
+
+
+def today():
+    return datetime.date.today().strftime(DATE_FORMAT)
+
+
+def _age_days(value, now):
+    try:
+        return (now - datetime.datetime.strptime(str(value)[:10], DATE_FORMAT).date()).days
+    except ValueError:
+        return None
+
+
+def missing_fields(v):
+    """Names of the fields an enriched record should have but doesn't."""
+    missing = [k for k in ENRICHMENT_KEYS if not v.get(k)]
+    if v.get('lat') is None and v.get('latitude') is None:
+        missing.append('coordinates')
+    return missing
+
+
+def is_stale(v, stale_days=STALE_DAYS, now=None):
+    """True when a record was never enriched, is older than stale_days, or lacks fields."""
+    now = now or datetime.date.today()
+    age = _age_days(v.get('last_updated') or v.get('date_added') or '', now)
+    return age is None or age > stale_days or bool(missing_fields(v))
+
+
+class PipelineCheckpoint:
+    """SQLite store of pipeline runs and the records they collected and enriched."""
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, mode TEXT, stale_days REAL, started REAL, "
+                "collected REAL, finished REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "key TEXT PRIMARY KEY, record TEXT, enriched_run INTEGER, updated REAL)"
+            )
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; keep one per worker thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # --- runs ---
+
+    def unfinished_run(self, mode):
+        """(id, collected?) of the latest unfinished run in this mode, or None."""
+        row = self._conn().execute(
+            "SELECT id, collected FROM runs WHERE finished IS NULL AND mode = ? ORDER BY id DESC LIMIT 1", (mode,)
+        ).fetchone()
+        return (row[0], row[1] is not None) if row else None
+
+    def start_run(self, mode, stale_days):
+        with self._conn() as conn:
+            # Anything left unfinished is superseded by the new run
+            conn.execute("UPDATE runs SET finished = ? WHERE finished IS NULL", (time.time(),))
+            cur = conn.execute("INSERT INTO runs (mode, stale_days, started) VALUES (?, ?, ?)",
+                               (mode, stale_days, time.time()))
+            return cur.lastrowid
+
+    def mark_collected(self, run_id):
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET collected = ? WHERE id = ?", (time.time(), run_id))
+
+    def finish_run(self, run_id):
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+
+    # --- records ---
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def add_collected(self, villages):
+        """Store newly collected villages; known ones keep their enrichment, with location fields refreshed."""
+        added = 0
+        with self._conn() as conn:
+            for v in villages:
+                key = record_key(v)
+                row = conn.execute("SELECT record FROM records WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    record = {**v, 'date_added': v.get('date_added') or today()}
+                    conn.execute("INSERT INTO records (key, record, enriched_run, updated) VALUES (?, ?, NULL, ?)",
+                                 (key, json.dumps(record, ensure_ascii=False), time.time()))
+                    added += 1
+                else:
+                    record = json.loads(row[0])
+                    record.update({k: val for k, val in v.items()
+                                   if k not in ENRICHMENT_KEYS and val is not None})
+                    conn.execute("UPDATE records SET record = ? WHERE key = ?",
+                                 (json.dumps(record, ensure_ascii=False), key))
+        return added
+
+    def save_enriched(self, villages, run_id):
+        """Persist one enriched batch; called as each batch completes."""
+        stamp = today()
+        with self._conn() as conn:
+            for v in villages:
+                v['last_updated'] = stamp
+                v.setdefault('date_added', stamp)
+                conn.execute(
+                    "INSERT INTO records (key, record, enriched_run, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET record = excluded.record, "
+                    "enriched_run = excluded.enriched_run, updated = excluded.updated",
+                    (record_key(v), json.dumps(v, ensure_ascii=False), run_id, time.time()),
+                )
+
+    def records(self):
+        """[(record, enriched_run)] in insertion order."""
+        rows = self._conn().execute("SELECT record, enriched_run FROM records ORDER BY rowid").fetchall()
+        return [(json.loads(r), run) for r, run in rows]
+
+    def pending(self, run_id, mode, stale_days=STALE_DAYS):
+        """Records this run still has to enrich.
+
+        A full run enriches everything it has not enriched itself yet; an incremental run only
+        the records that are stale or missing fields (never-enriched ones always are).
+        """
+        now = datetime.date.today()
+        out = []
+        for record, enriched_run in self.records():
+            if enriched_run == run_id:
+                continue
+            if mode == 'full' or is_stale(record, stale_days, now):
+                out.append(record)
+        return out
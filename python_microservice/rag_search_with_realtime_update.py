@@ -1,49 +1,75 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import hashlib
 import json
-import requests
 import re
-import networkx as nx
+
+from data_store import get_store
+from enrichment_cache import get_cache, is_missing, normalize_query
+from fuzzy import fuzzy_search
+from geocode import forward_geocode, reverse_state
+from http_client import ProviderUnavailable, client
+from logs import get_logger, log_payload
+from metrics import ENRICHMENT_SECONDS
+from persistence import graph_node_change, village_key
+from pipeline_checkpoint import STALE_DAYS, is_stale, today
+from refresh_pool import PoolFull, get_refresh_pool
+from singleflight import group as flight_group
+from search_index import ATTRIBUTE_FIELDS, NAME_FIELDS, graph_index
+from vector_index import semantic_search
 
 ENRICHMENT = ' new hidden places with social media buzz with fun activities and attractions'
 
 load_dotenv()
 
+log = get_logger('Enrichment')
+serpapi_log = get_logger('SerpAPI')
+gemini_log = get_logger('Gemini')
+
 # Read API keys after loading .env so local development keys are picked up
 SERPAPI_KEY = os.getenv('SERPAPI_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+SERPAPI_URL = os.getenv('SERPAPI_URL', 'https://serpapi.com/search.json')
+GEMINI_URL = os.getenv('GEMINI_URL', 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent')
 
 
 
 def call_serpapi(query):
     # If API key is not provided, skip calling SerpAPI and return None so callers can fallback.
     if not SERPAPI_KEY:
-        print('[SerpAPI] SERPAPI_KEY not set; skipping SerpAPI call and using fallback data')
+        serpapi_log.warning('SERPAPI_KEY not set; skipping SerpAPI call and using fallback data')
         return None
-    url = 'https://serpapi.com/search.json'
+    url = SERPAPI_URL
     params = {
         'engine': 'google',
         'q': query,
         'api_key': SERPAPI_KEY,
         'num': 10
     }
-    resp = requests.get(url, params=params)
+    try:
+        resp = client('serpapi').get(url, params=params)
+    except ProviderUnavailable as e:
+        serpapi_log.warning('%s; using fallback data', e)
+        return None
     if resp.status_code == 200:
         return resp.json()
     else:
         # For 401/403, give a clear message about the key being invalid/permissions
         if resp.status_code in (401, 403):
-            print(f'[SerpAPI] Authentication/permission error ({resp.status_code}). Check SERPAPI_KEY and account permissions.')
+            serpapi_log.error('Authentication/permission error (%s). Check SERPAPI_KEY and account permissions.',
+                              resp.status_code)
         else:
-            print(f'[SerpAPI Error] {resp.status_code}: {resp.text}')
+            serpapi_log.warning('HTTP %s; using fallback data', resp.status_code)
+        log_payload(serpapi_log, 'SerpAPI error response', status=resp.status_code, body=resp.text)
         return None
 
 def call_gemini(query):
     # If GEMINI_API_KEY isn't set, skip the Gemini call and return None so callers can fallback.
     if not GEMINI_API_KEY:
-        print('[Gemini] GEMINI_API_KEY not set; skipping Gemini call and using fallback data')
+        gemini_log.warning('GEMINI_API_KEY not set; skipping Gemini call and using fallback data')
         return None
-    url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent'
+    url = GEMINI_URL
     headers = {
         'Content-Type': 'application/json',
         'X-goog-api-key': GEMINI_API_KEY
@@ -57,42 +83,205 @@ def call_gemini(query):
             }
         ]
     }
-    resp = requests.post(url, headers=headers, data=json.dumps(data))
+    try:
+        resp = client('gemini').post(url, headers=headers, data=json.dumps(data))
+    except ProviderUnavailable as e:
+        gemini_log.warning('%s; using fallback data', e)
+        return None
     if resp.status_code == 200:
         return resp.json()
     else:
         if resp.status_code in (401, 403):
-            print(f'[Gemini] Authentication/permission error ({resp.status_code}). Check GEMINI_API_KEY and Cloud permissions.')
+            gemini_log.error('Authentication/permission error (%s). Check GEMINI_API_KEY and Cloud permissions.',
+                             resp.status_code)
         else:
-            print(f'[Gemini Error] {resp.status_code}: {resp.text}')
+            gemini_log.warning('HTTP %s; using fallback data', resp.status_code)
+        log_payload(gemini_log, 'Gemini error response', status=resp.status_code, body=resp.text)
         return None
 
-def enrich_from_serpapi_and_gemini(query):
-    full_prompt = query + ENRICHMENT
-    print(f"[Enrichment] Using SerpAPI and Gemini for '{full_prompt}'...")
+GEMINI_PROMPT = (
+    "You are an expert travel data extractor for a rural tourism platform.\n"
+    "Given these web snippets about \"{query}\", extract and summarize the following information as accurately as possible:\n"
+    "- \"primary_attractions\": List of the most important or unique tourist attractions (e.g., temples, viewpoints, natural wonders, heritage sites) in or near the village/place.\n"
+    "- \"local_specialties\": List of unique foods, crafts, or cultural specialties the village/place is known for.\n"
+    "- \"activities\": List of fun or popular activities for tourists (e.g., trekking, festivals, workshops, adventure sports, local experiences).\n"
+    "Return ONLY a valid JSON object with these three keys: primary_attractions, local_specialties, activities.\n"
+    "Do not include any explanation, extra text, or formatting outside the JSON object.\n\n"
+    "Snippets:\n{snippets}"
+)
+# Cached enrichments are keyed on the prompt too, so editing it invalidates them (but not the SerpAPI cache)
+PROMPT_VERSION = hashlib.sha1(GEMINI_PROMPT.encode('utf-8')).hexdigest()[:12]
+
+GEMINI_BATCH_PROMPT = (
+    "You are an expert travel data extractor for a rural tourism platform.\n"
+    "Below are web snippets about several villages/places, each under a numbered heading.\n"
+    "For EACH place extract:\n"
+    "- \"primary_attractions\": List of the most important or unique tourist attractions in or near the place.\n"
+    "- \"local_specialties\": List of unique foods, crafts, or cultural specialties the place is known for.\n"
+    "- \"activities\": List of fun or popular activities for tourists.\n"
+    "Return ONLY a valid JSON object mapping each place number (as a string) to an object with these three keys.\n"
+    "Do not include any explanation, extra text, or formatting outside the JSON object.\n\n"
+    "{places}"
+)
+# Places per batched Gemini request, and SerpAPI lookups run in parallel while preparing a batch
+GEMINI_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', '10'))
+SNIPPET_WORKERS = int(os.getenv('ENRICH_SNIPPET_WORKERS', '4'))
+ENRICHMENT_KEYS = ('primary_attractions', 'local_specialties', 'activities')
+# Graph villages enriched longer ago than this (or missing fields) are refreshed in the background
+ENRICH_STALE_DAYS = float(os.getenv('ENRICH_STALE_DAYS', str(STALE_DAYS)))
+
+
+def fetch_snippets(full_prompt):
+    """SerpAPI organic snippets for a search string, cached separately from the Gemini step."""
+    cache = get_cache()
+    key = normalize_query(full_prompt)
+    cached = cache.get('serpapi', key)
+    if not is_missing(cached):
+        return cached
     serpapi_results = call_serpapi(full_prompt)
     snippets = []
     if serpapi_results and 'organic_results' in serpapi_results:
         snippets = [item.get('snippet', '') for item in serpapi_results['organic_results'] if 'snippet' in item]
     elif serpapi_results:
         snippets = [str(serpapi_results)[:500]]
-    # Gemini prompt (unchanged)
-    gemini_input = (
-        f"You are an expert travel data extractor for a rural tourism platform.\n"
-        f"Given these web snippets about \"{query}\", extract and summarize the following information as accurately as possible:\n"
-        f"- \"primary_attractions\": List of the most important or unique tourist attractions (e.g., temples, viewpoints, natural wonders, heritage sites) in or near the village/place.\n"
-        f"- \"local_specialties\": List of unique foods, crafts, or cultural specialties the village/place is known for.\n"
-        f"- \"activities\": List of fun or popular activities for tourists (e.g., trekking, festivals, workshops, adventure sports, local experiences).\n"
-        f"Return ONLY a valid JSON object with these three keys: primary_attractions, local_specialties, activities.\n"
-        f"Do not include any explanation, extra text, or formatting outside the JSON object.\n\n"
-        f"Snippets:\n" + "\n".join(snippets)
-    )
-    print("\n[Gemini Prompt Sent]:\n" + gemini_input[:2000] + ("..." if len(gemini_input) > 2000 else ""))
+    cache.put('serpapi', key, snippets, ok=serpapi_results is not None)
+    return snippets
+
+
+def enrich_from_serpapi_and_gemini(query):
+    cache = get_cache()
+    key = _enrichment_key(query)
+    cached = cache.get('enrichment', key)
+    if not is_missing(cached):
+        log.debug("Cache hit for '%s'", query)
+        return cached
+    # Concurrent misses for the same query wait for one SerpAPI + Gemini round trip
+    return flight_group('enrichment').do(key, lambda: _enrich_and_cache(query, key))
+
+
+def _enrich_and_cache(query, key):
+    cache = get_cache()
+    # A flight for this key may have finished between our cache miss and becoming leader
+    cached = cache.get('enrichment', key)
+    if not is_missing(cached):
+        return cached
+    with ENRICHMENT_SECONDS.time(mode='single'):
+        enrichment, ok = _enrich_uncached(query)
+    # Fallback sample data is cached briefly so a failing provider isn't hammered for the same query
+    cache.put('enrichment', key, enrichment, ok=ok)
+    return enrichment
+
+
+def _enrichment_key(query):
+    return f"{PROMPT_VERSION}:{normalize_query(query)}"
+
+
+def cached_enrichment(query):
+    """The cached enrichment for query, or None without calling any provider."""
+    cached = get_cache().get('enrichment', _enrichment_key(query))
+    return None if is_missing(cached) else cached
+
+
+def _fallback_enrichment(query):
+    return {
+        'primary_attractions': [f"Sample attraction for {query}"],
+        'local_specialties': [f"Sample specialty for {query}"],
+        'activities': [f"Sample activity for {query}"],
+    }
+
+
+def is_fallback_enrichment(query, enrichment):
+    """True when enrichment is the sample placeholder returned after the providers failed."""
+    return enrichment == _fallback_enrichment(query)
+
+
+def _gemini_json(gemini_results):
+    """The JSON value in a Gemini response's first candidate (``` fences allowed), or None."""
+    try:
+        text = gemini_results['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        return None
+    match = re.search(r"```(?:json)?\s*([\s\S]+?)\s*```", text, re.IGNORECASE)
+    try:
+        return json.loads(match.group(1).strip() if match else text.strip())
+    except json.JSONDecodeError:
+        return None
+
+
+def _clean_enrichment(value):
+    """A well-formed enrichment dict from a parsed item, or None if it has no usable content."""
+    if not isinstance(value, dict):
+        return None
+    out = {}
+    for k in ENRICHMENT_KEYS:
+        items = value.get(k)
+        out[k] = [str(x) for x in items if str(x).strip()] if isinstance(items, list) else []
+    return out if any(out.values()) else None
+
+
+def _enrich_batch_uncached(queries):
+    """One Gemini request for up to GEMINI_BATCH_SIZE places; {query: enrichment} for items that parsed."""
+    with ThreadPoolExecutor(max_workers=SNIPPET_WORKERS) as pool:
+        snippets = list(pool.map(lambda q: fetch_snippets(q + ENRICHMENT), queries))
+    places = "\n\n".join(f"## {i}. {q}\n" + "\n".join(s) for i, (q, s) in enumerate(zip(queries, snippets), 1))
+    log.info("Batched Gemini request for %d places", len(queries))
+    prompt = GEMINI_BATCH_PROMPT.format(places=places)
+    response = call_gemini(prompt)
+    log_payload(log, "Batched Gemini exchange", prompt=prompt, response=response)
+    parsed = _gemini_json(response)
+    if isinstance(parsed, list):
+        parsed = {str(i): item for i, item in enumerate(parsed, 1)}
+    if not isinstance(parsed, dict):
+        return {}
+    out = {}
+    for i, q in enumerate(queries, 1):
+        enrichment = _clean_enrichment(parsed.get(str(i)))
+        if enrichment is not None:
+            out[q] = enrichment
+    return out
+
+
+def enrich_batch(queries, batch_size=GEMINI_BATCH_SIZE):
+    """Enrich many places with one Gemini request per batch_size cache misses.
+
+    Returns {query: enrichment}. Places the batched response leaves out, or that fail to
+    parse, fall back to enrich_from_serpapi_and_gemini one at a time.
+    """
+    cache = get_cache()
+    results, misses = {}, []
+    for q in dict.fromkeys(q for q in queries if q):
+        cached = cache.get('enrichment', _enrichment_key(q))
+        if is_missing(cached):
+            misses.append(q)
+        else:
+            results[q] = cached
+    if misses:
+        log.info("%d cached, %d to enrich in batches of %d", len(results), len(misses), batch_size)
+    for start in range(0, len(misses), batch_size):
+        chunk = misses[start:start + batch_size]
+        batched = {}
+        if GEMINI_API_KEY and len(chunk) > 1:
+            with ENRICHMENT_SECONDS.time(mode='batch'):
+                batched = _enrich_batch_uncached(chunk)
+        for q in chunk:
+            if q in batched:
+                cache.put('enrichment', _enrichment_key(q), batched[q], ok=True)
+                results[q] = batched[q]
+            else:
+                results[q] = enrich_from_serpapi_and_gemini(q)
+    return results
+
+
+def _enrich_uncached(query):
+    full_prompt = query + ENRICHMENT
+    log.info("Using SerpAPI and Gemini for '%s'", query)
+    snippets = fetch_snippets(full_prompt)
+    gemini_input = GEMINI_PROMPT.format(query=query, snippets="\n".join(snippets))
     gemini_results = call_gemini(gemini_input)
-    if gemini_results:
-        print("\n[Raw Gemini Response]:\n", gemini_results)
-    else:
-        print("[Gemini] No response from Gemini (skipped or errored). Will use fallback data if needed.")
+    # Prompt and raw response only at DEBUG, for a sample of calls (LOG_PAYLOAD_SAMPLE)
+    log_payload(log, "Gemini exchange", query=query, prompt=gemini_input, response=gemini_results)
+    if not gemini_results:
+        log.warning("No response from Gemini for '%s' (skipped or errored); will use fallback data if needed", query)
     # Initialize default enrichment
     enrichment = {
         'primary_attractions': [],
@@ -118,86 +307,57 @@ def enrich_from_serpapi_and_gemini(query):
                 parsed_data = json.loads(json_text)
                 if isinstance(parsed_data, dict):
                     enrichment = parsed_data
-                    print("[Gemini Success] Successfully parsed enrichment data")
+                    log.debug("Parsed Gemini enrichment for '%s'", query)
         except json.JSONDecodeError as e:
-            print(f"[JSON Parse Error] {e}")
-            if 'json_text' in locals():
-                print(f"[JSON Text]: {json_text[:200]}...")
+            log.warning("Gemini JSON parse error for '%s': %s", query, e,
+                        extra={'fields': {'text': json_text[:200]} if 'json_text' in locals() else {}})
         except KeyError as e:
-            print(f"[Response Structure Error] Missing key: {e}")
-            print(f"[Response Keys]: {gemini_results.keys() if isinstance(gemini_results, dict) else 'Not a dict'}")
+            keys = list(gemini_results.keys()) if isinstance(gemini_results, dict) else 'not a dict'
+            log.warning("Gemini response missing key %s for '%s'", e, query, extra={'fields': {'keys': keys}})
         except Exception as e:
-            print(f"[Gemini Parse Error] {type(e).__name__}: {e}")
+            log.warning("Gemini parse error for '%s': %s: %s", query, type(e).__name__, e)
     # Ensure all required keys exist and are lists
     for k in ['primary_attractions', 'local_specialties', 'activities']:
         if k not in enrichment or not isinstance(enrichment[k], list):
             enrichment[k] = []
     # If both SerpAPI and Gemini were skipped/failed, short-circuit to fallback for clarity
     if (not SERPAPI_KEY and not GEMINI_API_KEY) or not any(enrichment[k] for k in ['primary_attractions', 'activities', 'local_specialties']):
-        print("[Fallback] Using sample data as Gemini returned empty results")
-        enrichment = {
-            'primary_attractions': [f"Sample attraction for {query}"],
-            'local_specialties': [f"Sample specialty for {query}"],
-            'activities': [f"Sample activity for {query}"],
-        }
-    return enrichment
+        log.info("Using sample data for '%s' as Gemini returned empty results", query)
+        return _fallback_enrichment(query), False
+    return enrichment, True
+
+
 
+def fetch_and_add_village_once(query, synthetic):
+    """fetch_and_add_village, coalescing concurrent misses for the same place into one fetch."""
+    def run():
+        store = get_store()
+        G = store.graph()
+        # An earlier flight may already have added it, perhaps under a different spelling
+        existing = query if query in G else next(
+            (n for n in G.nodes if isinstance(n, str) and n.lower() == query.lower()), None)
+        if existing is None:
+            hits = fuzzy_search(G, query, k=1)
+            existing = hits[0][0] if hits else None
+        if existing is not None:
+            return [(existing, dict(G.nodes[existing]))]
+        return fetch_and_add_village(query, store.villages(), G, synthetic)
+    return flight_group('fetch_and_add').do(normalize_query(query), run)
 
 
 def fetch_and_add_village(query, merged, G, synthetic):
-    MAPQUEST_API_KEY = os.getenv('MAPQUEST_API_KEY')
-    locations = []
-    # Prefer MapQuest if API key is available, otherwise fallback to Nominatim (OpenStreetMap)
-    if MAPQUEST_API_KEY:
-        params = {"key": MAPQUEST_API_KEY, "location": f"{query}, India"}
-        response = requests.get('http://www.mapquestapi.com/geocoding/v1/address', params=params)
-        if response.status_code == 200:
-            data = response.json()
-            locations = data.get("results", [{}])[0].get("locations", [])
-    else:
-        # Use Nominatim free geocoding as a fallback so the script can run without MAPQUEST key
-        nom_url = 'https://nominatim.openstreetmap.org/search'
-        nom_params = {'q': f'{query}, India', 'format': 'json', 'limit': 1}
-        try:
-            nom_resp = requests.get(nom_url, params=nom_params, headers={'User-Agent': 'village-rag/1.0'})
-            if nom_resp.status_code == 200:
-                    nom_data = nom_resp.json()
-                    if nom_data:
-                        n = nom_data[0]
-                        lat = float(n.get('lat'))
-                        lng = float(n.get('lon'))
-                        addr = n.get('address', {}) if isinstance(n, dict) else {}
-                        # Prefer 'state' but fall back to county/region/state_district
-                        state_name = addr.get('state') or addr.get('county') or addr.get('region') or addr.get('state_district') or ''
-                        city_name = addr.get('city') or addr.get('town') or addr.get('village') or addr.get('municipality') or ''
-                        locations = [{
-                            'latLng': {'lat': lat, 'lng': lng},
-                            'adminArea3': state_name,
-                            'street': n.get('display_name', ''),
-                            'adminArea5': city_name,
-                            'adminArea4': addr.get('county', ''),
-                            'adminArea1': addr.get('country', ''),
-                        }]
-        except Exception:
-            locations = []
+    # MapQuest if MAPQUEST_API_KEY is set, otherwise Nominatim; results are cached locally
+    location = forward_geocode(query)
+    locations = [location] if location else []
     if locations:
         loc = locations[0]
         lat = loc.get("latLng", {}).get("lat")
         lng = loc.get("latLng", {}).get("lng")
         village_name = query
         state = loc.get("adminArea3", "")
-        # If MapQuest provided no state, try Nominatim reverse geocoding as a fallback
+        # If the geocoder provided no state, fall back to a (cached) Nominatim reverse lookup
         if not state and lat and lng:
-            try:
-                rev_url = 'https://nominatim.openstreetmap.org/reverse'
-                rev_params = {'lat': lat, 'lon': lng, 'format': 'json'}
-                rev_resp = requests.get(rev_url, params=rev_params, headers={'User-Agent': 'village-rag/1.0'})
-                if rev_resp.status_code == 200:
-                    rev_data = rev_resp.json()
-                    addr = rev_data.get('address', {})
-                    state = addr.get('state') or addr.get('county') or addr.get('region') or addr.get('state_district') or state
-            except Exception:
-                pass
+            state = reverse_state(lat, lng) or state
         # Enhanced enrichment
         enrichment = enrich_from_serpapi_and_gemini(query)
         new_village = {
@@ -213,102 +373,133 @@ def fetch_and_add_village(query, merged, G, synthetic):
             'local_specialties': enrichment['local_specialties'],
             'activities': enrichment['activities'],
         }
-        merged.append(new_village)
+        if not is_fallback_enrichment(query, enrichment):
+            new_village['last_updated'] = today()
         node_id = village_name
         # Convert all list attributes to strings for GraphML compatibility
         v_for_graph = new_village.copy()
         for k in ['primary_attractions', 'local_specialties', 'activities', 'sample_reviews']:
             if k in v_for_graph and isinstance(v_for_graph[k], list):
                 v_for_graph[k] = ', '.join(str(x) for x in v_for_graph[k])
-        G.add_node(node_id, **v_for_graph)
-        # Save updated data
-        with open('merged_villages.json', 'w', encoding='utf-8') as f:
-            json.dump(merged, f, indent=2, ensure_ascii=False)
-        nx.write_graphml(G, 'village_knowledge_graph.graphml')
-        print(f"Fetched and added new village: {village_name} ({lat}, {lng})")
+        store = get_store()
+        with store.write_lock:
+            G = store.graph()
+            change = graph_node_change(G, node_id) if node_id in G else {'attrs': {}, 'edges': []}
+            change['attrs'].update(v_for_graph)
+            # Log just this change; the store publishes it and updates the search indexes, and the
+            # JSON/GraphML snapshots are compacted in the background
+            store.commit(villages=[new_village], nodes={node_id: change})
+        log.info("Fetched and added new village: %s (%s, %s)", village_name, lat, lng)
         return [(node_id, new_village)]
     # No locations found
-    if MAPQUEST_API_KEY:
-        # MapQuest request may have failed
-        try:
-            status = response.status_code
-        except Exception:
-            status = 'unknown'
-        print(f"Error {status} from MapQuest API")
-    else:
-        print(f"No result found for {query}")
+    log.info("No result found for %s", query)
     return []
 
+def node_is_stale(attrs):
+    return is_stale(attrs, ENRICH_STALE_DAYS)
+
+
+def apply_enrichment(node, enrichment):
+    """Write an enrichment into graph node and its merged_villages record; False if node is gone."""
+    store = get_store()
+    stamp = today()
+    with store.write_lock:
+        G = store.graph()
+        if node not in G:
+            # Merged away or removed while the enrichment ran
+            return False
+        # New dicts: readers may be iterating the served records and graph
+        change = graph_node_change(G, node)
+        data = change['attrs']
+        changed = []
+        # Update merged dataset: the record with the node's village_id, else its name and state
+        record = store.village_by_key(village_key(data))
+        if record is not None:
+            changed.append({**record,
+                            'primary_attractions': enrichment['primary_attractions'],
+                            'local_specialties': enrichment['local_specialties'],
+                            'activities': enrichment['activities'],
+                            'last_updated': stamp})
+        # Update graph node
+        data['primary_attractions'] = ', '.join(enrichment['primary_attractions'])
+        data['local_specialties'] = ', '.join(enrichment['local_specialties'])
+        data['activities'] = ', '.join(enrichment['activities'])
+        data['last_updated'] = stamp
+        store.commit(villages=changed, nodes={node: change})
+    return True
+
+
+def refresh_village(node, name):
+    """Re-enrich one graph village; keeps the stored data when only sample fallback data comes back."""
+    enrichment = enrich_from_serpapi_and_gemini(name)
+    if is_fallback_enrichment(name, enrichment):
+        log.info("No fresh enrichment for '%s'; keeping the stored data", name)
+        return False
+    updated = apply_enrichment(node, enrichment)
+    if updated:
+        log.info("Refreshed '%s' (%s)", name, node)
+    return updated
+
+
+def schedule_refresh(node, attrs):
+    """Queue a background refresh of node if it is stale; returns whether it is stale."""
+    if not node_is_stale(attrs):
+        return False
+    name = attrs.get('village_name') or str(node)
+    try:
+        get_refresh_pool().submit(f"refresh:{node}", lambda: refresh_village(node, name))
+    except PoolFull as e:
+        # Served stale either way; a later request queues it again
+        log.debug("Not refreshing '%s': %s", name, e)
+    return True
+
+
 def rag_search(query):
     try:
-        # Initialize empty data structures if load functions fail
         synthetic = []
-        merged = []
-        G = nx.Graph()
-        
-        # Attempt to load data
         if os.path.exists('synthetic_data.json'):
             with open('synthetic_data.json', 'r', encoding='utf-8') as f:
                 synthetic = json.load(f)
-                
-        if os.path.exists('merged_villages.json') and os.path.exists('village_knowledge_graph.graphml'):
-            with open('merged_villages.json', 'r', encoding='utf-8') as f:
-                merged = json.load(f)
-            G = nx.read_graphml('village_knowledge_graph.graphml')
-            
+
+        # Shared in-memory datasets; the graph index is built once per loaded graph
+        store = get_store()
+        G = store.graph()
+
         results = []
         mode = "exact"
-        if G and merged:
-            # Search for exact matches first
-            exact_matches = [(node, G.nodes[node]) for node in G.nodes
-        if query.lower() in node.lower() or
-                    query.lower() in G.nodes[node].get('state', '').lower()]
-            
-            # If no exact matches, try fuzzy matching on attractions and activities
+        if G:
+            index = graph_index(G)
+            # Search names/states first, then fall back to attractions and activities
+            exact_matches = [(node, G.nodes[node]) for node, _ in index.search(query, fields=NAME_FIELDS) if node in G]
             if not exact_matches:
-                fuzzy_matches = []
-                for node in G.nodes:
-                    node_data = G.nodes[node]
-                    attractions = node_data.get('primary_attractions', '').lower()
-                    activities = node_data.get('activities', '').lower()
-                    if query.lower() in attractions or query.lower() in activities:
-                        fuzzy_matches.append((node, node_data))
-                results = fuzzy_matches
-                mode = "fuzzy"
+                # Misspelled names ("mawlynong", "kumbalgarh") before matching on attributes
+                results = [(node, G.nodes[node]) for node, _ in fuzzy_search(G, query)]
+                mode = "spelling"
+                if not results:
+                    results = [(node, G.nodes[node]) for node, _ in index.search(query, fields=ATTRIBUTE_FIELDS)
+                               if node in G]
+                    mode = "fuzzy"
+                if not results:
+                    # Nothing shares a token with the query; try embedding similarity before going online
+                    results = [(node, G.nodes[node]) for node, _ in semantic_search(G, query)]
+                    mode = "semantic"
             else:
                 results = exact_matches
                 mode = "exact"
-            
+
     except Exception as e:
-        print(f"Error loading or processing data: {str(e)}")
+        log.error("Error loading or processing data: %s: %s", type(e).__name__, e)
         return []
-    updated = False
     if results:
-        print(f"Found {len(results)} result(s) in knowledge graph:")
+        print(f"Found {len(results)} result(s) in knowledge graph ({mode} match):")
         for node, data in results:
-            # Always re-enrich using SerpAPI + Gemini
-            enrichment = enrich_from_serpapi_and_gemini(query)
-            # Update merged dataset
-            for v in merged:
-                if v.get('village_name', '').lower() == data.get('village_name', '').lower() and v.get('state', '').lower() == data.get('state', '').lower():
-                    v['primary_attractions'] = enrichment['primary_attractions']
-                    v['local_specialties'] = enrichment['local_specialties']
-                    v['activities'] = enrichment['activities']
-                    break
-            # Update graph node
-            G.nodes[node]['primary_attractions'] = ', '.join(enrichment['primary_attractions'])
-            G.nodes[node]['local_specialties'] = ', '.join(enrichment['local_specialties'])
-            G.nodes[node]['activities'] = ', '.join(enrichment['activities'])
-            print(f"- {data.get('village_name', node)} | State: {data.get('state', '')} | Attractions: {enrichment['primary_attractions']} | Activities: {enrichment['activities']}")
-            updated = True
-        if updated:
-            with open('merged_villages.json', 'w', encoding='utf-8') as f:
-                json.dump(merged, f, indent=2, ensure_ascii=False)
-            nx.write_graphml(G, 'village_knowledge_graph.graphml')
+            # Answer from the graph now; stale villages are re-enriched in the background
+            stale = schedule_refresh(node, data)
+            print(f"- {data.get('village_name', node)} | State: {data.get('state', '')} | Attractions: {data.get('primary_attractions', '')} | Activities: {data.get('activities', '')}{' | stale, refreshing' if stale else ''}")
         return results
     else:
         print(f"No result found in graph. Fetching real-time data...")
-        new_results = fetch_and_add_village(query, merged, G, synthetic)
+        new_results = fetch_and_add_village_once(query, synthetic)
         if new_results:
             print(f"New data added and returned:")
             for node, data in new_results:
@@ -328,4 +519,7 @@ if __name__ == "__main__":
             if query.lower() == 'exit':
                 break
             rag_search(query)
-            print("---")
\ No newline at end of file
+            print("---")
+    # Let queued refreshes land, then fold this session's logged changes into the snapshots
+    get_refresh_pool().shutdown()
+    get_store().compact_all()
\ No newline at end of file
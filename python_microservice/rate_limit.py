@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+
+# Requests per second allowed per provider; override with e.g. SERPAPI_RPS=2
+DEFAULT_RATES = {
+    'serpapi': 5.0,
+    'gemini': 2.0,
+    'mapbox': 10.0,
+    'mapquest': 5.0,
+    'nominatim': 1.0,  # Nominatim usage policy: at most 1 request per second
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1.0, timeout=None):
+        """Block until `tokens` are available; returns False if `timeout` seconds pass first."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """Shared limiter for a provider, configured from `<PROVIDER>_RPS` (0 disables limiting)."""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                rate = float(os.getenv(f'{provider.upper()}_RPS', DEFAULT_RATES.get(provider, 1.0)))
+                burst = os.getenv(f'{provider.upper()}_BURST')
+                limiter = TokenBucket(rate, float(burst) if burst else None)
+                _limiters[provider] = limiter
+    return limiter
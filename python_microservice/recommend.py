@@ -0,0 +1,235 @@
+"""'Similar villages' from shared attraction/specialty/activity features.
+
+Each village is a sparse binary vector over features (its ``attraction::`` / ``specialty::``
+neighbours in the graph plus the values of its attraction, specialty and activity lists),
+weighted by inverse document frequency so rare features count for more than ubiquitous ones.
+The top-k neighbours of every village are precomputed from the feature postings and kept up to
+date incrementally when a village is re-enriched or added.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+from search_index import IndexCache, is_village_node
+from shared_snapshot import node_fields
+from spatial_index import haversine_km, node_coords, spatial_index
+
+SIMILAR_TOP_K = int(os.getenv('SIMILAR_TOP_K', '50'))
+# 'cosine' or 'jaccard' (both IDF-weighted)
+SIMILAR_METRIC = os.getenv('SIMILAR_METRIC', 'cosine')
+LIST_FEATURES = {'primary_attractions': 'attraction', 'local_specialties': 'specialty', 'activities': 'activity'}
+
+
+def village_features(G, node, data=None):
+    data = G.nodes[node] if data is None else data
+    feats = {nbr.lower() for nbr in G.adj[node] if isinstance(nbr, str) and '::' in nbr}
+    for attr, kind in LIST_FEATURES.items():
+        value = data.get(attr) or ''
+        items = value if isinstance(value, (list, tuple)) else str(value).split(',')
+        feats.update(f"{kind}::{str(x).strip().lower()}" for x in items if str(x).strip())
+    return frozenset(feats)
+
+
+class SimilarityIndex:
+    def __init__(self, G, top_k=SIMILAR_TOP_K, metric=SIMILAR_METRIC):
+        self.top_k = top_k
+        self.metric = metric
+        self.nodes = []
+        self.row_of = {}
+        self.features = {}
+        self.postings = {}  # feature -> set of rows
+        self._arrays = {}   # feature -> np.array of rows (cached view of postings)
+        self.idf = {}
+        self.norm = np.zeros(0)
+        self.top = {}
+        self._lock = threading.RLock()
+        villages = []
+        for node, data in node_fields(G, LIST_FEATURES):
+            if is_village_node(node):
+                villages.append(node)
+                self._add_row(node, village_features(G, node, data))
+        n = max(len(villages), 1)
+        self.idf = {f: math.log(1 + n / len(rows)) for f, rows in self.postings.items()}
+        self.norm = np.array([self._norm(self.features[v]) for v in self.nodes])
+        for node in villages:
+            self.top[node] = self._compute(node)
+
+    def _add_row(self, node, feats):
+        row = self.row_of[node] = len(self.nodes)
+        self.nodes.append(node)
+        self.features[node] = feats
+        for f in feats:
+            self.postings.setdefault(f, set()).add(row)
+            self._arrays.pop(f, None)
+        return row
+
+    def _weight(self, f):
+        w = self.idf.get(f)
+        if w is None:
+            # Feature first seen after the build: weight it from its current document frequency
+            w = self.idf[f] = math.log(1 + max(len(self.nodes), 1) / max(len(self.postings.get(f, ())), 1))
+        return w
+
+    def _norm(self, feats):
+        if self.metric == 'jaccard':
+            return sum(self._weight(f) for f in feats)
+        return math.sqrt(sum(self._weight(f) ** 2 for f in feats))
+
+    def _posting(self, f):
+        arr = self._arrays.get(f)
+        if arr is None:
+            arr = self._arrays[f] = np.fromiter(self.postings.get(f, ()), dtype=np.int64)
+        return arr
+
+    def _scores(self, feats, exclude=None):
+        """(rows, scores) of every village sharing a feature with feats."""
+        feats = [f for f in feats if self.postings.get(f)]
+        if not feats:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        arrays = [self._posting(f) for f in feats]
+        power = 1 if self.metric == 'jaccard' else 2
+        weights = np.repeat([self._weight(f) ** power for f in feats], [len(a) for a in arrays])
+        rows, inverse = np.unique(np.concatenate(arrays), return_inverse=True)
+        shared = np.bincount(inverse, weights=weights)
+        own = self._norm(feats)
+        if self.metric == 'jaccard':
+            scores = shared / np.maximum(own + self.norm[rows] - shared, 1e-12)
+        else:
+            scores = shared / np.maximum(own * self.norm[rows], 1e-12)
+        if exclude is not None:
+            keep = rows != exclude
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
+
+    def _compute(self, node):
+        rows, scores = self._scores(self.features[node], exclude=self.row_of[node])
+        if len(rows) > self.top_k:
+            best = np.argpartition(-scores, self.top_k - 1)[:self.top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return [(self.nodes[rows[i]], float(scores[i])) for i in order]
+
+    def update(self, node, feats):
+        """Re-index one village after its features changed and patch the affected neighbour lists."""
+        with self._lock:
+            old = self.features.get(node, frozenset())
+            row = self.row_of.get(node)
+            if row is None:
+                row = self._add_row(node, feats)
+                self.norm = np.append(self.norm, 0.0)
+            elif feats != old:
+                for f in old - feats:
+                    self.postings[f].discard(row)
+                    self._arrays.pop(f, None)
+                for f in feats - old:
+                    self.postings.setdefault(f, set()).add(row)
+                    self._arrays.pop(f, None)
+                self.features[node] = feats
+            else:
+                return
+            self.norm[row] = self._norm(feats)
+            self.top[node] = self._compute(node)
+            # Villages sharing a feature now get their new score from one vectorized pass;
+            # those that shared only a dropped feature can lose this one but never gain it
+            rows, scores = self._scores(feats, exclude=row)
+            new_score = dict(zip(rows.tolist(), scores.tolist()))
+            candidates = set(new_score)
+            for f in old - feats:
+                candidates.update(self.postings.get(f, ()))
+            candidates.discard(row)
+            for r in candidates:
+                other = self.nodes[r]
+                if other not in self.features:
+                    continue
+                current = self.top.get(other, [])
+                if any(n == node for n, _ in current):
+                    # Its score may have dropped below a neighbour we did not keep; recompute exactly
+                    self.top[other] = self._compute(other)
+                    continue
+                score = new_score.get(r, 0.0)
+                if score > 0 and (len(current) < self.top_k or score > current[-1][1]):
+                    merged = sorted(current + [(node, score)], key=lambda ns: -ns[1])
+                    self.top[other] = merged[:self.top_k]
+
+    def _pair(self, other, feats):
+        shared_feats = self.features[other] & feats
+        if not shared_feats:
+            return 0.0
+        power = 1 if self.metric == 'jaccard' else 2
+        shared = sum(self._weight(f) ** power for f in shared_feats)
+        own, theirs = self._norm(feats), self.norm[self.row_of[other]]
+        if self.metric == 'jaccard':
+            return shared / max(own + theirs - shared, 1e-12)
+        return shared / max(own * theirs, 1e-12)
+
+    def remove(self, node):
+        with self._lock:
+            row = self.row_of.get(node)
+            if row is None:
+                return
+            self.update(node, frozenset())
+            del self.features[node]
+            self.top.pop(node, None)
+            for other, current in self.top.items():
+                if any(n == node for n, _ in current):
+                    self.top[other] = [(n, s) for n, s in current if n != node]
+
+    def similar(self, G, node, k=10, geo_weight=0.0, scale_km=100.0):
+        """Top k [(node, score, feature_score, km or None)] for a village.
+
+        With geo_weight > 0 the score is (1 - geo_weight) * feature similarity +
+        geo_weight * exp(-km / scale_km), over the precomputed neighbours plus the
+        villages nearest to it on the map.
+        """
+        with self._lock:
+            ranked = list(self.top.get(node, []))
+            if geo_weight <= 0:
+                return [(n, s, s, None) for n, s in ranked[:k]]
+            origin = node_coords(G.nodes[node])
+            if origin is None:
+                return [(n, (1 - geo_weight) * s, s, None) for n, s in ranked[:k]]
+            candidates = dict(ranked)
+            feats = self.features.get(node, frozenset())
+            for other, _ in spatial_index(G).nearest(origin[0], origin[1], k=self.top_k + 1):
+                if other != node and other not in candidates and other in self.features:
+                    candidates[other] = self._pair(other, feats)
+        nodes = [n for n in candidates if n in G]
+        coords = [node_coords(G.nodes[n]) for n in nodes]
+        located = [i for i, c in enumerate(coords) if c is not None]
+        km = [None] * len(nodes)
+        if located:
+            pts = np.array([coords[i] for i in located])
+            for i, d in zip(located, haversine_km(origin[0], origin[1], pts[:, 0], pts[:, 1]).tolist()):
+                km[i] = d
+        out = []
+        for n, d in zip(nodes, km):
+            s = candidates[n]
+            proximity = math.exp(-d / scale_km) if d is not None else 0.0
+            out.append((n, (1 - geo_weight) * s + geo_weight * proximity, s, d))
+        out.sort(key=lambda x: -x[1])
+        return out[:k]
+
+    def shared(self, a, b):
+        return sorted(self.features.get(a, frozenset()) & self.features.get(b, frozenset()))
+
+
+_similarity_cache = IndexCache(SimilarityIndex)
+
+
+def similarity_index(G):
+    """Precomputed neighbour lists for the village nodes of G."""
+    return _similarity_cache.get(G)
+
+
+def update_node(G, node):
+    """Refresh one village's features and the neighbour lists it appears in."""
+    index = _similarity_cache.built(G)
+    if index is None:
+        # Not built yet; the build will include the node
+        return
+    if node in G and is_village_node(node):
+        index.update(node, village_features(G, node))
+    else:
+        index.remove(node)
@@ -0,0 +1,106 @@
+"""Bounded background pool for enrichment that requests should not wait on.
+
+/search answers from the knowledge graph straight away. When the matched village is stale, its
+refresh is queued here and written to the store when it finishes (stale-while-revalidate).
+Cache misses are enriched here too, and the request waits only for what is left of its
+deadline budget.
+
+Jobs are keyed. A key that is already queued or running shares that job, and a key that
+finished less than ENRICH_RETRY_SECONDS ago is not run again. With ENRICH_QUEUE_MAX jobs
+outstanding, new work is refused instead of piling up behind a slow provider.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger
+
+ENRICH_WORKERS = int(os.getenv('ENRICH_WORKERS', '4'))
+# Jobs queued or running at once; further submissions raise PoolFull
+ENRICH_QUEUE_MAX = int(os.getenv('ENRICH_QUEUE_MAX', '100'))
+# A key is not refreshed again within this many seconds of its last run
+ENRICH_RETRY_SECONDS = float(os.getenv('ENRICH_RETRY_SECONDS', '300'))
+
+log = get_logger('Refresh')
+
+
+class PoolFull(Exception):
+    """The pool already has its maximum number of jobs queued or running."""
+
+
+class RefreshPool:
+    def __init__(self, name, workers=ENRICH_WORKERS, max_jobs=ENRICH_QUEUE_MAX, retry_after=ENRICH_RETRY_SECONDS):
+        self.name = name
+        self.max_jobs = max_jobs
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{name}-refresh')
+        # key -> Future while queued or running; key -> monotonic finish time afterwards
+        self._jobs = {}
+        self._finished = {}
+        # Reentrant: a future that is already done runs its callback inside submit()
+        self._lock = threading.RLock()
+        self.stats = {'submitted': 0, 'coalesced': 0, 'skipped': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key, fn, force=False):
+        """Future for fn() under key, sharing a job already queued or running for it.
+
+        Returns None if key finished within retry_after seconds (unless force); raises
+        PoolFull when max_jobs are outstanding.
+        """
+        with self._lock:
+            fut = self._jobs.get(key)
+            if fut is not None:
+                self.stats['coalesced'] += 1
+                return fut
+            finished = self._finished.get(key)
+            if not force and finished is not None and time.monotonic() - finished < self.retry_after:
+                self.stats['skipped'] += 1
+                return None
+            if len(self._jobs) >= self.max_jobs:
+                self.stats['rejected'] += 1
+                raise PoolFull(f"{self.name}: {len(self._jobs)} jobs already queued")
+            fut = self._executor.submit(fn)
+            self._jobs[key] = fut
+            self.stats['submitted'] += 1
+            fut.add_done_callback(lambda f: self._done(key, f))
+            return fut
+
+    def _done(self, key, fut):
+        with self._lock:
+            if self._jobs.get(key) is fut:
+                del self._jobs[key]
+            now = time.monotonic()
+            self._finished[key] = now
+            if len(self._finished) > 10 * self.max_jobs:
+                # Forget keys whose retry window has passed
+                self._finished = {k: t for k, t in self._finished.items() if now - t < self.retry_after}
+            if fut.cancelled():
+                return
+            if fut.exception() is not None:
+                self.stats['failed'] += 1
+                log.warning("%s job '%s' failed: %s: %s", self.name, key,
+                            type(fut.exception()).__name__, fut.exception())
+            else:
+                self.stats['completed'] += 1
+
+    def shutdown(self, wait=True):
+        """Drop queued jobs and (with wait) let running ones finish."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'queued': len(self._jobs)}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_refresh_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RefreshPool('enrichment')
+    return _pool
@@ -1,8 +1,10 @@
-import requests
+import argparse
 import json
 import pandas as pd
+import threading
 import time
 import networkx as nx
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import os
 from dotenv import load_dotenv
 import sys
@@ -15,13 +17,26 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 load_dotenv()
 
 # Import RAG functions
-from rag_search_with_realtime_update import enrich_from_serpapi_and_gemini
+from rag_search_with_realtime_update import GEMINI_BATCH_SIZE, enrich_batch, is_fallback_enrichment
+from geocode import bulk_geocode
+from http_client import ProviderUnavailable, client
+from graph_snapshot import write_snapshot
+from dedupe import dedupe_records
+from pipeline_checkpoint import STALE_DAYS, PipelineCheckpoint, missing_fields
+
+# Worker threads and the cap on submitted-but-unfinished tasks. Throughput is bounded by the
+# per-provider token buckets used by http_client, not by these.
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv("PIPELINE_MAX_IN_FLIGHT", str(PIPELINE_WORKERS * 2)))
+PROGRESS_INTERVAL = float(os.getenv("PIPELINE_PROGRESS_INTERVAL", "5"))
 
 MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN", "pk.eyJ1IjoiMjJ1MTYzOSIsImEiOiJjbWN6cWc5OGsweDdhMmxwdDV2a2VtaWpmIn0.Q1HTd_oCEFDP2v_qyhYd6Q")
 MAPQUEST_API_KEY = os.getenv("MAPQUEST_API_KEY", "w8wEUww9j74XlTzphdpKVeYJJiQl1xuW")
 
-SEARCH_URL_MAPBOX = "https://api.mapbox.com/geocoding/v5/mapbox.places/{}.json"
-SEARCH_URL_MAPQUEST = "http://www.mapquestapi.com/search/v4/place"
+MAPBOX_BASE_URL = os.getenv("MAPBOX_BASE_URL", "https://api.mapbox.com")
+MAPQUEST_BASE_URL = os.getenv("MAPQUEST_BASE_URL", "http://www.mapquestapi.com")
+SEARCH_URL_MAPBOX = MAPBOX_BASE_URL + "/geocoding/v5/mapbox.places/{}.json"
+SEARCH_URL_MAPQUEST = MAPQUEST_BASE_URL + "/search/v4/place"
 
 search_config = {
     "Rajasthan": ["rural", "desert", "heritage", "camel", "haveli"],
@@ -40,7 +55,11 @@ def search_mapbox(state, keyword):
     query = f"{keyword} village tourism {state} India"
     url = SEARCH_URL_MAPBOX.format(query)
     params = {"access_token": MAPBOX_TOKEN, "limit": 10, "country": "IN"}
-    response = requests.get(url, params=params)
+    try:
+        response = client("mapbox").get(url, params=params)
+    except ProviderUnavailable as e:
+        print(f"[Mapbox] {e}")
+        return []
     if response.status_code == 200:
         return response.json().get("features", [])
     return []
@@ -48,47 +67,151 @@ def search_mapbox(state, keyword):
 def search_mapquest(state, keyword):
     query = f"{keyword} village tourism {state} India"
     params = {"location": "India", "q": query, "sort": "relevance", "feedback": "false", "key": MAPQUEST_API_KEY, "limit": 10}
-    response = requests.get(SEARCH_URL_MAPQUEST, params=params)
+    try:
+        response = client("mapquest").get(SEARCH_URL_MAPQUEST, params=params)
+    except ProviderUnavailable as e:
+        print(f"[MapQuest] {e}")
+        return []
     if response.status_code == 200:
         return response.json().get("results", [])
     return []
 
+class Progress:
+    """Thread-safe progress counter that prints a status line at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, ok=True):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+            now = time.monotonic()
+            if self.done == self.total or now - self._last >= PROGRESS_INTERVAL:
+                self._last = now
+                self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        print(f"[Progress] {self.label}: {self.done}/{self.total} ({pct:.0f}%) "
+              f"failed={self.failed} {rate:.2f}/s eta={eta:.0f}s", flush=True)
+
+
+def run_concurrently(fn, items, label, workers=None, max_in_flight=None):
+    """Apply fn to every item on a bounded thread pool; results come back in input order.
+
+    At most max_in_flight tasks are submitted at once so huge inputs don't queue up in memory.
+    A task that raises yields None and is counted as failed.
+    """
+    workers = workers or PIPELINE_WORKERS
+    max_in_flight = max(workers, max_in_flight or PIPELINE_MAX_IN_FLIGHT)
+    items = list(items)
+    results = [None] * len(items)
+    progress = Progress(label, len(items))
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        it = iter(enumerate(items))
+        while True:
+            for i, item in it:
+                pending[pool.submit(fn, item)] = i
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                i = pending.pop(fut)
+                try:
+                    results[i] = fut.result()
+                    progress.update(ok=True)
+                except Exception as e:
+                    print(f"[{label}] item {i} failed: {type(e).__name__}: {e}")
+                    progress.update(ok=False)
+    return results
+
+
+def _collect_one(task):
+    state, keyword, provider = task
+    found = []
+    if provider == "mapbox":
+        for feature in search_mapbox(state, keyword):
+            found.append({
+                "name": feature.get("text"),
+                "state": state,
+                "address": feature.get("place_name"),
+                "lat": feature.get("center", [None, None])[1],
+                "lng": feature.get("center", [None, None])[0],
+                "source": "mapbox"
+            })
+    else:
+        for place in search_mapquest(state, keyword):
+            found.append({
+                "name": place.get("name"),
+                "state": state,
+                "address": place.get("displayString"),
+                "lat": place.get("place", {}).get("geometry", {}).get("coordinates", [None, None])[1] if place.get("place") else None,
+                "lng": place.get("place", {}).get("geometry", {}).get("coordinates", [None, None])[0] if place.get("place") else None,
+                "source": "mapquest"
+            })
+    return found
+
+
 def collect_initial_data():
+    tasks = [(state, keyword, provider)
+             for state, keywords in search_config.items()
+             for keyword in keywords
+             for provider in ("mapbox", "mapquest")]
     all_villages = []
-    for state, keywords in search_config.items():
-        for keyword in keywords:
-            # Mapbox
-            for feature in search_mapbox(state, keyword):
-                all_villages.append({
-                    "name": feature.get("text"),
-                    "state": state,
-                    "address": feature.get("place_name"),
-                    "lat": feature.get("center", [None, None])[1],
-                    "lng": feature.get("center", [None, None])[0],
-                    "source": "mapbox"
-                })
-            # Mapquest
-            for place in search_mapquest(state, keyword):
-                all_villages.append({
-                    "name": place.get("name"),
-                    "state": state,
-                    "address": place.get("displayString"),
-                    "lat": place.get("place", {}).get("geometry", {}).get("coordinates", [None, None])[1] if place.get("place") else None,
-                    "lng": place.get("place", {}).get("geometry", {}).get("coordinates", [None, None])[0] if place.get("place") else None,
-                    "source": "mapquest"
-                })
-            time.sleep(0.5)
+    for found in run_concurrently(_collect_one, tasks, "collect"):
+        all_villages.extend(found or [])
 
     unique_villages = {(v["name"], v["state"]): v for v in all_villages if v.get('name')}
     return list(unique_villages.values())
 
-def run_rag_and_update(villages):
-    # The RAG function now uses env vars directly
-    for village in villages:
-        query = f"{village['name']}, {village['state']}"
-        enrichment = enrich_from_serpapi_and_gemini(query)
-        village.update(enrichment)
-        time.sleep(1) # Avoid hitting rate limits
+def fill_missing_coordinates(villages):
+    """Bulk-geocode villages the search providers returned without coordinates."""
+    missing = [v for v in villages if v.get("lat") is None or v.get("lng") is None]
+    if not missing:
+        return villages
+    places = {id(v): f"{v['name']}, {v['state']}" for v in missing}
+    located = bulk_geocode(list(places.values()))
+    for v in missing:
+        loc = located.get(places[id(v)])
+        if loc:
+            v["lat"] = loc.get("latLng", {}).get("lat")
+            v["lng"] = loc.get("latLng", {}).get("lng")
+    return villages
+
+def _enrich_batch(villages, checkpoint=None, run_id=None):
+    results = enrich_batch([f"{v['name']}, {v['state']}" for v in villages])
+    enriched = []
+    for v in villages:
+        query = f"{v['name']}, {v['state']}"
+        found = results.get(query)
+        # Sample placeholder data means the providers failed; keep the record pending for a retry
+        if found and not is_fallback_enrichment(query, found):
+            v.update(found)
+            enriched.append(v)
+    # Checkpoint as each batch completes; villages that got nothing stay pending for a resume
+    if checkpoint is not None and enriched:
+        checkpoint.save_enriched(enriched, run_id)
+    return villages
+
+def run_rag_and_update(villages, checkpoint=None, run_id=None):
+    # One Gemini request per GEMINI_BATCH_SIZE villages; SerpAPI/Gemini calls are paced by their
+    # token buckets, and villages are enriched in place
+    batches = [villages[i:i + GEMINI_BATCH_SIZE] for i in range(0, len(villages), GEMINI_BATCH_SIZE)]
+    run_concurrently(lambda batch: _enrich_batch(batch, checkpoint, run_id), batches, "enrich")
     return villages
 
 def build_graph(villages):
@@ -102,16 +225,64 @@ def build_graph(villages):
         G.add_node(node_id, **v_for_graph)
     return G
 
+def seed_from_dataset(checkpoint, path):
+    """Start an incremental checkpoint from the last full run's dataset."""
+    if len(checkpoint) or not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return checkpoint.add_collected([v for v in json.load(f) if v.get("name")])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect, enrich and compile the village dataset.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-enrich records older than --stale-days or missing fields")
+    parser.add_argument("--stale-days", type=float, default=STALE_DAYS,
+                        help="age in days after which an incremental run refreshes a record")
+    parser.add_argument("--collect", action="store_true",
+                        help="with --incremental, also search the providers for new villages")
+    parser.add_argument("--restart", action="store_true",
+                        help="start a new run instead of resuming an unfinished one")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    print("Step 1: Collecting initial data from Mapbox and Mapquest...")
-    initial_data = collect_initial_data()
-    # Removed limiter; process all villages
-    print(f"Collected {len(initial_data)} unique villages.")
+    args = parse_args()
+    mode = "incremental" if args.incremental else "full"
+    checkpoint = PipelineCheckpoint()
+    resumed = None if args.restart else checkpoint.unfinished_run(mode)
+    if resumed:
+        run_id, collected = resumed
+        print(f"Resuming {mode} run {run_id} from {checkpoint.path}")
+    else:
+        run_id, collected = checkpoint.start_run(mode, args.stale_days), False
+        print(f"Starting {mode} run {run_id} (checkpoint: {checkpoint.path})")
+
+    if mode == "incremental":
+        seeded = seed_from_dataset(checkpoint, "../data/final_village_dataset.json")
+        if seeded:
+            print(f"Seeded checkpoint with {seeded} villages from the existing dataset.")
 
-    print("\nStep 2: Enriching data with RAG model (SerpAPI + Gemini)...")
-    enriched_data = run_rag_and_update(initial_data)
+    if collected:
+        print("Step 1: Skipped, villages were collected before the interruption.")
+    elif mode == "full" or args.collect:
+        print("Step 1: Collecting initial data from Mapbox and Mapquest...")
+        initial_data = collect_initial_data()
+        # Removed limiter; process all villages
+        print(f"Collected {len(initial_data)} unique villages.")
+        initial_data = fill_missing_coordinates(initial_data)
+        # Mapbox and MapQuest often return the same place under slightly different names/coordinates
+        initial_data = dedupe_records(initial_data)
+        print(f"{len(initial_data)} after merging duplicates; {checkpoint.add_collected(initial_data)} of them are new.")
+        checkpoint.mark_collected(run_id)
+    else:
+        checkpoint.mark_collected(run_id)
+
+    pending = checkpoint.pending(run_id, mode, args.stale_days)
+    fill_missing_coordinates([v for v in pending if "coordinates" in missing_fields(v)])
+    print(f"\nStep 2: Enriching {len(pending)} of {len(checkpoint)} villages with RAG model (SerpAPI + Gemini)...")
+    run_rag_and_update(pending, checkpoint, run_id)
 
     print("\nStep 3: Building knowledge graph...")
+    enriched_data = [record for record, _ in checkpoint.records()]
     village_graph = build_graph(enriched_data)
     print(f"Graph created with {village_graph.number_of_nodes()} nodes.")
 
@@ -121,5 +292,6 @@ if __name__ == "__main__":
         json.dump(enriched_data, f, indent=2, ensure_ascii=False)
     os.makedirs("../models", exist_ok=True)
     nx.write_graphml(village_graph, "../models/final_village_knowledge_graph.graphml")
-
-    print("\nPipeline complete! Final dataset and graph saved.")
\ No newline at end of file
+    # GraphML is the interchange copy; the service loads the compiled snapshot (written last so it is newer)
+    write_snapshot(village_graph, "../models/final_village_knowledge_graph.vkg")
+    checkpoint.finish_run(run_id)
@@ -0,0 +1,285 @@
+import collections
+import re
+import threading
+
+from shared_snapshot import node_fields
+
+# Field weights used for ranking; name hits outrank state, which outranks attribute hits
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'state': 2.0,
+    'primary_attractions': 1.0,
+    'activities': 1.0,
+    'local_specialties': 1.0,
+}
+NAME_FIELDS = ('name', 'state')
+# Node attributes graph_node_fields() reads
+GRAPH_NODE_ATTRS = ('village_name', 'state', 'primary_attractions', 'activities', 'local_specialties')
+ATTRIBUTE_FIELDS = ('primary_attractions', 'activities', 'local_specialties')
+
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+# Superseded store versions an IndexCache still answers for, while requests holding them finish
+SUPERSEDED_VERSIONS = 4
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = ' '.join(str(x) for x in text)
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _prefixes(token):
+    if len(token) < MIN_PREFIX:
+        return [token]
+    return [token[:i] for i in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1)]
+
+
+def village_fields(record):
+    """Map a merged_villages.json record to the indexed fields."""
+    return {
+        'name': record.get('village_name') or record.get('name') or '',
+        'state': record.get('state') or '',
+        'primary_attractions': record.get('primary_attractions') or '',
+        'activities': record.get('activities') or '',
+        'local_specialties': record.get('local_specialties') or '',
+    }
+
+
+def graph_node_fields(node, data):
+    """Map a knowledge graph village node to the indexed fields (node id counts as a name)."""
+    fields = village_fields(data)
+    name = data.get('village_name') or ''
+    fields['name'] = node if not name or name == node else f"{name} {node}"
+    return fields
+
+
+def is_village_node(node):
+    # attraction::/specialty:: feature nodes carry no searchable attributes
+    return '::' not in str(node)
+
+
+class InvertedIndex:
+    """Token and prefix postings per field, supporting ranked AND/OR queries and incremental updates."""
+
+    def __init__(self, weights=FIELD_WEIGHTS):
+        self.weights = dict(weights)
+        # field -> token -> {doc_id: term frequency}
+        self._tokens = {f: {} for f in self.weights}
+        # field -> prefix -> set(doc_id)
+        self._prefixes = {f: {} for f in self.weights}
+        # doc_id -> field -> {token: tf}, kept so a document can be removed or replaced
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def add(self, doc_id, fields):
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+            doc = {}
+            for field, text in fields.items():
+                if field not in self.weights:
+                    continue
+                counts = {}
+                for tok in tokenize(text):
+                    counts[tok] = counts.get(tok, 0) + 1
+                if not counts:
+                    continue
+                doc[field] = counts
+                tokens, prefixes = self._tokens[field], self._prefixes[field]
+                for tok, tf in counts.items():
+                    tokens.setdefault(tok, {})[doc_id] = tf
+                    for p in _prefixes(tok):
+                        prefixes.setdefault(p, set()).add(doc_id)
+            self._docs[doc_id] = doc
+
+    update = add
+
+    def remove(self, doc_id):
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id)
+        for field, counts in doc.items():
+            tokens, prefixes = self._tokens[field], self._prefixes[field]
+            for tok in counts:
+                postings = tokens.get(tok)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del tokens[tok]
+                for p in _prefixes(tok):
+                    ids = prefixes.get(p)
+                    if ids is None:
+                        continue
+                    ids.discard(doc_id)
+                    if not ids:
+                        del prefixes[p]
+
+    def _term_scores(self, term, fields):
+        """Score every document matching one query term (exact token or token prefix)."""
+        scores = {}
+        for field in fields:
+            weight = self.weights[field]
+            exact = self._tokens[field].get(term, {})
+            for doc_id in self._prefixes[field].get(term[:MAX_PREFIX], ()):
+                if len(term) > MAX_PREFIX and not any(
+                        t.startswith(term) for t in self._docs[doc_id].get(field, {})):
+                    continue
+                # Whole-token matches count double relative to prefix-only matches
+                score = weight * (2.0 * exact[doc_id] if doc_id in exact else 1.0)
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return scores
+
+    def search(self, query, mode='and', fields=None, limit=None):
+        """Return [(doc_id, score)] ranked by score; mode 'and' requires every term to match."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        fields = [f for f in (fields or self.weights) if f in self.weights]
+        with self._lock:
+            per_term = [self._term_scores(t, fields) for t in terms]
+        if mode == 'or':
+            total = {}
+            for scores in per_term:
+                for doc_id, s in scores.items():
+                    total[doc_id] = total.get(doc_id, 0.0) + s
+        else:
+            per_term.sort(key=len)
+            total = dict(per_term[0])
+            for scores in per_term[1:]:
+                total = {d: s + scores[d] for d, s in total.items() if d in scores}
+                if not total:
+                    break
+        ranked = sorted(total.items(), key=lambda kv: (-kv[1], str(kv[0])))
+        return ranked[:limit] if limit else ranked
+
+
+class IndexCache:
+    """Keeps one index per source object, rebuilding only when the store loads a new object.
+
+    A new version the store publishes for logged changes takes the index over (advance())
+    instead, and the index is then updated per changed record or node.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._source = None
+        self._index = None
+        self._superseded = collections.deque(maxlen=SUPERSEDED_VERSIONS)
+        self._lock = threading.Lock()
+        # Held for the length of a build, so built() and advance() never wait for one
+        self._build_lock = threading.Lock()
+        _caches.append(self)
+
+    def _serves(self, source):
+        return source is self._source or any(source is s for s in self._superseded)
+
+    def get(self, source):
+        if self._index is not None and self._serves(source):
+            return self._index
+        with self._build_lock:
+            with self._lock:
+                if self._index is not None and self._serves(source):
+                    return self._index
+            # Changes published meanwhile skip this index; the next version gets a fresh build
+            index = self._build(source)
+            with self._lock:
+                self._index, self._source = index, source
+                self._superseded.clear()
+        return index
+
+    def built(self, source):
+        """The index if one is already built for source, else None (without building it)."""
+        with self._lock:
+            return self._index if source is self._source else None
+
+    def advance(self, old, new):
+        """Hand the index built for old over to new, the next version of it.
+
+        Requests still holding old are served the same index (which may already list entries
+        only new has) rather than a rebuild for a version nobody will ask for again.
+        """
+        with self._lock:
+            if self._index is not None and old is self._source:
+                self._superseded.append(old)
+                self._source = new
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after records were removed from a list indexed by position."""
+        with self._lock:
+            self._index = None
+
+
+# Every IndexCache, so a new store version can be handed to all of them
+_caches = []
+
+
+def advance_indexes(old, new):
+    """Hand every index built for old over to new, the store's next version of it."""
+    for cache in _caches:
+        cache.advance(old, new)
+
+
+def build_villages_index(villages):
+    index = InvertedIndex()
+    for i, v in enumerate(villages):
+        if isinstance(v, dict):
+            index.add(i, village_fields(v))
+    return index
+
+
+def build_graph_index(G):
+    index = InvertedIndex()
+    for node, data in node_fields(G, GRAPH_NODE_ATTRS):
+        if is_village_node(node):
+            index.add(node, graph_node_fields(node, data))
+    return index
+
+
+_villages_cache = IndexCache(build_villages_index)
+_graph_cache = IndexCache(build_graph_index)
+
+
+def villages_index(villages):
+    """Index over a merged_villages.json list; document ids are list positions."""
+    return _villages_cache.get(villages)
+
+
+def invalidate_villages_index():
+    _villages_cache.invalidate()
+
+
+def graph_index(G):
+    """Index over the village nodes of a knowledge graph; document ids are node ids."""
+    return _graph_cache.get(G)
+
+
+def update_graph_node(G, node):
+    """Re-index one node after it changed or was removed, if the index for G is built yet."""
+    index = _graph_cache.built(G)
+    if index is None:
+        return
+    if node in G and is_village_node(node):
+        index.add(node, graph_node_fields(node, G.nodes[node]))
+    else:
+        index.remove(node)
+
+
+def update_village_record(villages, i):
+    """Re-index the record at position i, if the index for villages is built yet."""
+    index = _villages_cache.built(villages)
+    if index is not None and isinstance(villages[i], dict):
+        index.update(i, village_fields(villages[i]))
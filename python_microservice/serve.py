@@ -0,0 +1,56 @@
+"""Run the service on several uvicorn workers that share one copy of the datasets.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8001
+
+Before the workers start, the villages and the knowledge graph are compiled (with any
+logged changes folded in) into ``.vkr`` / ``.vkg`` snapshots. Every worker then memory-maps
+the same files with STORE_MMAP=1, so the dataset pages are shared instead of copied per
+process. Later updates from compaction or the pipeline are published by renaming a new
+snapshot into place, and each worker maps it within STORE_CHECK_INTERVAL seconds.
+"""
+import argparse
+import os
+
+import uvicorn  # type: ignore
+
+from logs import get_logger
+
+log = get_logger('Serve')
+
+WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+
+def compile_snapshots():
+    """Write current snapshots of the shared datasets; returns {dataset: snapshot path}."""
+    from data_store import DataStore
+    from graph_snapshot import is_snapshot
+
+    store = DataStore(mapped=True)
+    out = {}
+    for name in ('villages', 'graph'):
+        f = store.files[name]
+        f.get(force=True)
+        if f.path is None:
+            continue
+        if not is_snapshot(f.path) or store.changelog.pending(name)[0]:
+            f.compact()
+            f.get(force=True)
+        out[name] = f.path
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the village microservice on several workers.')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8001')))
+    args = parser.parse_args(argv)
+    # Inherited by the worker processes
+    os.environ['STORE_MMAP'] = '1'
+    for name, path in compile_snapshots().items():
+        log.info("%s: %s", name, path)
+    uvicorn.run('main:app', host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+"""Datasets served straight from a memory-mapped snapshot, for running several workers.
+
+Each worker maps the same ``.vkg`` / ``.vkr`` file, so the kernel keeps one copy of its pages
+for all of them. MappedGraph is a networkx Graph and MappedRecords a list-like sequence whose
+entries are decoded from the mapping when accessed. Nothing is decoded up front except the
+node id -> position table.
+
+Writes still work. An edited, added or removed node or record goes into a small per-worker
+overlay in front of the mapping, and a dict read from the mapping claims its overlay slot the
+first time it is mutated. Compaction folds the overlay into a new snapshot, which is swapped in
+atomically; every worker then maps the new file, and its overlay starts out empty again.
+"""
+from collections.abc import MutableMapping, MutableSequence
+
+import networkx as nx
+
+from graph_snapshot import GraphSnapshot
+
+# Rows decoded together by full scans (G.nodes(data=True), iterating records): column slices
+# are much cheaper to decode than one row at a time, and a scan that stops early wastes little
+SCAN_BATCH = 512
+
+
+class _Row(dict):
+    """A dict decoded from the mapping; the first mutation stores it in its owner's overlay."""
+    __slots__ = ('_owner', '_key', 'claimed')
+
+    def __init__(self, data, owner, key):
+        super().__init__(data)
+        self._owner = owner
+        self._key = key
+        self.claimed = False
+
+    def _claim(self):
+        if not self.claimed:
+            self._owner[self._key] = self
+            self.claimed = True
+
+    def __setitem__(self, key, value):
+        self._claim()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._claim()
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self._claim()
+        return super().__ior__(other)
+
+    def update(self, *args, **kwargs):
+        self._claim()
+        super().update(*args, **kwargs)
+
+    def pop(self, *args):
+        self._claim()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._claim()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._claim()
+        return super().setdefault(key, default)
+
+    def clear(self):
+        self._claim()
+        super().clear()
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class _Nodes(MutableMapping):
+    """Graph._node: node -> attribute dict, mapped nodes first, then nodes added since."""
+
+    def __init__(self, snap, ids, pos, own=None, removed=None):
+        self._snap, self._ids, self._pos = snap, ids, pos
+        self.own = own if own is not None else {}
+        self.removed = removed if removed is not None else set()
+
+    def __contains__(self, n):
+        return n in self.own or (n in self._pos and n not in self.removed)
+
+    def __getitem__(self, n):
+        d = self.own.get(n)
+        if d is not None:
+            return d
+        i = self._pos.get(n)
+        if i is None or n in self.removed:
+            raise KeyError(n)
+        return _Row(self._snap.row('node', i), self.own, n)
+
+    def __setitem__(self, n, d):
+        self.own[n] = d
+        self.removed.discard(n)
+
+    def __delitem__(self, n):
+        if n not in self:
+            raise KeyError(n)
+        self.own.pop(n, None)
+        if n in self._pos:
+            self.removed.add(n)
+
+    def __iter__(self):
+        for n in self._ids:
+            if n not in self.removed:
+                yield n
+        for n in list(self.own):
+            if n not in self._pos:
+                yield n
+
+    def __len__(self):
+        return len(self._ids) - len(self.removed) + sum(1 for n in self.own if n not in self._pos)
+
+    def items(self, fields=None):
+        """(node, attributes) for every node, decoding mapped rows SCAN_BATCH at a time.
+
+        With fields, mapped rows hold just those attributes and are plain dicts to read only.
+        """
+        ids, own, removed = self._ids, self.own, self.removed
+        for start in range(0, len(ids), SCAN_BATCH):
+            end = min(start + SCAN_BATCH, len(ids))
+            for n, data in zip(ids[start:end], self._snap.rows('node', start, end, fields)):
+                if n in removed:
+                    continue
+                d = own.get(n)
+                if d is not None:
+                    yield n, d
+                else:
+                    yield n, data if fields is not None else _Row(data, own, n)
+        for n in list(own):
+            if n not in self._pos:
+                yield n, own[n]
+
+    def values(self):
+        return (d for _, d in self.items())
+
+
+class _Neighbours(MutableMapping):
+    """One node's neighbour -> edge attribute dict, read from the CSR rows until first changed."""
+
+    def __init__(self, adj, u, i):
+        self._adj, self._u, self._i = adj, u, i
+        self._row = None
+
+    def _own(self):
+        return self._adj.own.get(self._u)
+
+    def _edges(self):
+        if self._row is None:
+            snap, ids = self._adj.snap, self._adj.ids
+            indptr, indices = snap.arrays['indptr'], snap.arrays['indices']
+            start, end = int(indptr[self._i]), int(indptr[self._i + 1])
+            self._row = {ids[j]: start + e for e, j in enumerate(indices[start:end].tolist())}
+        return self._row
+
+    def _materialize(self):
+        own = self._own()
+        if own is None:
+            own = self._adj.own[self._u] = {v: self._adj.snap.row('edge', e) for v, e in self._edges().items()}
+        return own
+
+    def __getitem__(self, v):
+        own = self._own()
+        if own is not None:
+            return own[v]
+        return self._adj.snap.row('edge', self._edges()[v])
+
+    def __contains__(self, v):
+        own = self._own()
+        return v in own if own is not None else v in self._edges()
+
+    def __iter__(self):
+        own = self._own()
+        return iter(list(own) if own is not None else self._edges())
+
+    def __len__(self):
+        own = self._own()
+        if own is not None:
+            return len(own)
+        indptr = self._adj.snap.arrays['indptr']
+        return int(indptr[self._i + 1] - indptr[self._i])
+
+    def __setitem__(self, v, d):
+        self._materialize()[v] = d
+
+    def __delitem__(self, v):
+        del self._materialize()[v]
+
+
+class _Adjacency(MutableMapping):
+    """Graph._adj: node -> neighbour mapping, with changed rows held as plain dicts."""
+
+    def __init__(self, snap, ids, pos, own=None, removed=None):
+        self.snap, self.ids, self._pos = snap, ids, pos
+        self.own = own if own is not None else {}
+        self.removed = removed if removed is not None else set()
+
+    def __contains__(self, n):
+        return n in self.own or (n in self._pos and n not in self.removed)
+
+    def __getitem__(self, n):
+        if n in self.own:
+            return _Neighbours(self, n, self._pos[n]) if n in self._pos else self.own[n]
+        i = self._pos.get(n)
+        if i is None or n in self.removed:
+            raise KeyError(n)
+        return _Neighbours(self, n, i)
+
+    def __setitem__(self, n, nbrs):
+        self.own[n] = nbrs
+        self.removed.discard(n)
+
+    def __delitem__(self, n):
+        if n not in self:
+            raise KeyError(n)
+        self.own.pop(n, None)
+        if n in self._pos:
+            self.removed.add(n)
+
+    def __iter__(self):
+        for n in self.ids:
+            if n not in self.removed:
+                yield n
+        for n in list(self.own):
+            if n not in self._pos:
+                yield n
+
+    def __len__(self):
+        return len(self.ids) - len(self.removed) + sum(1 for n in self.own if n not in self._pos)
+
+
+class MappedGraph(nx.Graph):
+    """Undirected networkx graph backed by a mapped snapshot plus a per-worker overlay.
+
+    Reads decode node and edge attributes from the mapping on access. Mutate node attributes
+    through the dict returned by G.nodes[n] (or add_node/add_edge/remove_node) as usual; edge
+    attribute dicts read from the mapping are copies, so change edges with add_edge.
+    """
+
+    def __init__(self, incoming_graph_data=None, snapshot=None, **attr):
+        super().__init__(incoming_graph_data, **attr)
+        self.snapshot = snapshot
+        if snapshot is None:
+            return
+        if snapshot.header.get('directed'):
+            raise ValueError('MappedGraph only serves undirected snapshots')
+        ids = snapshot.node_ids()
+        pos = {n: i for i, n in enumerate(ids)}
+        self.graph.update(snapshot.header.get('graph', {}))
+        self._node = _Nodes(snapshot, ids, pos)
+        self._adj = _Adjacency(snapshot, ids, pos)
+
+    def overlay_size(self):
+        """Nodes and adjacency rows held in this worker's memory rather than the mapping."""
+        if self.snapshot is None:
+            return 0
+        return len(self._node.own) + len(self._adj.own)
+
+    def copy(self, as_view=False):
+        if as_view or self.snapshot is None:
+            return super().copy(as_view=as_view)
+        G = self.__class__()
+        G.graph.update(self.graph)
+        G.snapshot = self.snapshot
+        nodes, adj = self._node, self._adj
+        G._node = _Nodes(nodes._snap, nodes._ids, nodes._pos,
+                         {n: dict(d) for n, d in nodes.own.items()}, set(nodes.removed))
+        G._adj = _Adjacency(adj.snap, adj.ids, adj._pos,
+                            {n: {v: dict(d) for v, d in nbrs.items()} for n, nbrs in adj.own.items()},
+                            set(adj.removed))
+        return G
+
+
+class MappedRecords(MutableSequence):
+    """List of dicts backed by a mapped records snapshot plus a per-worker overlay.
+
+    Entries are snapshot row numbers until a record is changed or added, then the dict itself.
+    Records returned by indexing are decoded on access and claim their overlay slot when
+    mutated in place, like rows of a MappedGraph.
+    """
+
+    def __init__(self, snapshot, rows=None, own=None):
+        self.snapshot = snapshot
+        # None while the order is still 0..n_rows-1 (plus appended dicts in self._added)
+        self._rows = rows
+        self._added = []
+        self.own = own if own is not None else {}
+
+    def _entries(self):
+        if self._rows is None:
+            self._rows = list(range(self.snapshot.n_rows)) + self._added
+            self._added = []
+        return self._rows
+
+    def _entry(self, i):
+        if self._rows is not None:
+            return self._rows[i]
+        n = self.snapshot.n_rows
+        if i < 0:
+            i += n + len(self._added)
+        if not 0 <= i < n + len(self._added):
+            raise IndexError('record index out of range')
+        return i if i < n else self._added[i - n]
+
+    def _record(self, entry):
+        if not isinstance(entry, int):
+            return entry
+        d = self.own.get(entry)
+        return d if d is not None else _Row(self.snapshot.row('row', entry), self.own, entry)
+
+    def _store(self, value):
+        # Mapped records go back in as row numbers; changed ones are found again in self.own
+        if isinstance(value, _Row) and value._owner is self.own and (not value.claimed or self.own.get(value._key) is value):
+            return value._key
+        return value
+
+    def __len__(self):
+        return len(self._rows) if self._rows is not None else self.snapshot.n_rows + len(self._added)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(self._entry(j)) for j in range(*i.indices(len(self)))]
+        return self._record(self._entry(i))
+
+    def __iter__(self):
+        n = len(self)
+        for start in range(0, n, SCAN_BATCH):
+            entries = [self._entry(i) for i in range(start, min(start + SCAN_BATCH, n))]
+            # Decode the run of mapped rows this batch covers in one go
+            mapped = [e for e in entries if isinstance(e, int) and e not in self.own]
+            rows = {}
+            if mapped:
+                lo, hi = min(mapped), max(mapped) + 1
+                if hi - lo <= 2 * SCAN_BATCH:
+                    rows = dict(zip(range(lo, hi), self.snapshot.rows('row', lo, hi)))
+            for e in entries:
+                data = rows.get(e) if isinstance(e, int) else None
+                yield self._record(e) if data is None else _Row(data, self.own, e)
+
+    def __setitem__(self, i, value):
+        rows = self._entries()
+        if isinstance(i, slice):
+            rows[i] = [self._store(v) for v in value]
+        else:
+            rows[i] = self._store(value)
+
+    def __delitem__(self, i):
+        del self._entries()[i]
+
+    def insert(self, i, value):
+        if self._rows is None and i >= len(self):
+            self._added.append(self._store(value))
+        else:
+            self._entries().insert(i, self._store(value))
+
+    def append(self, value):
+        self.insert(len(self), value)
+
+    def column(self, field):
+        """field of every record, in order, without decoding whole records."""
+        values = self.snapshot.column('row', field)
+        out = []
+        for i in range(len(self)):
+            entry = self._entry(i)
+            if isinstance(entry, int) and entry not in self.own:
+                out.append(values[entry])
+            else:
+                out.append(self._record(entry).get(field))
+        return out
+
+    def overlay_size(self):
+        return len(self.own) + sum(1 for e in (self._rows or self._added) if not isinstance(e, int))
+
+    def copy(self):
+        out = MappedRecords(self.snapshot, None if self._rows is None else
+                            [e if isinstance(e, int) else dict(e) for e in self._rows],
+                            {k: dict(v) for k, v in self.own.items()})
+        out._added = [dict(e) for e in self._added]
+        return out
+
+    def tolist(self):
+        return [dict(r) for r in self]
+
+
+def node_fields(G, fields):
+    """(node, attributes) for every node of G, where the attributes include at least fields.
+
+    For scans that read a few fields: a MappedGraph decodes just those columns. Other graphs
+    yield their attribute dicts as they are. Treat the dicts as read-only.
+    """
+    if isinstance(G, MappedGraph) and G.snapshot is not None:
+        return G._node.items(tuple(fields))
+    return G.nodes(data=True)
+
+
+def open_mapped(path):
+    """MappedGraph or MappedRecords over the snapshot file at path."""
+    snapshot = GraphSnapshot.open(path)
+    if snapshot.kind == 'records':
+        return MappedRecords(snapshot)
+    return MappedGraph(snapshot=snapshot)
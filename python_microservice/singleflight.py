@@ -0,0 +1,113 @@
+"""In-flight de-duplication: concurrent calls with the same key share one execution.
+
+The first caller for a key (the leader) runs the work; callers arriving while it runs wait for
+its result (or exception) for at most ``timeout`` seconds. If the leader is interrupted
+without a result, one waiter takes over, so nobody waits on work that will never finish.
+"""
+import os
+import threading
+import time
+
+# Longest a caller waits for someone else's identical call before giving up
+SINGLEFLIGHT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_TIMEOUT', '60'))
+
+
+class FlightTimeout(Exception):
+    """Waited longer than the timeout for an identical in-flight call."""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'abandoned', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0, 'takeovers': 0}
+
+    def do(self, key, fn, timeout=SINGLEFLIGHT_TIMEOUT):
+        """Return fn() for key, sharing the execution with concurrent callers of the same key."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        takeover = False
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    leader = True
+                    self.stats['leaders'] += 1
+                    if takeover:
+                        self.stats['takeovers'] += 1
+                else:
+                    leader = False
+                    call.waiters += 1
+                    if not takeover:
+                        self.stats['coalesced'] += 1
+            if leader:
+                return self._lead(key, call, fn)
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            finished = call.done.wait(remaining)
+            with self._lock:
+                call.waiters -= 1
+                if not finished:
+                    self.stats['timeouts'] += 1
+            if not finished:
+                raise FlightTimeout(f"{self.name}: gave up after {timeout:g}s waiting for '{key}'")
+            if call.abandoned:
+                # The leader was interrupted without a result; race to run it ourselves
+                takeover = True
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def _lead(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        except BaseException:
+            # KeyboardInterrupt, SystemExit, task cancellation: let a waiter take over
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'in_flight': len(self._calls),
+                    'waiting': sum(c.waiters for c in self._calls.values())}
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def group(name):
+    """The named SingleFlight shared by this process (e.g. 'enrichment', 'fetch_and_add')."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def stats():
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {g.name: g.snapshot() for g in groups}
@@ -0,0 +1,217 @@
+import math
+import os
+import threading
+
+import numpy as np
+
+from search_index import IndexCache, is_village_node
+from shared_snapshot import node_fields
+
+EARTH_RADIUS_KM = 6371.0088
+# Grid cell size in degrees (0.25 deg is roughly 28 km north-south)
+CELL_DEG = float(os.getenv('SPATIAL_CELL_DEG', '0.25'))
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance from one point to arrays of points, in km."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def node_coords(data):
+    try:
+        lat, lng = float(data.get('latitude')), float(data.get('longitude'))
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(lng) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class GridIndex:
+    """Uniform lat/lng grid of node ids supporting radius, k-nearest and bounding-box queries."""
+
+    def __init__(self, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.coords = {}
+        # Occupied cell extent (only ever grows) and a lazily built array of all points
+        self._bounds = None
+        self._all = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, node, lat, lng):
+        with self._lock:
+            self.remove(node)
+            self.coords[node] = (lat, lng)
+            i, j = self._cell(lat, lng)
+            self.cells.setdefault((i, j), []).append(node)
+            if self._bounds is None:
+                self._bounds = [i, j, i, j]
+            else:
+                b = self._bounds
+                b[0], b[1], b[2], b[3] = min(b[0], i), min(b[1], j), max(b[2], i), max(b[3], j)
+            self._all = None
+
+    def remove(self, node):
+        with self._lock:
+            old = self.coords.pop(node, None)
+            if old is None:
+                return
+            self._all = None
+            cell = self._cell(*old)
+            members = self.cells.get(cell, [])
+            if node in members:
+                members.remove(node)
+            if not members:
+                self.cells.pop(cell, None)
+
+    def _candidates(self, i0, j0, i1, j1):
+        n_cells = (i1 - i0 + 1) * (j1 - j0 + 1)
+        if n_cells > len(self.cells):
+            # Query area covers more cells than are occupied; walk the occupied ones instead
+            for (i, j), members in list(self.cells.items()):
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    yield from members
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield from self.cells.get((i, j), ())
+
+    def _with_distances(self, lat, lng, nodes):
+        nodes = list(nodes)
+        if not nodes:
+            return []
+        pts = np.array([self.coords[n] for n in nodes], dtype='float64')
+        dists = haversine_km(lat, lng, pts[:, 0], pts[:, 1])
+        return list(zip(nodes, dists.tolist()))
+
+    def bbox(self, min_lat, min_lng, max_lat, max_lng, limit=None):
+        """Node ids inside the box (a viewport); min_lng > max_lng means the box crosses 180."""
+        with self._lock:
+            if min_lng > max_lng:
+                ranges = [(min_lng, 180.0), (-180.0, max_lng)]
+            else:
+                ranges = [(min_lng, max_lng)]
+            out = []
+            for lo, hi in ranges:
+                i0, j0 = self._cell(min_lat, lo)
+                i1, j1 = self._cell(max_lat, hi)
+                for node in self._candidates(i0, j0, i1, j1):
+                    lat, lng = self.coords[node]
+                    if min_lat <= lat <= max_lat and lo <= lng <= hi:
+                        out.append(node)
+                        if limit and len(out) >= limit:
+                            return out
+            return out
+
+    def radius(self, lat, lng, radius_km, limit=None):
+        """[(node, km)] within radius_km of the point, nearest first."""
+        dlat = radius_km / 111.0
+        coslat = max(math.cos(math.radians(min(89.9, abs(lat) + dlat))), 1e-6)
+        dlng = min(180.0, radius_km / (111.32 * coslat))
+        lo, hi = lng - dlng, lng + dlng
+        # A circle reaching past 180 continues on the other side of it
+        if dlng >= 180.0:
+            ranges = [(-180.0, 180.0)]
+        elif lo < -180.0:
+            ranges = [(-180.0, hi), (lo + 360.0, 180.0)]
+        elif hi > 180.0:
+            ranges = [(lo, 180.0), (-180.0, hi - 360.0)]
+        else:
+            ranges = [(lo, hi)]
+        with self._lock:
+            candidates = []
+            for lo, hi in ranges:
+                i0, j0 = self._cell(max(-90.0, lat - dlat), lo)
+                i1, j1 = self._cell(min(90.0, lat + dlat), hi)
+                candidates.extend(self._candidates(i0, j0, i1, j1))
+            hits = [(n, d) for n, d in self._with_distances(lat, lng, candidates) if d <= radius_km]
+        hits.sort(key=lambda nd: nd[1])
+        return hits[:limit] if limit else hits
+
+    def _brute_force(self, lat, lng, k):
+        if self._all is None:
+            nodes = list(self.coords)
+            self._all = (nodes, np.array([self.coords[n] for n in nodes], dtype='float64'))
+        nodes, pts = self._all
+        dists = haversine_km(lat, lng, pts[:, 0], pts[:, 1])
+        top = np.argpartition(dists, k - 1)[:k] if k < len(nodes) else np.arange(len(nodes))
+        return sorted(((nodes[i], float(dists[i])) for i in top), key=lambda nd: nd[1])
+
+    def nearest(self, lat, lng, k=10):
+        """The k nearest [(node, km)], searching outward ring by ring from the query cell."""
+        with self._lock:
+            if not self.coords:
+                return []
+            k = min(k, len(self.coords))
+            ci, cj = self._cell(lat, lng)
+            i0, j0, i1, j1 = self._bounds
+            if not (i0 <= ci <= i1 and j0 <= cj <= j1):
+                # Query point outside the occupied extent: rings would mostly walk empty cells
+                return self._brute_force(lat, lng, k)
+            max_ring = max(abs(ci - i0), abs(ci - i1), abs(cj - j0), abs(cj - j1))
+            best = []
+            visited = 0
+            for r in range(max_ring + 1):
+                visited += 8 * r or 1
+                if visited > 2 * len(self.cells):
+                    # The search has touched more cells than are occupied (sparse data);
+                    # one vectorised pass over every point is cheaper
+                    return self._brute_force(lat, lng, k)
+                if r == 0:
+                    ring = [(ci, cj)]
+                else:
+                    ring = [(ci + di, cj + dj) for di in (-r, r) for dj in range(-r, r + 1)]
+                    ring += [(ci + di, cj + dj) for dj in (-r, r) for di in range(-r + 1, r)]
+                new = [n for cell in ring for n in self.cells.get(cell, ())]
+                if new:
+                    best = sorted(best + self._with_distances(lat, lng, new), key=lambda nd: nd[1])[:k]
+                if len(best) >= k:
+                    # Anything outside ring r is at least r cells away along lat or lng, unless it
+                    # lies across 180 (cells there are numbered from the other end)
+                    coslat = max(math.cos(math.radians(min(89.9, abs(lat) + (r + 1) * self.cell_deg))), 1e-6)
+                    reach = min(r * self.cell_deg, 180.0 - abs(lng))
+                    if best[-1][1] <= reach * 111.0 * coslat:
+                        return best
+            return best
+
+
+def build_spatial_index(G):
+    index = GridIndex()
+    for node, data in node_fields(G, ('latitude', 'longitude')):
+        if not is_village_node(node):
+            continue
+        coords = node_coords(data)
+        if coords:
+            index.add(node, *coords)
+    return index
+
+
+_spatial_cache = IndexCache(build_spatial_index)
+
+
+def spatial_index(G):
+    """Grid index over the village nodes of G that have valid coordinates."""
+    return _spatial_cache.get(G)
+
+
+def update_node(G, node):
+    """Re-index one node after fetch_and_add_village or an edit."""
+    index = _spatial_cache.built(G)
+    if index is None:
+        # Not built yet; the build will include the node
+        return
+    coords = node_coords(G.nodes[node]) if node in G else None
+    if coords:
+        index.add(node, *coords)
+    else:
+        index.remove(node)
@@ -0,0 +1,159 @@
+"""Neighbourhood queries over the in-memory knowledge graph, returned as compact node-link JSON.
+
+Output shape::
+
+    {"nodes": [{"id": ..., "kind": "village"|"attraction"|"specialty", ...fields}],
+     "links": [[source_index, target_index, edge_type], ...],
+     "truncated": false}
+
+Links refer to positions in ``nodes`` so repeated ids are not sent twice.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
+from search_index import is_village_node
+from shared_snapshot import node_fields
+
+SUBGRAPH_CACHE_SIZE = int(os.getenv('SUBGRAPH_CACHE_SIZE', '256'))
+# Fields sent for village nodes unless the caller asks for others
+DEFAULT_FIELDS = ['village_name', 'state', 'district', 'latitude', 'longitude', 'average_rating']
+FEATURE_KINDS = ('attraction', 'specialty')
+
+
+def node_kind(node):
+    if is_village_node(node):
+        return 'village'
+    return str(node).split('::', 1)[0]
+
+
+def feature_node(kind, name):
+    return f"{kind}::{name}"
+
+
+def resolve_village(G, key):
+    """Graph node for a village id, or else a case-insensitive village name; None if unknown."""
+    if key in G and is_village_node(key):
+        return key
+    wanted = key.strip().lower()
+    for node, data in node_fields(G, ('village_name',)):
+        if is_village_node(node) and str(data.get('village_name', '')).lower() == wanted:
+            return node
+    return None
+
+
+def resolve_feature(G, kind, name):
+    """attraction::/specialty:: node for name (case-insensitive); None if unknown."""
+    node = feature_node(kind, name)
+    if node in G:
+        return node
+    prefix, wanted = f"{kind}::", node.lower()
+    for n in G.nodes:
+        if isinstance(n, str) and n.startswith(prefix) and n.lower() == wanted:
+            return n
+    return None
+
+
+def node_link(G, nodes, fields=None, truncated=False):
+    fields = DEFAULT_FIELDS if fields is None else fields
+    pos = {n: i for i, n in enumerate(nodes)}
+    out_nodes = []
+    for n in nodes:
+        kind = node_kind(n)
+        entry = {'id': n, 'kind': kind}
+        if kind == 'village':
+            data = G.nodes[n]
+            entry.update({f: data[f] for f in fields if f in data})
+        else:
+            entry['name'] = str(n).split('::', 1)[-1]
+        out_nodes.append(entry)
+    links = []
+    for n in nodes:
+        i = pos[n]
+        for nbr, attrs in G.adj[n].items():
+            j = pos.get(nbr)
+            if j is not None and i < j:
+                links.append([i, j, attrs.get('type')])
+    return {'nodes': out_nodes, 'links': links, 'truncated': truncated}
+
+
+def ego_nodes(G, center, radius=1, max_nodes=500):
+    """Nodes within radius hops of center, breadth first; (nodes, truncated)."""
+    seen = {center: 0}
+    order = [center]
+    queue = deque([center])
+    while queue:
+        node = queue.popleft()
+        depth = seen[node]
+        if depth >= radius:
+            continue
+        for nbr in G.adj[node]:
+            if nbr in seen:
+                continue
+            if len(order) >= max_nodes:
+                return order, True
+            seen[nbr] = depth + 1
+            order.append(nbr)
+            queue.append(nbr)
+    return order, False
+
+
+def linked_villages(G, feature, max_nodes=500):
+    """The feature node followed by the villages connected to it."""
+    villages = [n for n in G.adj[feature] if is_village_node(n)]
+    truncated = len(villages) + 1 > max_nodes
+    return [feature] + villages[:max_nodes - 1], truncated
+
+
+def state_nodes(G, state, with_features=True, max_nodes=2000):
+    """Villages in state (case-insensitive), plus the attractions/specialties they link to."""
+    wanted = state.strip().lower()
+    villages = [n for n, d in node_fields(G, ('state',))
+                if is_village_node(n) and str(d.get('state', '')).strip().lower() == wanted]
+    nodes = villages[:max_nodes]
+    truncated = len(villages) > max_nodes
+    if with_features:
+        seen = set(nodes)
+        for v in villages[:max_nodes]:
+            for nbr in G.adj[v]:
+                if nbr not in seen and node_kind(nbr) in FEATURE_KINDS:
+                    if len(nodes) >= max_nodes:
+                        return nodes, True
+                    seen.add(nbr)
+                    nodes.append(nbr)
+    return nodes, truncated
+
+
+class SubgraphCache:
+    """LRU of serialized query results keyed by (graph identity, graph version, query)."""
+
+    def __init__(self, maxsize=SUBGRAPH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, G, version, query, build):
+        key = (id(G), version, query)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return body
+
+
+_cache = SubgraphCache()
+
+
+def get_subgraph_cache():
+    return _cache
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+# The service modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    """A service data directory with three villages and a small knowledge graph."""
+    import json
+    (tmp_path / 'data').mkdir()
+    villages = [
+        {'village_id': 'VIL_0001', 'village_name': 'Mawlynnong', 'state': 'Meghalaya', 'latitude': 25.2},
+        {'village_id': 'VIL_0002', 'village_name': 'Khonoma', 'state': 'Nagaland', 'latitude': 25.6},
+        {'village_id': 'VIL_0003', 'village_name': 'Malana', 'state': 'Himachal Pradesh', 'latitude': 32.1},
+    ]
+    (tmp_path / 'data' / 'merged_villages.json').write_text(json.dumps(villages), encoding='utf-8')
+    G = nx.Graph()
+    for v in villages:
+        G.add_node(v['village_id'], village_name=v['village_name'], state=v['state'], latitude=v['latitude'])
+    G.add_node('attraction::Living root bridge')
+    G.add_edge('VIL_0001', 'attraction::Living root bridge', relation='has_attraction')
+    nx.write_graphml(G, str(tmp_path / 'data' / 'village_knowledge_graph.graphml'))
+    return tmp_path
+
+
+@pytest.fixture
+def open_store(data_root):
+    """open_store(mapped=False) -> a DataStore over data_root sharing one change log."""
+    from data_store import DataStore
+    from persistence import ChangeLog
+
+    def open_store(mapped=False):
+        store = DataStore(base_dir=str(data_root), changelog=ChangeLog(str(data_root / 'changes.sqlite3')),
+                          mapped=mapped)
+        store.load_all()
+        return store
+    return open_store
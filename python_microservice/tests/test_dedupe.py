@@ -0,0 +1,122 @@
+import networkx as nx
+import pytest
+
+import dedupe
+from dedupe import (Entry, candidate_pairs, dedupe_records, find_clusters, find_duplicates, geohash,
+                    merge_duplicates, merge_store_duplicates, score_pairs)
+
+
+def entries():
+    return [
+        Entry(0, 'Mawlynnong', 'Meghalaya', (25.2, 91.91), ['Living root bridge']),
+        Entry(1, 'Mawlynong Village', 'Meghalaya', (25.201, 91.912), ['Living root bridge']),
+        # Same name and place, other state
+        Entry(2, 'Mawlynnong', 'Assam', (25.2, 91.91), []),
+        Entry(3, 'Khonoma', 'Nagaland', None, []),
+        # Same name and state, far away: only the name block pairs it
+        Entry(4, 'Mawlynnong', 'Meghalaya', (28.0, 80.0), []),
+    ]
+
+
+def test_geohash_matches_reference():
+    assert geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash(25.2, 91.91) == geohash(25.201, 91.912)
+
+
+def test_blocks_pair_by_cell_or_state_and_name_prefix():
+    assert sorted(candidate_pairs(entries())) == [(0, 1), (0, 2), (0, 4), (1, 2), (1, 4)]
+
+
+def test_oversized_blocks_only_pair_name_neighbours(monkeypatch):
+    monkeypatch.setattr(dedupe, 'DEDUPE_MAX_BLOCK', 3)
+    monkeypatch.setattr(dedupe, 'DEDUPE_WINDOW', 2)
+    many = [Entry(i, name, 'Goa', None, []) for i, name in enumerate(['Aldona', 'Aldonaa', 'Aldonb', 'Aldonc'])]
+    # One name block of four: each entry is paired with the next one in name order only
+    assert sorted(candidate_pairs(many)) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_scores_need_same_state_and_count_distance():
+    es = entries()
+    pairs = [(0, 1), (0, 2), (0, 4)]
+    near, other_state, far = score_pairs(es, pairs).tolist()
+    assert near > 0.95 and other_state == 0.0
+    # Name alone, with the coordinates term at zero
+    assert far == pytest.approx(0.5 / 0.8)
+    assert find_clusters(es) == [[(0, round(near, 4)), (1, round(near, 4))]]
+
+
+def test_dedupe_records_keeps_the_most_complete_with_aliases():
+    records = [
+        {'name': 'Mawlynnong', 'state': 'Meghalaya', 'lat': 25.2, 'lng': 91.91, 'primary_attractions': 'Sky view'},
+        {'name': 'Mawlynnong Village', 'state': 'Meghalaya', 'lat': 25.2005, 'lng': 91.9101,
+         'primary_attractions': 'Sky view, Living root bridge', 'local_specialties': 'Broom grass'},
+        {'name': 'Khonoma', 'state': 'Nagaland', 'lat': 25.6, 'lng': 94.0},
+    ]
+    kept = dedupe_records(records)
+    assert [r['name'] for r in kept] == ['Mawlynnong Village', 'Khonoma']
+    assert kept[0]['aliases'] == 'Mawlynnong'
+    assert kept[0]['primary_attractions'] == 'Sky view, Living root bridge'
+
+
+def test_merge_duplicates_moves_edges_and_records_merged_ids():
+    G = nx.Graph()
+    G.add_node('VIL_1', village_name='Mawlynnong', state='Meghalaya', latitude=25.2, longitude=91.91,
+               activities='Trekking', population=500)
+    G.add_node('VIL_2', village_name='Mawlynnong Village', state='Meghalaya', latitude=25.2005,
+               longitude=91.9101, activities='Trekking, Birding')
+    G.add_node('attraction::Living root bridge')
+    G.add_node('specialty::Broom grass')
+    G.add_edge('VIL_1', 'attraction::Living root bridge')
+    G.add_edge('VIL_2', 'attraction::Living root bridge')
+    G.add_edge('VIL_2', 'specialty::Broom grass')
+
+    assert merge_duplicates(G) == {'VIL_2': 'VIL_1'}
+    assert 'VIL_2' not in G and G.has_edge('VIL_1', 'specialty::Broom grass')
+    data = G.nodes['VIL_1']
+    assert data['activities'] == 'Trekking, Birding'
+    assert data['aliases'] == 'Mawlynnong Village' and data['merged_ids'] == 'VIL_2'
+    assert find_duplicates(G) == []
+
+
+def add_duplicate(store):
+    """A misspelt, less complete second copy of Mawlynnong with one feature of its own."""
+    with store.write_lock:
+        store.commit(villages=[{'village_id': 'VIL_0009', 'village_name': 'Mawlynong', 'state': 'Meghalaya',
+                                'activities': ['Trekking']}],
+                     nodes={'specialty::Broom grass': {'attrs': {}, 'edges': []},
+                            'VIL_0009': {'attrs': {'village_name': 'Mawlynong', 'state': 'Meghalaya'},
+                                         'edges': [['attraction::Living root bridge', {'relation': 'has_attraction'}],
+                                                   ['specialty::Broom grass', {'relation': 'has_specialty'}]]}})
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_merge_leaves_what_readers_hold_untouched(open_store, mapped):
+    if mapped:
+        open_store(mapped).compact_all()
+    store = open_store(mapped)
+    add_duplicate(store)
+    assert find_duplicates(store.graph()) == [{'keep': 'VIL_0001', 'duplicates': [{'id': 'VIL_0009', 'score': 0.8571}]}]
+
+    # A request halfway through iterating the graph and the records when the merge lands
+    G, villages = store.graph(), store.villages()
+    nodes, records = iter(G.nodes(data=True)), iter(villages)
+    first_node, first_record = next(nodes), next(records)
+    clusters, merged = merge_store_duplicates(store)
+    assert merged == {'VIL_0009': 'VIL_0001'}
+
+    # In-place merging would raise "dictionary changed size during iteration" here
+    seen = [first_node[0]] + [n for n, _ in nodes]
+    assert 'VIL_0009' in seen and 'VIL_0009' in G
+    assert [first_record['village_id']] + [v['village_id'] for v in records] == [
+        'VIL_0001', 'VIL_0002', 'VIL_0003', 'VIL_0009']
+
+    H = store.graph()
+    assert 'VIL_0009' not in H
+    assert H.has_edge('VIL_0001', 'specialty::Broom grass')
+    assert H.nodes['VIL_0001']['merged_ids'] == 'VIL_0009'
+    assert [v['village_id'] for v in store.villages()] == ['VIL_0001', 'VIL_0002', 'VIL_0003']
+    assert store.village('VIL_0001')['activities'] == ['Trekking']
+    assert not G.has_edge('VIL_0001', 'specialty::Broom grass') and 'merged_ids' not in G.nodes['VIL_0001']
+
+    # The merge was logged like any other edit
+    assert [v['village_id'] for v in open_store(mapped).villages()] == ['VIL_0001', 'VIL_0002', 'VIL_0003']
@@ -0,0 +1,71 @@
+import networkx as nx
+import pytest
+
+from facets import build_facet_index, parse_filter
+
+
+def graph():
+    G = nx.Graph()
+    G.add_node('VIL_1', state='Kerala', eco_rating=4.5, price_range_per_night='₹1000-2000',
+               activities='Boating, Trekking')
+    G.add_node('VIL_2', state='Goa', eco_rating=3.5, price_range_per_night='₹500-900', activities='Boating')
+    G.add_node('VIL_3', state='Kerala', eco_rating=4.0, price_range_per_night='₹2500-4000',
+               activities='Cooking')
+    G.add_node('VIL_4', state='Goa', price_range_per_night='₹800-1200', activities='Trekking')
+    G.add_node('VIL_5', state='Kerala', eco_rating=2.0, price_range_per_night='₹300-600', activities='Boating')
+    G.add_node('attraction::Backwaters')
+    return G
+
+
+def run(index, *filters, **kwargs):
+    return index.query([parse_filter(f) for f in filters], **kwargs)
+
+
+def test_schema_and_filters():
+    index = build_facet_index(graph())
+    assert len(index) == 5
+    assert index.schema['state'] == 'categorical'
+    assert index.schema['eco_rating'] == 'numeric'
+    assert index.schema['price_range_per_night'] == 'range'
+    assert index.schema['activities'] == 'multi'
+
+    total, nodes, _, _ = run(index, 'eco_rating>=4', sort='-eco_rating')
+    assert (total, nodes) == (2, ['VIL_1', 'VIL_3'])
+    total, nodes, _, _ = run(index, 'price_range_per_night_max<=1200', 'activities=boating|cooking')
+    assert (total, sorted(nodes)) == (2, ['VIL_2', 'VIL_5'])
+    # Missing values sort last whichever the direction
+    assert run(index, 'state=goa', sort='eco_rating')[1] == ['VIL_2', 'VIL_4']
+    assert run(index, 'state=goa', sort='-eco_rating')[1] == ['VIL_2', 'VIL_4']
+
+
+def test_facet_counts_ignore_their_own_filter():
+    index = build_facet_index(graph())
+    total, _, facets, ranges = run(index, 'state=Kerala', 'activities=Boating')
+    assert total == 2
+    # state counts apply only the activities filter, and activities counts only the state one
+    assert facets['state'] == {'Kerala': 2, 'Goa': 1}
+    assert facets['activities'] == {'Boating': 2, 'Trekking': 1, 'Cooking': 1}
+    assert ranges['eco_rating'] == {'min': 2.0, 'max': 4.5, 'count': 2}
+
+    _, _, facets, _ = run(index)
+    assert facets['state'] == {'Kerala': 3, 'Goa': 2}
+
+
+def test_update_and_remove_rows():
+    index = build_facet_index(graph())
+    index.update('VIL_4', {'state': 'Kerala', 'eco_rating': 5.0, 'activities': 'Rafting'})
+    index.remove('VIL_2')
+    total, nodes, facets, _ = run(index, 'eco_rating>4', sort='-eco_rating')
+    assert (total, nodes) == (2, ['VIL_4', 'VIL_1'])
+    assert run(index)[2]['state'] == {'Kerala': 4}
+    assert run(index, 'activities=rafting')[1] == ['VIL_4']
+
+
+def test_bad_filters():
+    index = build_facet_index(graph())
+    with pytest.raises(ValueError):
+        parse_filter('eco_rating')
+    with pytest.raises(ValueError):
+        run(index, 'state>Goa')
+    with pytest.raises(ValueError):
+        run(index, 'altitude=high')
@@ -0,0 +1,84 @@
+import random
+
+import networkx as nx
+import pytest
+
+from fuzzy import FUZZY_MIN_SCORE, FuzzyNameIndex, edit_distance, fold, similarity, village_names
+
+NAMES = ['Mawlynnong', 'Khonoma', 'Malana', 'Hodka', 'Ziro', 'Majuli', 'Chitkul', 'Kalap', 'Mana',
+         'Dhordo', 'Kalpa', 'Nako', 'Khimsar', 'Poovar', 'Kumarakom', 'Mattur', 'Nagaon', 'Mandawa']
+
+
+def graph():
+    G = nx.Graph()
+    for i, name in enumerate(NAMES):
+        G.add_node(f'VIL_{i}', village_name=f'{name} Village' if i % 3 == 0 else name)
+    G.nodes['VIL_1']['aliases'] = 'Khonoma Green Village, Kohima Khonoma'
+    G.add_node('attraction::Mawlynnong root bridge')
+    return G
+
+
+def brute_force(G, query, k, min_score):
+    """Best score per village over every spelling, without the index's pruning."""
+    best = {}
+    for node, data in G.nodes(data=True):
+        if '::' in node:
+            continue
+        for name in village_names(node, data):
+            for q in {fold(query), fold(' '.join(w for w in query.split() if w.lower() != 'village'))}:
+                if q and (len(q) >= 4 or q == fold(name)):
+                    best[node] = max(best.get(node, 0.0), similarity(q, fold(name)))
+    ranked = sorted(((n, s) for n, s in best.items() if s >= min_score), key=lambda x: (-x[1], x[0]))
+    return ranked[:k]
+
+
+def test_folding_and_edit_distance():
+    assert fold('Mawlynnong') == fold('mawlynong') == fold('Mavlynong')
+    assert fold('Khonoma') == fold('Konoma')
+    assert fold('Pōovar') == fold('puvar')
+    assert edit_distance('kitten', 'sitting') == 3
+    # Bounded: gives up with limit + 1
+    assert edit_distance('kitten', 'sitting', limit=1) == 2
+
+
+def test_misspellings_and_aliases_resolve():
+    index = FuzzyNameIndex(graph())
+    assert len(index) == len(NAMES)
+    assert index.search('Mawlinong')[0][:1] == ('VIL_0',)
+    assert index.search('kumarkom village')[0][0] == 'VIL_14'
+    node, _, spelling = index.search('Kohima Konomma')[0]
+    assert (node, spelling) == ('VIL_1', 'Kohima Khonoma')
+    # Short queries only match exactly
+    assert index.search('Nak') == []
+    assert index.search('Nako')[0][:2] == ('VIL_11', 1.0)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_pruned_search_matches_brute_force(seed):
+    rng = random.Random(seed)
+    G = graph()
+    index = FuzzyNameIndex(G)
+    for _ in range(60):
+        word = list(rng.choice(NAMES))
+        for _ in range(rng.randrange(3)):
+            i = rng.randrange(len(word))
+            op = rng.choice('dis')
+            if op == 'd' and len(word) > 1:
+                del word[i]
+            elif op == 'i':
+                word.insert(i, rng.choice('aeiouklmnr'))
+            else:
+                word[i] = rng.choice('aeiouklmnr')
+        query = ''.join(word)
+        got = [(n, round(s, 9)) for n, s, _ in index.search(query, k=3, min_score=0.6)]
+        assert got == [(n, round(s, 9)) for n, s in brute_force(G, query, 3, 0.6)], query
+
+
+def test_update_and_remove():
+    G = graph()
+    index = FuzzyNameIndex(G)
+    index.update('VIL_4', ['Ziro Valley', 'Hapoli'])
+    index.remove('VIL_3')
+    assert index.search('Hapoly')[0][0] == 'VIL_4'
+    assert all(n != 'VIL_3' for n, _, _ in index.search('Hodka', min_score=FUZZY_MIN_SCORE))
+    assert len(index) == len(NAMES) - 1
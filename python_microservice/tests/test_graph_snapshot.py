@@ -0,0 +1,88 @@
+import networkx as nx
+
+import shared_snapshot
+from graph_snapshot import load_records, load_snapshot, write_records_snapshot, write_snapshot
+from shared_snapshot import node_fields, open_mapped
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_graph_round_trip_keeps_types(tmp_path):
+    G = nx.Graph(name='villages')
+    G.add_node('VIL_1', village_name='Mawlynnong', latitude=25.2, rating=4, eco=True, tags=['clean', 'bridge'])
+    # Mixed-type columns: a number next to strings, an int next to a float
+    G.add_node('VIL_2', village_name='Khonoma', latitude='unknown', rating=4.5, eco=False)
+    G.add_node('VIL_3', latitude=12.5)
+    G.add_node('attraction::Root bridge')
+    G.add_edge('VIL_1', 'attraction::Root bridge', relation='has_attraction', weight=2)
+    G.add_edge('VIL_1', 'VIL_2', relation='near', weight=0.5)
+    path = str(tmp_path / 'graph.vkg')
+    write_snapshot(G, path)
+
+    for loaded in (load_snapshot(read(path)), open_mapped(path)):
+        assert set(loaded.nodes) == set(G.nodes)
+        for n, data in G.nodes(data=True):
+            assert dict(loaded.nodes[n]) == data
+        assert loaded.nodes['VIL_3']['latitude'] == 12.5
+        assert loaded.nodes['VIL_2']['latitude'] == 'unknown'
+        assert dict(loaded['VIL_1']['VIL_2']) == {'relation': 'near', 'weight': 0.5}
+        assert loaded.number_of_edges() == 2
+    assert load_snapshot(read(path)).graph == {'name': 'villages'}
+
+
+def test_records_round_trip_keeps_types_and_nulls(tmp_path):
+    records = [
+        {'village_id': 'VIL_1', 'village_name': 'Mawlynnong', 'latitude': 25.2, 'rating': 4,
+         'activities': ['trekking'], 'meta': {'source': 'serpapi'}},
+        {'village_id': 'VIL_2', 'village_name': 'Khonoma', 'latitude': '25.6N', 'rating': None},
+        {'village_name': 'Malana', 'state': 'Himachal Pradesh', 'latitude': 12.5},
+    ]
+    path = str(tmp_path / 'villages.vkr')
+    write_records_snapshot(records, path)
+
+    loaded = load_records(read(path))
+    assert loaded == records
+    assert loaded[2]['latitude'] == 12.5
+    assert 'rating' in loaded[1] and loaded[1]['rating'] is None
+
+    mapped = open_mapped(path)
+    assert len(mapped) == len(records)
+    assert [dict(r) for r in mapped] == records
+    assert mapped.column('village_id') == ['VIL_1', 'VIL_2', None]
+
+
+def test_mapped_scans_match_row_reads(tmp_path, monkeypatch):
+    # Small batches, so the scans cross several of them
+    monkeypatch.setattr(shared_snapshot, 'SCAN_BATCH', 3)
+    G = nx.Graph()
+    for i in range(10):
+        G.add_node(f'VIL_{i}', village_name=f'Village {i}', state='Kerala' if i % 2 else 'Goa', rating=i)
+    G.add_edge('VIL_0', 'VIL_1')
+    path = str(tmp_path / 'graph.vkg')
+    write_snapshot(G, path)
+    mapped = open_mapped(path)
+    mapped.nodes['VIL_4']['rating'] = 40
+    mapped.remove_node('VIL_5')
+    mapped.add_node('VIL_10', village_name='Village 10', state='Goa')
+
+    expected = {n: dict(mapped.nodes[n]) for n in mapped}
+    assert {n: dict(d) for n, d in mapped.nodes(data=True)} == expected
+    # Rows still in the mapping decode just the asked-for column; overlay entries come whole
+    fields = dict(node_fields(mapped, ('state',)))
+    assert {n: d['state'] for n, d in fields.items()} == {n: d['state'] for n, d in expected.items()}
+    assert fields['VIL_0'] == {'state': 'Goa'} and fields['VIL_4'] == expected['VIL_4']
+    assert dict(mapped.nodes(data='rating')) == {n: d.get('rating') for n, d in expected.items()}
+
+    records = [{'village_id': f'VIL_{i}', 'rating': i} for i in range(10)]
+    path = str(tmp_path / 'villages.vkr')
+    write_records_snapshot(records, path)
+    mapped = open_mapped(path)
+    mapped[2] = {'village_id': 'VIL_2', 'rating': 20}
+    del mapped[5]
+    mapped.append({'village_id': 'VIL_10'})
+    expected = [dict(mapped[i]) for i in range(len(mapped))]
+    assert [dict(r) for r in mapped] == expected
+    assert [r['village_id'] for r in expected] == [f'VIL_{i}' for i in range(11) if i != 5]
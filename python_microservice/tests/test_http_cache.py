@@ -0,0 +1,84 @@
+import gzip
+import json
+
+from fastapi import FastAPI, Request  # type: ignore
+from fastapi.testclient import TestClient  # type: ignore
+
+from http_cache import COMPRESS_MIN_BYTES, ResponseCache, choose_encoding
+
+
+def make_client(cache, dataset):
+    """An app serving dataset['records'] at /items, cached per dataset['version']."""
+    app = FastAPI()
+    builds = []
+
+    @app.get('/items')
+    def items(request: Request):
+        def build():
+            builds.append(dataset['version'])
+            return json.dumps(dataset['records']).encode('utf-8'), {'X-Total-Count': str(len(dataset['records']))}
+        return cache.respond(request, ('items', tuple(request.query_params.multi_items())), dataset['version'],
+                             build, modified=1700000000)
+
+    return TestClient(app), builds
+
+
+def records(n):
+    return [{'village_id': f'VIL_{i}', 'village_name': f'Village {i}'} for i in range(n)]
+
+
+def test_etag_and_last_modified_answer_304():
+    dataset = {'version': 1, 'records': records(3)}
+    client, builds = make_client(ResponseCache(), dataset)
+    first = client.get('/items')
+    assert first.status_code == 200 and first.json() == dataset['records']
+    etag = first.headers['etag']
+    assert first.headers['x-total-count'] == '3' and first.headers['last-modified']
+
+    again = client.get('/items', headers={'If-None-Match': f'W/{etag}, "other"'})
+    assert again.status_code == 304 and again.content == b'' and again.headers['etag'] == etag
+    assert client.get('/items', headers={'If-Modified-Since': first.headers['last-modified']}).status_code == 304
+    # If-None-Match wins over a matching If-Modified-Since
+    stale = client.get('/items', headers={'If-None-Match': '"other"', 'If-Modified-Since': first.headers['last-modified']})
+    assert stale.status_code == 200
+    assert builds == [1]
+
+    dataset['version'], dataset['records'] = 2, records(4)
+    changed = client.get('/items', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['etag'] != etag and len(changed.json()) == 4
+    assert builds == [1, 2]
+
+
+def test_large_bodies_are_gzipped_once():
+    dataset = {'version': 1, 'records': records(200)}
+    cache = ResponseCache()
+    client, _ = make_client(cache, dataset)
+    plain = client.get('/items', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    zipped = client.get('/items', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['content-encoding'] == 'gzip' and zipped.headers['vary'] == 'Accept-Encoding'
+    assert zipped.json() == dataset['records'] and zipped.headers['etag'] == plain.headers['etag']
+    entry = cache.entry(('items', ()), 1, None, 'application/json', 0)
+    assert gzip.decompress(entry.encoded('gzip')) == entry.body and entry.encoded('gzip') is entry.encoded('gzip')
+
+    assert choose_encoding('gzip', COMPRESS_MIN_BYTES - 1) == 'identity'
+    assert choose_encoding('gzip;q=0, deflate', COMPRESS_MIN_BYTES) == 'identity'
+
+
+def test_byte_budget_and_superseded_versions():
+    cache = ResponseCache(maxsize=10, maxbytes=2500)
+    body = lambda n: (lambda: (b'x' * n, {}))
+    cache.entry(('villages', 'a'), 1, body(1000), 'application/json', 0)
+    cache.entry(('villages', 'b'), 1, body(1000), 'application/json', 0)
+    cache.entry(('graph',), 1, body(400), 'application/xml', 0)
+    # A new villages version drops both bodies cached for the old one
+    cache.entry(('villages', 'a'), 2, body(1000), 'application/json', 0)
+    assert list(cache._entries) == [(('graph',), 1), (('villages', 'a'), 2)]
+
+    # Over the budget: the least recently used body goes
+    cache.entry(('internships',), 1, body(1200), 'application/json', 0)
+    assert list(cache._entries) == [(('villages', 'a'), 2), (('internships',), 1)]
+    assert cache.snapshot()['bytes'] == 2200
+    # Bigger than the whole budget: served, never cached
+    assert cache.entry(('kirana_stores',), 1, body(3000), 'application/json', 0).body == b'x' * 3000
+    assert len(cache._entries) == 2
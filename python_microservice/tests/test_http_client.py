@@ -0,0 +1,102 @@
+import pytest
+import requests
+
+import http_client
+from http_client import MAX_RETRIES, CircuitBreaker, ProviderClient, ProviderUnavailable
+
+
+class Unlimited:
+    def acquire(self):
+        pass
+
+
+def response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    return resp
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays requested, instead of sleeping them."""
+    delays = []
+    monkeypatch.setattr(http_client.time, 'sleep', delays.append)
+    return delays
+
+
+def provider(outcomes, threshold=2, reset=30):
+    """A ProviderClient whose session returns (or raises) outcomes in turn."""
+    client = ProviderClient('serpapi')
+    client.limiter = Unlimited()
+    client.breaker = CircuitBreaker(threshold=threshold, reset=reset)
+    client.calls = 0
+
+    def send(method, url, **kwargs):
+        outcome = outcomes[client.calls]
+        client.calls += 1
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    client.session.request = send
+    return client
+
+
+def test_retries_transient_failures_with_backoff(sleeps):
+    client = provider([requests.ConnectionError('reset'), response(503, {'Retry-After': '2'}), response(200)])
+    assert client.get('https://serpapi.com/search').status_code == 200
+    assert client.calls == 3
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= http_client.BACKOFF_BASE and sleeps[1] == 2.0
+    assert client.breaker.state == 'closed'
+
+
+def test_client_errors_are_returned_not_retried(sleeps):
+    client = provider([response(404)])
+    assert client.get('https://serpapi.com/search').status_code == 404
+    assert client.calls == 1 and sleeps == []
+
+
+def test_exhausted_retries_open_the_circuit(sleeps):
+    client = provider([response(502)] * (MAX_RETRIES + 1) + [requests.Timeout('slow')] * (MAX_RETRIES + 1))
+    with pytest.raises(ProviderUnavailable, match='HTTP 502'):
+        client.get('https://serpapi.com/search')
+    assert client.breaker.state == 'closed'
+    with pytest.raises(ProviderUnavailable, match='Timeout'):
+        client.get('https://serpapi.com/search')
+    assert client.breaker.state == 'open'
+    # Open: fails fast without calling the provider
+    calls = client.calls
+    with pytest.raises(ProviderUnavailable, match='circuit open'):
+        client.get('https://serpapi.com/search')
+    assert client.calls == calls
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=1, reset=30)
+    breaker.failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    breaker.opened_at -= 30
+    assert breaker.state == 'half-open'
+    assert breaker.allow() and not breaker.allow()
+    # A failed trial reopens the circuit at once, a successful one closes it
+    breaker.failure()
+    assert breaker.state == 'open'
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed' and breaker.allow() and breaker.allow()
+
+
+def test_unexpected_error_in_the_trial_releases_it(sleeps):
+    client = provider([requests.ConnectionError('down')] * (MAX_RETRIES + 1)
+                      + [ValueError('bad payload'), response(200)], threshold=1)
+    with pytest.raises(ProviderUnavailable):
+        client.get('https://serpapi.com/search')
+    client.breaker.opened_at -= 30
+    with pytest.raises(ValueError):
+        client.get('https://serpapi.com/search')
+    assert client.breaker.state == 'open' and not client.breaker._trial
+    client.breaker.opened_at -= 30
+    assert client.get('https://serpapi.com/search').status_code == 200
+    assert client.breaker.state == 'closed'
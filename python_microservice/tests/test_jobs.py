@@ -0,0 +1,94 @@
+import json
+import sys
+import time
+
+import pytest
+
+from jobs import JobConflict, JobManager
+
+# Prints progress, then waits for a 'release' file in its working directory
+PIPELINE = """
+import os, time
+print('[Progress] stage 1/2: fetching', flush=True)
+print('fetched 10 villages', flush=True)
+print('[Progress] stage 2/2: building graph', flush=True)
+while not os.path.exists('release'):
+    time.sleep(0.05)
+print('done', flush=True)
+"""
+
+
+def wait_for(check, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError('timed out')
+
+
+@pytest.fixture
+def managers(tmp_path):
+    """managers(n) -> n JobManagers sharing one jobs directory, like n service workers."""
+    def managers(n=1):
+        return [JobManager(jobs_dir=str(tmp_path / 'jobs'), command=[sys.executable, '-u', '-c', PIPELINE],
+                           cwd=str(tmp_path)) for _ in range(n)]
+    return managers
+
+
+def test_one_job_at_a_time_across_workers(managers, tmp_path):
+    first, second = managers(2)
+    job = first.submit()
+    assert job['status'] == 'running'
+    with pytest.raises(JobConflict) as raised:
+        first.submit()
+    assert raised.value.job['id'] == job['id']
+    # Another worker sees the same active job and can't start one either
+    with pytest.raises(JobConflict):
+        second.submit()
+    assert second.active()['id'] == job['id']
+
+    (tmp_path / 'release').touch()
+    done = wait_for(lambda: second.get(job['id'])['status'] == 'succeeded' and second.get(job['id']))
+    assert done['returncode'] == 0
+    assert second.submit()['status'] == 'running'
+    second.cancel(second.active()['id'])
+
+
+def test_progress_and_log_offsets(managers, tmp_path):
+    manager, = managers()
+    job = manager.submit()
+    progress = wait_for(lambda: manager.get(job['id'])['progress'] == '[Progress] stage 2/2: building graph')
+    assert progress
+    data, offset = manager.read_log(job['id'], 0, max_bytes=20)
+    assert data == b'[Progress] stage 1/2' and offset == 20
+    rest, offset = manager.read_log(job['id'], offset)
+    assert (data + rest).decode().splitlines()[1] == 'fetched 10 villages'
+    assert manager.read_log(job['id'], offset) == (b'', offset)
+    assert manager.is_active(job['id'])
+
+    (tmp_path / 'release').touch()
+    wait_for(lambda: not manager.is_active(job['id']))
+    assert manager.read_log(job['id'], offset)[0] == b'done\n'
+
+
+def test_cancel_from_another_worker(managers):
+    owner, other = managers(2)
+    job = owner.submit()
+    cancelled = other.cancel(job['id'])
+    assert cancelled['status'] == 'cancelled' and cancelled['finished']
+    assert owner.active() is None
+
+
+def test_orphaned_job_is_marked_failed(managers, tmp_path):
+    manager, = managers()
+    orphan = {'id': '20240101-000000-abcdef', 'status': 'running', 'created': 1.0, 'started': 1.0,
+              'finished': None, 'returncode': None, 'error': None, 'pid': 999999}
+    (tmp_path / 'jobs' / f"{orphan['id']}.json").write_text(json.dumps(orphan), encoding='utf-8')
+    job = manager.get(orphan['id'])
+    assert job['status'] == 'failed' and job['error'] == 'Interrupted by service restart'
+    assert job['progress'] is None
+    # No log was ever written: an empty one, not an error
+    assert manager.read_log(orphan['id'], 5) == (b'', 5)
+    assert manager.get('../etc/passwd') is None
@@ -0,0 +1,62 @@
+import pytest
+
+from listing import page, parse_fields, project
+
+
+def records():
+    return [
+        {'village_id': 'VIL_1', 'village_name': 'Mawlynnong', 'rating': 4.5},
+        {'village_id': 'VIL_2', 'village_name': 'khonoma', 'rating': 3},
+        {'village_id': 'VIL_3', 'village_name': 'Malana'},
+        {'village_id': 'VIL_4', 'village_name': 'Hodka', 'rating': 5},
+        {'village_id': 'VIL_5', 'village_name': 'Ziro', 'rating': 4},
+    ]
+
+
+def walk(villages, version, limit, sort=None):
+    """Every page in order, following the cursors."""
+    pages, cursor = [], None
+    while True:
+        positions, cursor = page(villages, version, limit=limit, cursor=cursor, sort=sort)
+        pages.append(positions)
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_cover_catalog_order_once():
+    villages = records()
+    assert walk(villages, 1, 2) == [[0, 1], [2, 3], [4]]
+    assert page(villages, 1, limit=2, offset=3) == ([3, 4], None)
+
+
+def test_sorted_pages_put_missing_values_last_both_ways():
+    villages = records()
+    assert sum(walk(villages, 1, 2, sort='rating'), []) == [1, 4, 0, 3, 2]
+    assert sum(walk(villages, 1, 2, sort='-rating'), []) == [3, 0, 4, 1, 2]
+    # Strings compare case-insensitively
+    assert sum(walk(villages, 1, 3, sort='village_name'), []) == [3, 1, 2, 0, 4]
+
+
+def test_keyset_cursor_survives_records_added_between_pages():
+    villages = records()
+    first, cursor = page(villages, 1, limit=2, sort='rating')
+    assert first == [1, 4]
+    grown = villages + [{'village_id': 'VIL_6', 'rating': 1}, {'village_id': 'VIL_7', 'rating': 4.8}]
+    # A record sorting before the mark is not repeated; one after it shows up in order
+    rest, _ = page(grown, 2, limit=10, cursor=cursor, sort='rating')
+    assert rest == [0, 6, 3, 2]
+
+
+def test_cursor_rejects_other_sort_and_garbage():
+    villages = records()
+    _, cursor = page(villages, 1, limit=2, sort='rating')
+    with pytest.raises(ValueError):
+        page(villages, 1, limit=2, cursor=cursor, sort='-rating')
+    with pytest.raises(ValueError):
+        page(villages, 1, limit=2, cursor='not a cursor')
+
+
+def test_projection_keeps_only_present_fields():
+    assert parse_fields(' village_name, ,rating') == ['village_name', 'rating']
+    assert parse_fields('') is None
+    assert project(records()[2], ['village_name', 'rating']) == {'village_name': 'Malana'}
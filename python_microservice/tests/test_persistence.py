@@ -0,0 +1,113 @@
+import pytest
+
+import networkx as nx
+
+from persistence import REMOVED, apply_changes, copy_for_changes, graph_node_change, village_key
+
+
+def edit(store):
+    """Rename one village, add one, remove one, and mirror the changes in the graph."""
+    with store.write_lock:
+        villages, G = store.villages(), store.graph()
+        renamed = graph_node_change(G, 'VIL_0001')
+        renamed['attrs']['village_name'] = 'Mawlynnong Village'
+        store.commit(villages=[{**villages[0], 'village_name': 'Mawlynnong Village'},
+                               {'village_id': 'VIL_0004', 'village_name': 'Hodka', 'state': 'Gujarat'}],
+                     removed_villages=[village_key(villages[2])],
+                     nodes={'VIL_0001': renamed,
+                            'VIL_0004': {'attrs': {'village_name': 'Hodka', 'state': 'Gujarat', 'latitude': 23.8},
+                                         'edges': [['attraction::Living root bridge', {'relation': 'has_attraction'}]]}},
+                     removed_nodes=['VIL_0003'])
+
+
+def snapshot(store):
+    G = store.graph()
+    return ([dict(v) for v in store.villages()],
+            {n: dict(d) for n, d in G.nodes(data=True)},
+            sorted(tuple(sorted(e)) for e in G.edges()))
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_replay_rebuilds_logged_changes(open_store, mapped):
+    writer = open_store(mapped)
+    if mapped:
+        writer.compact_all()
+    edit(writer)
+    assert writer.changelog.pending('villages')[0] == 3
+
+    reader = open_store(mapped)
+    assert snapshot(reader) == snapshot(writer)
+    assert [v['village_id'] for v in reader.villages()] == ['VIL_0001', 'VIL_0002', 'VIL_0004']
+    assert reader.village('VIL_0004')['village_name'] == 'Hodka'
+    assert reader.village('VIL_0003') is None
+    assert 'VIL_0003' not in reader.graph()
+    assert reader.village_by_key('VIL_0002')['village_name'] == 'Khonoma'
+    assert reader.village_by_key('VIL_0003') is None
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_tail_publishes_other_writers_changes_as_a_new_version(open_store, mapped):
+    if mapped:
+        open_store(mapped).compact_all()
+    reader = open_store(mapped)
+    villages, G = reader.villages(), reader.graph()
+    before = snapshot(reader)
+    seen = []
+    reader.on_change('graph', lambda old, new, touched: seen.append((old, new, sorted(touched))))
+    edit(open_store(mapped))
+
+    reader.files['villages'].get(force=True)
+    reader.files['graph'].get(force=True)
+    # What a reader already holds is left exactly as it was
+    assert reader.villages() is not villages and reader.graph() is not G
+    assert ([dict(v) for v in villages], {n: dict(d) for n, d in G.nodes(data=True)},
+            sorted(tuple(sorted(e)) for e in G.edges())) == before
+    assert [v['village_name'] for v in reader.villages()] == ['Mawlynnong Village', 'Khonoma', 'Hodka']
+    assert reader.village('VIL_0004')['state'] == 'Gujarat'
+    assert reader.graph().nodes['VIL_0004']['latitude'] == 23.8
+    assert 'VIL_0003' not in reader.graph()
+    assert seen == [(G, reader.graph(), ['VIL_0001', 'VIL_0003', 'VIL_0004'])]
+
+
+def test_copy_for_changes_shares_untouched_nodes():
+    G = nx.Graph()
+    G.add_node('a', name='A')
+    G.add_node('b', name='B')
+    G.add_node('c', name='C')
+    G.add_node('d', name='D')
+    G.add_edge('a', 'b', relation='near')
+    changes = [('a', {'attrs': {'name': 'A2'}, 'edges': [['c', {'relation': 'near'}]]})]
+    H = apply_changes('graph', copy_for_changes('graph', G, changes), changes)
+
+    assert dict(G.nodes['a']) == {'name': 'A'} and sorted(G['a']) == ['b'] and sorted(G['c']) == []
+    assert dict(H.nodes['a']) == {'name': 'A2'} and sorted(H['a']) == ['c'] and sorted(H['b']) == []
+    assert H.nodes['c'] is not G.nodes['c']
+    assert H.nodes['d'] is G.nodes['d']
+
+
+def test_replaying_changes_twice_is_idempotent():
+    villages = [{'village_id': 'a', 'village_name': 'A'}, {'village_id': 'b', 'village_name': 'B'}]
+    changes = [('a', {'village_id': 'a', 'village_name': 'A2'}), ('b', REMOVED),
+               ('c', {'village_id': 'c', 'village_name': 'C'})]
+    once = apply_changes('villages', [dict(v) for v in villages], changes)
+    twice = apply_changes('villages', apply_changes('villages', [dict(v) for v in villages], changes), changes)
+    assert once == twice == [{'village_id': 'a', 'village_name': 'A2'}, {'village_id': 'c', 'village_name': 'C'}]
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_compaction_is_idempotent(open_store, mapped):
+    writer = open_store(mapped)
+    edit(writer)
+    expected = snapshot(writer)
+
+    writer.compact_all()
+    assert writer.changelog.pending('villages')[0] == 0
+    assert writer.changelog.pending('graph')[0] == 0
+    after_first = open_store(mapped)
+    assert snapshot(after_first) == expected
+
+    # Compacting again with nothing pending, or folding the same changes in twice, changes nothing
+    writer.compact_all()
+    for name in ('villages', 'graph'):
+        writer.files[name].compact()
+    assert snapshot(open_store(mapped)) == expected
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import FlightTimeout, SingleFlight
+
+
+def wait_until(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    runs = []
+
+    def work():
+        runs.append(1)
+        release.wait(5)
+        return {'answer': 42}
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flight.do, 'Mawlynnong', work) for _ in range(8)]
+        wait_until(lambda: flight.snapshot()['waiting'] == 7)
+        # A different key runs on its own
+        assert flight.do('Khonoma', lambda: 'other') == 'other'
+        release.set()
+        results = [f.result() for f in futures]
+    assert runs == [1]
+    assert all(r is results[0] for r in results)
+    snap = flight.snapshot()
+    assert (snap['leaders'], snap['coalesced'], snap['in_flight']) == (2, 7, 0)
+    # Finished calls are not cached: the next call runs again
+    flight.do('Mawlynnong', work)
+    assert runs == [1, 1]
+
+
+def test_waiters_get_the_leaders_exception():
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('SerpAPI down')
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flight.do, 'k', fail) for _ in range(3)]
+        wait_until(lambda: flight.snapshot()['waiting'] == 2)
+        release.set()
+        for f in futures:
+            with pytest.raises(ValueError, match='SerpAPI down'):
+                f.result()
+    assert flight.snapshot()['errors'] == 1
+
+
+def test_waiter_times_out_without_cancelling_the_leader():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(flight.do, 'k', lambda: release.wait(5) and 'done')
+        wait_until(lambda: flight.snapshot()['in_flight'] == 1)
+        with pytest.raises(FlightTimeout):
+            flight.do('k', lambda: 'never runs', timeout=0.05)
+        release.set()
+        assert leader.result() == 'done'
+    assert flight.snapshot()['timeouts'] == 1
+
+
+def test_a_waiter_takes_over_from_an_interrupted_leader():
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    class Cancelled(BaseException):
+        pass
+
+    def interrupted():
+        release.wait(5)
+        raise Cancelled()
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, 'k', interrupted)
+        wait_until(lambda: flight.snapshot()['in_flight'] == 1)
+        waiter = pool.submit(flight.do, 'k', lambda: 'recovered')
+        wait_until(lambda: flight.snapshot()['waiting'] == 1)
+        release.set()
+        with pytest.raises(Cancelled):
+            leader.result()
+        assert waiter.result() == 'recovered'
+    assert flight.snapshot()['takeovers'] == 1
@@ -0,0 +1,96 @@
+import random
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from spatial_index import GridIndex, build_spatial_index, haversine_km, node_coords
+
+
+def points(seed, n=400):
+    rng = random.Random(seed)
+    # Mostly clustered like the catalog, plus a sparse spread and a few near the antimeridian
+    pts = {f'VIL_{i}': (rng.uniform(8, 35), rng.uniform(68, 97)) for i in range(n)}
+    pts.update({f'FAR_{i}': (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(40)})
+    pts.update({'EAST': (-17.0, 179.9), 'WEST': (-17.1, -179.9)})
+    return pts
+
+
+def index_of(pts, cell_deg=0.25):
+    index = GridIndex(cell_deg)
+    for node, (lat, lng) in pts.items():
+        index.add(node, lat, lng)
+    return index
+
+
+def distances(pts, lat, lng):
+    nodes = list(pts)
+    arr = np.array([pts[n] for n in nodes])
+    return dict(zip(nodes, haversine_km(lat, lng, arr[:, 0], arr[:, 1]).tolist()))
+
+
+def test_haversine_reference_distance():
+    # Delhi to Mumbai, about 1150 km
+    assert haversine_km(28.6139, 77.2090, np.array([19.0760]), np.array([72.8777]))[0] == pytest.approx(1153, abs=5)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_nearest_and_radius_match_brute_force(seed):
+    pts = points(seed)
+    index = index_of(pts)
+    rng = random.Random(100 + seed)
+    queries = [(rng.uniform(8, 35), rng.uniform(68, 97)) for _ in range(20)]
+    queries += [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(5)] + [(-17.05, 180.0)]
+    for lat, lng in queries:
+        exact = sorted(distances(pts, lat, lng).items(), key=lambda nd: nd[1])
+        got = index.nearest(lat, lng, k=7)
+        assert [round(d, 6) for _, d in got] == [round(d, 6) for _, d in exact[:7]]
+        within = [n for n, d in exact if d <= 150]
+        assert sorted(n for n, _ in index.radius(lat, lng, 150)) == sorted(within)
+
+
+def test_nearest_and_radius_wrap_across_the_antimeridian():
+    # Dense on the east side, so the ring search (not the brute-force fallback) answers
+    pts = {f'E_{i}_{j}': (-17.0 + i * 0.2, 178.0 + j * 0.2) for i in range(10) for j in range(10)}
+    pts['WEST'] = (-16.0, -179.98)
+    index = index_of(pts)
+    lat, lng = -16.0, 179.95
+    exact = sorted(distances(pts, lat, lng).items(), key=lambda nd: nd[1])
+    assert index.nearest(lat, lng, k=3) == [(n, pytest.approx(d)) for n, d in exact[:3]]
+    assert exact[0][0] == 'WEST'
+    assert 'WEST' in {n for n, _ in index.radius(lat, lng, 20)}
+
+
+def test_bbox_including_across_the_antimeridian():
+    pts = points(0)
+    index = index_of(pts)
+    box = (10.0, 75.0, 20.0, 80.0)
+    expected = {n for n, (lat, lng) in pts.items() if 10 <= lat <= 20 and 75 <= lng <= 80}
+    assert set(index.bbox(*box)) == expected
+    assert len(index.bbox(*box, limit=3)) == min(3, len(expected))
+    wrapped = set(index.bbox(-20.0, 179.0, -15.0, -179.0))
+    assert {'EAST', 'WEST'} <= wrapped
+    assert all(abs(pts[n][1]) >= 179.0 for n in wrapped)
+
+
+def test_moves_and_removals():
+    index = index_of({'A': (25.0, 91.0), 'B': (25.1, 91.1), 'C': (10.0, 76.0)})
+    index.add('B', 10.05, 76.05)
+    index.remove('A')
+    assert len(index) == 2
+    assert [n for n, _ in index.nearest(10.0, 76.0, k=5)] == ['C', 'B']
+    assert index.radius(25.0, 91.0, 50) == []
+    assert index.nearest(25.0, 91.0, k=1)[0][0] == 'B'
+
+
+def test_build_skips_invalid_coordinates():
+    G = nx.Graph()
+    G.add_node('VIL_1', latitude=25.2, longitude=91.9)
+    G.add_node('VIL_2', latitude='25.6', longitude='94.0')
+    G.add_node('VIL_3', latitude='unknown', longitude=94.0)
+    G.add_node('VIL_4', latitude=95.0, longitude=10.0)
+    G.add_node('VIL_5')
+    G.add_node('attraction::Root bridge', latitude=25.2, longitude=91.9)
+    index = build_spatial_index(G)
+    assert sorted(index.coords) == ['VIL_1', 'VIL_2']
+    assert node_coords({'latitude': float('nan'), 'longitude': 1.0}) is None
@@ -0,0 +1,410 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from data_store import DATA_DIR
+from logs import get_logger
+from search_index import SUPERSEDED_VERSIONS, is_village_node
+from shared_snapshot import node_fields
+
+MODEL_NAME = os.getenv('VECTOR_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+# Cosine similarity a hit needs before /search trusts it over an external enrichment
+MIN_SCORE = float(os.getenv('VECTOR_MIN_SCORE', '0.45'))
+BATCH_SIZE = int(os.getenv('VECTOR_BATCH_SIZE', '64'))
+INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', DATA_DIR)
+# Set VECTOR_SEARCH=off to skip loading the embedding model entirely
+ENABLED = os.getenv('VECTOR_SEARCH', 'on').lower() not in ('0', 'off', 'false', 'no')
+# Incremental changes are written to disk this many seconds after the first unsaved one
+SAVE_DELAY = float(os.getenv('VECTOR_SAVE_DELAY', '30'))
+INDEX_PATH = os.path.join(INDEX_DIR, 'village_vectors.faiss')
+META_PATH = os.path.join(INDEX_DIR, 'village_vectors.json')
+
+log = get_logger('Vectors')
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer  # type: ignore
+                # CPU only; the service does not assume a GPU
+                _model = SentenceTransformer(MODEL_NAME, device='cpu')
+    return _model
+
+
+# Node attributes node_text() reads
+NODE_TEXT_ATTRS = ('village_name', 'state', 'primary_attractions', 'local_specialties', 'activities')
+
+
+def node_text(node, data):
+    name = data.get('village_name') or node
+    parts = [f"{name}, {data.get('state', '')}"]
+    for label, key in (('Attractions', 'primary_attractions'), ('Specialties', 'local_specialties'),
+                       ('Activities', 'activities')):
+        val = data.get(key) or ''
+        if isinstance(val, list):
+            val = ', '.join(str(x) for x in val)
+        if val:
+            parts.append(f"{label}: {val}")
+    return '. '.join(parts)
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def encode(texts):
+    if not texts:
+        return np.zeros((0, 0), dtype='float32')
+    vecs = get_model().encode(texts, batch_size=BATCH_SIZE, convert_to_numpy=True,
+                              normalize_embeddings=True, show_progress_bar=False)
+    return np.asarray(vecs, dtype='float32')
+
+
+class VillageVectorIndex:
+    """Cosine-similarity FAISS index over village nodes, persisted next to the datasets."""
+
+    def __init__(self, index_path=INDEX_PATH, meta_path=META_PATH):
+        import faiss  # type: ignore
+        self._faiss = faiss
+        self.index_path = index_path
+        self.meta_path = meta_path
+        self.index = None
+        # FAISS needs int64 ids; keep the node <-> id mapping and per-node text hashes
+        self.node_ids = {}
+        self.id_nodes = {}
+        self.hashes = {}
+        self._next_id = 0
+        self._lock = threading.RLock()
+        # Pending save for changes made since the last one (see _changed)
+        self._dirty = False
+        self._timer = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def _new_index(self, dim):
+        return self._faiss.IndexIDMap2(self._faiss.IndexFlatIP(dim))
+
+    def _load_persisted(self):
+        """Return {node: (hash, vector)} from a previous run built with the same model."""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.meta_path)):
+            return {}
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('model') != MODEL_NAME:
+                return {}
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+            # Index and meta are replaced one after the other; a pair from different saves has
+            # ids that don't match, so it is ignored
+            if meta.get('index_sha1') != hashlib.sha1(raw).hexdigest():
+                log.warning("Ignoring persisted index: %s does not match %s", self.meta_path, self.index_path)
+                return {}
+            index = self._faiss.deserialize_index(np.frombuffer(raw, dtype='uint8'))
+            cached = {}
+            for node, (vid, h) in meta.get('nodes', {}).items():
+                cached[node] = (h, index.reconstruct(int(vid)))
+            return cached
+        except Exception as e:
+            log.warning("Ignoring unreadable persisted index: %s: %s", type(e).__name__, e)
+            return {}
+
+    def build(self, G):
+        """Index every village node, re-encoding only nodes whose text changed since the last save."""
+        with self._lock:
+            cached = self._load_persisted()
+            nodes, texts = [], []
+            for node, data in node_fields(G, NODE_TEXT_ATTRS):
+                if is_village_node(node):
+                    nodes.append(node)
+                    texts.append(node_text(node, data))
+            hashes = [_text_hash(t) for t in texts]
+            vectors = [None] * len(nodes)
+            todo = []
+            for i, (node, h) in enumerate(zip(nodes, hashes)):
+                hit = cached.get(node)
+                if hit and hit[0] == h:
+                    vectors[i] = hit[1]
+                else:
+                    todo.append(i)
+            if todo:
+                log.info("Encoding %d of %d villages (batch size %d)", len(todo), len(nodes), BATCH_SIZE)
+                encoded = encode([texts[i] for i in todo])
+                for i, vec in zip(todo, encoded):
+                    vectors[i] = vec
+            self.node_ids, self.id_nodes, self.hashes = {}, {}, {}
+            self._next_id = len(nodes)
+            if not nodes:
+                self.index = None
+                return self
+            matrix = np.vstack(vectors).astype('float32')
+            ids = np.arange(len(nodes), dtype='int64')
+            self.index = self._new_index(matrix.shape[1])
+            self.index.add_with_ids(matrix, ids)
+            for i, node in enumerate(nodes):
+                self.node_ids[node] = i
+                self.id_nodes[i] = node
+                self.hashes[node] = hashes[i]
+            if todo or len(cached) != len(nodes):
+                self.save()
+            return self
+
+    def upsert(self, node, data, persist=True):
+        """Add or re-embed a single village node (e.g. after fetch_and_add_village or re-enrichment)."""
+        text = node_text(node, data)
+        h = _text_hash(text)
+        if self.hashes.get(node) == h:
+            return
+        vec = encode([text])
+        with self._lock:
+            if self.hashes.get(node) == h:
+                return
+            if self.index is None:
+                self.index = self._new_index(vec.shape[1])
+            vid = self.node_ids.get(node)
+            if vid is not None:
+                self.index.remove_ids(np.array([vid], dtype='int64'))
+            else:
+                vid = self._next_id
+                self._next_id += 1
+                self.node_ids[node] = vid
+                self.id_nodes[vid] = node
+            self.index.add_with_ids(vec, np.array([vid], dtype='int64'))
+            self.hashes[node] = h
+            if persist:
+                self._changed()
+
+    def remove(self, node, persist=True):
+        with self._lock:
+            vid = self.node_ids.pop(node, None)
+            if vid is None:
+                return
+            self.id_nodes.pop(vid, None)
+            self.hashes.pop(node, None)
+            self.index.remove_ids(np.array([vid], dtype='int64'))
+            if persist:
+                self._changed()
+
+    def search(self, query, k=5, min_score=MIN_SCORE):
+        """Return [(node, cosine similarity)] for the k nearest villages scoring at least min_score."""
+        if self.index is None or not self.node_ids:
+            return []
+        vec = encode([query])
+        with self._lock:
+            if self.index is None or not self.node_ids:
+                return []
+            scores, ids = self.index.search(vec, min(k, len(self.node_ids)))
+        results = []
+        for score, vid in zip(scores[0], ids[0]):
+            if vid < 0 or score < min_score:
+                continue
+            node = self.id_nodes.get(int(vid))
+            if node is not None:
+                results.append((node, float(score)))
+        return results
+
+    def search_many(self, queries, k=5, min_score=MIN_SCORE):
+        """search() for several queries with one encoding batch and one FAISS call."""
+        if self.index is None or not self.node_ids or not queries:
+            return [[] for _ in queries]
+        vecs = encode(list(queries))
+        with self._lock:
+            if self.index is None or not self.node_ids:
+                return [[] for _ in queries]
+            scores, ids = self.index.search(vecs, min(k, len(self.node_ids)))
+        out = []
+        for row_scores, row_ids in zip(scores, ids):
+            hits = []
+            for score, vid in zip(row_scores, row_ids):
+                node = self.id_nodes.get(int(vid)) if vid >= 0 and score >= min_score else None
+                if node is not None:
+                    hits.append((node, float(score)))
+            out.append(hits)
+        return out
+
+    def _changed(self):
+        """Save SAVE_DELAY seconds after the first unsaved change, so a burst of upserts is written once."""
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write unsaved changes now (also called at shutdown)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self.save()
+
+    def discard(self):
+        """Drop a pending save, for an index that has been replaced by a newer build."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._dirty = False
+
+    def save(self):
+        with self._lock:
+            self._dirty = False
+            if self.index is None:
+                return
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            raw = self._faiss.serialize_index(self.index).tobytes()
+            # Per process: several workers may save the shared index at once
+            tmp = f'{self.index_path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp, self.index_path)
+            meta = {'model': MODEL_NAME, 'index_sha1': hashlib.sha1(raw).hexdigest(),
+                    'nodes': {n: [vid, self.hashes[n]] for n, vid in self.node_ids.items()}}
+            tmp = f'{self.meta_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, self.meta_path)
+
+
+_index = None
+# Graph _index was built for; until a rebuild for a new graph finishes, _index is still served
+_source = None
+# Graph a background build is running for (its latest version), and nodes changed in it meanwhile
+_building = None
+_build_id = 0
+_pending = set()
+# Earlier versions of _source / _building the store has replaced with a new one (see advance())
+_superseded = collections.deque(maxlen=SUPERSEDED_VERSIONS)
+_unavailable = False
+_lock = threading.Lock()
+
+
+def semantic_index(G):
+    """Vector index for G, or None when sentence-transformers/faiss are not installed.
+
+    Never waits for a build: a graph without an index yet (first load or reload) is indexed
+    in the background, and meanwhile the previous graph's index is served, or None at first.
+    """
+    if _unavailable or not ENABLED:
+        return None
+    if _source is G:
+        return _index
+    with _lock:
+        if (_source is not G and _building is not G and not any(G is s for s in _superseded)
+                and not _unavailable):
+            _start_build(G)
+        return _index
+
+
+def _start_build(G):
+    global _building, _build_id
+    _building = G
+    _build_id += 1
+    _pending.clear()
+    _superseded.clear()
+    threading.Thread(target=_build, args=(G, _build_id), daemon=True, name='vector-index-build').start()
+
+
+def _build(G, build_id):
+    global _index, _source, _building, _unavailable
+    try:
+        index = VillageVectorIndex().build(G)
+    except ImportError as e:
+        log.warning("Semantic search disabled: %s", e)
+        with _lock:
+            _unavailable = True
+            _building = None
+        return
+    except Exception as e:
+        log.error("Index build failed: %s: %s", type(e).__name__, e)
+        with _lock:
+            if _build_id == build_id:
+                _building = None
+        return
+    with _lock:
+        if _build_id != build_id:
+            # A newer graph was loaded while this one was being indexed
+            return
+        # The store may have published newer versions of G meanwhile; their changes are pending
+        G = _building
+        previous, _index, _source, _building = _index, index, G, None
+        pending = list(_pending)
+        _pending.clear()
+    if previous is not None:
+        previous.discard()
+    # Nodes that changed while the build was reading the graph
+    for node in pending:
+        upsert_node(G, node)
+
+
+def advance(old, new, nodes):
+    """Hand the index for old over to new, the store's next version of it, and re-embed nodes.
+
+    Encoding runs on a background thread, so the store's write lock is not held meanwhile.
+    """
+    global _source, _building
+    with _lock:
+        if _building is old:
+            _building = new
+            _superseded.append(old)
+            _pending.update(nodes)
+            return
+        if _source is not old:
+            return
+        _source = new
+        _superseded.append(old)
+    threading.Thread(target=_upsert_latest, args=(list(nodes),), daemon=True, name='vector-index-upsert').start()
+
+
+def _upsert_latest(nodes):
+    # Against the newest version: another may have been published since these nodes changed
+    for node in nodes:
+        upsert_node(_source, node)
+
+
+def semantic_search(G, query, k=5, min_score=MIN_SCORE):
+    index = semantic_index(G)
+    if index is None:
+        return []
+    # The index may still be the previous graph's while G is indexed
+    return [(n, s) for n, s in index.search(query, k=k, min_score=min_score) if n in G]
+
+
+def semantic_search_many(G, queries, k=5, min_score=MIN_SCORE):
+    index = semantic_index(G)
+    if index is None:
+        return [[] for _ in queries]
+    return [[(n, s) for n, s in hits if n in G] for hits in index.search_many(queries, k=k, min_score=min_score)]
+
+
+def upsert_node(G, node):
+    """Keep the vector index in step with a changed (or removed) graph node, once it is built for G."""
+    with _lock:
+        if _building is G:
+            _pending.add(node)
+            return
+        index = _index if _source is G else None
+    if index is None:
+        # Not built yet (or semantic search is off); the build will include the node
+        return
+    if node in G:
+        index.upsert(node, G.nodes[node])
+    else:
+        index.remove(node)
+
+
+def flush():
+    """Write the served index's unsaved changes, e.g. at shutdown."""
+    if _index is not None:
+        _index.flush()